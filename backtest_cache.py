@@ -0,0 +1,124 @@
+# --- Кэш результатов бэктеста ---
+# Ключ - sha256 от хеша исходника стратегии, её параметров, SL/TP, настроек бэктеста
+# (баланс, объём, комиссия, проскальзывание), версии backtest_engine и отпечатка данных
+# (источник, число строк, первое и последнее время). Если ничего из этого не изменилось,
+# метрики берутся из кэша без пересчёта сигналов и сделок.
+# Одна запись - один JSON-файл (пишется атомарно, воркеры optimizer.py могут писать
+# одновременно). Время изменения файла обновляется при чтении и служит часами LRU:
+# evict() удаляет самые давние записи сверх лимитов по числу и по размеру.
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+import backtest_engine
+
+BACKTEST_CACHE_DIR = os.getenv("BACKTEST_CACHE_DIR", os.path.join(os.getenv("STATE_DIR", "state"), "backtest_cache"))
+BACKTEST_CACHE_MAX_ENTRIES = int(os.getenv("BACKTEST_CACHE_MAX_ENTRIES", "20000"))
+BACKTEST_CACHE_MAX_MB = float(os.getenv("BACKTEST_CACHE_MAX_MB", "50"))
+
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# Изменение логики бэктеста делает недействительными все записи
+ENGINE_HASH = _file_hash(backtest_engine.__file__)
+
+
+def data_fingerprint(df: pd.DataFrame, source: str = "") -> dict:
+    """Отпечаток котировок: источник, число строк, первое и последнее время."""
+    if df.empty:
+        return {"source": source, "rows": 0, "first": None, "last": None}
+    return {"source": source,
+            "rows": len(df),
+            "first": pd.Timestamp(df.index.min()).isoformat(),
+            "last": pd.Timestamp(df.index.max()).isoformat()}
+
+
+def cache_key(source_hash: str,
+              params: dict,
+              stop_loss_pct: float,
+              take_profit_pct: float,
+              settings: dict,
+              fingerprint: dict) -> str:
+    payload = {
+        "strategy": source_hash,
+        "engine": ENGINE_HASH,
+        "params": params,
+        "stop_loss_pct": stop_loss_pct,
+        "take_profit_pct": take_profit_pct,
+        "settings": settings,
+        "data": fingerprint,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class BacktestCache:
+    def __init__(self,
+                 root: str = BACKTEST_CACHE_DIR,
+                 max_entries: int = BACKTEST_CACHE_MAX_ENTRIES,
+                 max_mb: float = BACKTEST_CACHE_MAX_MB):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> str:
+        # Подкаталоги по первым символам, чтобы не держать десятки тысяч файлов в одной папке
+        return os.path.join(self.root, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)   # отметка последнего использования для LRU
+        except (FileNotFoundError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key: str, value: dict):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(value, f, default=str)
+        os.replace(tmp_path, path)
+
+    def evict(self) -> int:
+        """Удаляет давно не использованные записи сверх лимитов. Возвращает число удалённых."""
+        if not os.path.isdir(self.root):
+            return 0
+        entries = []
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort(reverse=True)   # сначала свежие
+        removed = 0
+        total = 0
+        for count, (_, size, path) in enumerate(entries, start=1):
+            total += size
+            if count > self.max_entries or total > self.max_bytes:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def stats(self) -> str:
+        return f"попаданий {self.hits}, промахов {self.misses}"
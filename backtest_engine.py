@@ -0,0 +1,435 @@
+# --- Бэктест на массивах NumPy ---
+# Повторяет логику побарного цикла strategy_stat.backtest_strategy_loop, но не обходит
+# каждый бар: состояние меняется только на входах и выходах из позиции.
+#   * вход - на open бара, следующего за баром с сигналом;
+#   * в позиции сначала проверяются стоп-лосс (приоритетнее) и тейк-профит,
+#     затем разворот по противоположному сигналу на open;
+#   * после выхода на том же баре возможен новый вход по сигналу предыдущего бара;
+#   * незакрытая позиция закрывается по close последнего бара.
+# Индексы следующего сигнала считаются векторно один раз, первый бар касания SL/TP
+# ищется срезами массивов растущей длины.
+# Для перебора сетки SL/TP на одних сигналах - ExitIndex / sweep_sl_tp: касания всех
+# уровней находятся сразу для всех возможных входов по разреженным таблицам min/max.
+import numpy as np
+import pandas as pd
+
+REASONS = np.array(["stop_loss", "take_profit", "signal_reversal", "end_of_data"])
+STOP_LOSS, TAKE_PROFIT, SIGNAL_REVERSAL, END_OF_DATA = range(4)
+# Начальная длина окна поиска касания SL/TP (дальше удваивается)
+SEARCH_WINDOW = 32
+
+
+def next_index(mask: np.ndarray) -> np.ndarray:
+    """next[i] - наименьший j >= i, где mask[j]; len(mask), если такого нет. Длина len(mask) + 1."""
+    n = len(mask)
+    idx = np.where(mask, np.arange(n), n)
+    return np.append(np.minimum.accumulate(idx[::-1])[::-1], n)
+
+
+def first_hit(values: np.ndarray, start: int, stop: int, level: float, below: bool) -> int:
+    """Первый j в [start, stop), где values[j] <= level (below) или >= level; иначе stop."""
+    window = SEARCH_WINDOW
+    while start < stop:
+        end = min(start + window, stop)
+        segment = values[start:end]
+        hit = segment <= level if below else segment >= level
+        k = int(hit.argmax())
+        if hit[k]:
+            return start + k
+        start = end
+        window *= 2
+    return stop
+
+
+def resolve_exit(open_: np.ndarray,
+                 high: np.ndarray,
+                 low: np.ndarray,
+                 close: np.ndarray,
+                 i: int,
+                 side: int,
+                 reversal: int,
+                 stop_loss_pct: float,
+                 take_profit_pct: float) -> tuple:
+    """
+    Выход из позиции side, открытой на open бара i: (бар выхода, цена, код причины).
+    reversal - бар исполнения противоположного сигнала (len(open_), если его нет).
+    """
+    n = len(open_)
+    entry = open_[i]
+    if side == 1:
+        stop_price = entry * (1 - stop_loss_pct / 100.0)
+        tp_price = entry * (1 + take_profit_pct / 100.0)
+    else:
+        stop_price = entry * (1 + stop_loss_pct / 100.0)
+        tp_price = entry * (1 - take_profit_pct / 100.0)
+
+    # SL/TP проверяются раньше разворота, в том числе на баре разворота
+    limit = min(reversal, n - 1) + 1
+    if side == 1:
+        sl_idx = first_hit(low, i + 1, limit, stop_price, below=True)
+        # на одном баре со стопом тейк не проверяется
+        tp_idx = first_hit(high, i + 1, sl_idx, tp_price, below=False)
+    else:
+        sl_idx = first_hit(high, i + 1, limit, stop_price, below=False)
+        tp_idx = first_hit(low, i + 1, sl_idx, tp_price, below=True)
+
+    if tp_idx < sl_idx:
+        exit_price = max(tp_price, open_[tp_idx]) if side == 1 else min(tp_price, open_[tp_idx])
+        return tp_idx, exit_price, TAKE_PROFIT
+    if sl_idx < limit:
+        exit_price = max(stop_price, open_[sl_idx]) if side == 1 else min(stop_price, open_[sl_idx])
+        return sl_idx, exit_price, STOP_LOSS
+    if reversal < n:
+        return reversal, open_[reversal], SIGNAL_REVERSAL
+    return n - 1, close[n - 1], END_OF_DATA
+
+
+def simulate_trades(open_: np.ndarray,
+                    high: np.ndarray,
+                    low: np.ndarray,
+                    close: np.ndarray,
+                    signal: np.ndarray,
+                    stop_loss_pct: float,
+                    take_profit_pct: float,
+                    open_side: int = 0) -> dict:
+    """
+    Сделки по сигналам. Возвращает словарь массивов:
+    entry_idx, exit_idx, entry_price, exit_price, side, reason (код из REASONS).
+    open_side - позиция, уже открытая по цене open_[0] (продолжение прошлого прогона, см. backtest_state).
+    """
+    n = len(open_)
+    # Сигнал предыдущего бара исполняется на open текущего
+    prev_signal = np.zeros(n, dtype=np.int64)
+    prev_signal[1:] = signal[:-1]
+
+    next_entry = next_index(prev_signal != 0)
+    next_reversal = {1: next_index(prev_signal == -1), -1: next_index(prev_signal == 1)}
+
+    trades = {k: [] for k in ("entry_idx", "exit_idx", "entry_price", "exit_price", "side", "reason")}
+
+    i = next_entry[0] if n else n
+    if open_side and n:
+        i = 0
+    while i < n:
+        side = int(prev_signal[i]) or open_side
+        entry = open_[i]
+        exit_idx, exit_price, reason = resolve_exit(open_, high, low, close, i, side,
+                                                    next_reversal[side][i + 1],
+                                                    stop_loss_pct, take_profit_pct)
+
+        for key, value in (("entry_idx", i), ("exit_idx", exit_idx), ("entry_price", entry),
+                           ("exit_price", exit_price), ("side", side), ("reason", reason)):
+            trades[key].append(value)
+
+        if reason == END_OF_DATA:
+            break
+        # Новый вход возможен на том же баре, где закрылась позиция
+        i = next_entry[exit_idx]
+
+    return {
+        "entry_idx": np.array(trades["entry_idx"], dtype=np.int64),
+        "exit_idx": np.array(trades["exit_idx"], dtype=np.int64),
+        "entry_price": np.array(trades["entry_price"], dtype=np.float64),
+        "exit_price": np.array(trades["exit_price"], dtype=np.float64),
+        "side": np.array(trades["side"], dtype=np.int64),
+        "reason": np.array(trades["reason"], dtype=np.int64),
+    }
+
+
+def trade_pnl_pct(entry_price: np.ndarray,
+                  exit_price: np.ndarray,
+                  side: np.ndarray,
+                  trade_size: float = 1.0,
+                  commission_pct: float = 0.1,
+                  slippage_pct: float = 0.005) -> np.ndarray:
+    """PnL сделок в процентах с учётом проскальзывания и комиссии (как calc_pnl_fixed)."""
+    long = side == 1
+    entry_with_slippage = np.where(long, entry_price * (1 + slippage_pct / 100.0),
+                                   entry_price * (1 - slippage_pct / 100.0))
+    exit_with_slippage = np.where(long, exit_price * (1 - slippage_pct / 100.0),
+                                  exit_price * (1 + slippage_pct / 100.0))
+
+    commission_rate = commission_pct / 100.0
+    commission_entry = commission_rate * entry_with_slippage * trade_size
+    commission_exit = commission_rate * exit_with_slippage * trade_size
+    total_commission = commission_entry + commission_exit
+
+    gross_profit = np.where(long, (exit_with_slippage - entry_with_slippage) * trade_size,
+                            (entry_with_slippage - exit_with_slippage) * trade_size)
+    net_profit = gross_profit - total_commission
+
+    entry_cost = entry_with_slippage * trade_size
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(entry_cost != 0, (net_profit / entry_cost) * 100.0, 0.0)
+
+
+def trades_frame(df: pd.DataFrame,
+                 stop_loss_pct: float,
+                 take_profit_pct: float,
+                 trade_size: float = 1.0,
+                 commission_pct: float = 0.1,
+                 slippage_pct: float = 0.005) -> pd.DataFrame:
+    """Сделки по signal_df (колонки open/high/low/close/signal) в формате trades побарного цикла."""
+    signal = df["signal"].fillna(0).to_numpy(dtype=np.int64)
+    trades = simulate_trades(df["open"].to_numpy(dtype=np.float64),
+                             df["high"].to_numpy(dtype=np.float64),
+                             df["low"].to_numpy(dtype=np.float64),
+                             df["close"].to_numpy(dtype=np.float64),
+                             signal, stop_loss_pct, take_profit_pct)
+    pnl = trade_pnl_pct(trades["entry_price"], trades["exit_price"], trades["side"],
+                        trade_size, commission_pct, slippage_pct)
+    return pd.DataFrame({
+        "entry_idx": trades["entry_idx"],
+        "exit_idx": trades["exit_idx"],
+        "entry_price": trades["entry_price"],
+        "exit_price": trades["exit_price"],
+        "side": trades["side"],
+        "pnl_pct": pnl,
+        "reason": REASONS[trades["reason"]],
+        "duration_bars": trades["exit_idx"] - trades["entry_idx"],
+    })
+
+
+def trade_metrics(trades_df: pd.DataFrame, initial_balance: float = 10000.0) -> dict:
+    """Метрики бэктеста по сделкам (общие для побарного цикла и движка на массивах)."""
+    if trades_df.empty:
+        return {
+            "total_return": 0.0,
+            "win_rate": 0.0,
+            "total_trades": 0,
+            "avg_trade": 0.0,
+            "sharpe_ratio": 0.0,
+            "max_drawdown": 0.0,
+            "profit_factor": 0.0,
+            "trades_df": pd.DataFrame(),
+            "equity_curve": pd.Series([initial_balance]),
+        }
+
+    # Считается на массиве NumPy: те же суммы (попарное суммирование), что и у pandas,
+    # без накладных расходов Series - важно при переборе многих пар SL/TP
+    pnl = trades_df["pnl_pct"].to_numpy(dtype=np.float64)
+
+    # 1. Общая доходность
+    total_return = pnl.sum()
+
+    # 2. Win rate
+    win_rate = (pnl > 0).mean() * 100.0
+
+    # 3. Средняя сделка
+    avg_trade = pnl.mean()
+
+    # 4. Profit Factor
+    gross_profits = pnl[pnl > 0].sum()
+    gross_losses = abs(pnl[pnl < 0].sum())
+    profit_factor = gross_profits / gross_losses if gross_losses != 0 else np.inf
+
+    # 5. Кривая капитала и просадка (последовательное умножение, как в цикле по сделкам)
+    equity = np.multiply.accumulate(np.concatenate(([initial_balance], 1 + pnl / 100.0)))
+    rolling_max = np.maximum.accumulate(equity)
+    drawdowns = (equity - rolling_max) / rolling_max * 100
+    max_drawdown = drawdowns.min()
+
+    # 6. Sharpe Ratio (упрощенный)
+    if len(pnl) > 1:
+        # Предполагаем, что сделки распределены равномерно
+        returns_mean = avg_trade
+        returns_std = trades_df["pnl_pct"].std()
+        sharpe = (returns_mean / returns_std) * np.sqrt(252) if returns_std != 0 else 0
+    else:
+        sharpe = 0.0
+
+    return {
+        "total_return": round(total_return, 2),
+        "win_rate": round(win_rate, 1),
+        "total_trades": len(pnl),
+        "avg_trade": round(avg_trade, 2),
+        "sharpe_ratio": round(sharpe, 2),
+        "max_drawdown": round(max_drawdown, 2),
+        "profit_factor": round(profit_factor, 2) if profit_factor != np.inf else float('inf'),
+        # "trades_df": trades_df,
+        # "equity_curve": pd.Series(equity),
+    }
+
+
+def _sparse_table(values: np.ndarray, func) -> list:
+    """table[k][p] = func(values[p : p + 2**k]) для всех p, где отрезок помещается в массив."""
+    table = [values]
+    width = 1
+    while 2 * width <= len(values):
+        previous = table[-1]
+        table.append(func(previous[:-width], previous[width:]))
+        width *= 2
+    return table
+
+
+class ExitIndex:
+    """
+    Структура для перебора многих пар SL/TP на одном наборе сигналов.
+
+    Строится один раз: возможные входы (бары после ненулевого сигнала), бар разворота
+    для каждого входа и разреженные таблицы минимумов low / максимумов high.
+    Первый бар касания уровня ищется двоичным подъёмом по таблице сразу для всех
+    входов и всех уровней SL (или TP) - O(log n) операций над массивами.
+    Для пары SL/TP остаётся пройти цепочку вход -> выход -> следующий вход.
+    Результат совпадает с simulate_trades.
+    """
+
+    def __init__(self, open_: np.ndarray, high: np.ndarray, low: np.ndarray,
+                 close: np.ndarray, signal: np.ndarray):
+        self.open = open_
+        self.close = close
+        self.n = n = len(open_)
+
+        prev_signal = np.zeros(n, dtype=np.int64)
+        prev_signal[1:] = signal[:-1]
+        self.next_entry = next_index(prev_signal != 0)
+
+        # Возможные входы и границы поиска SL/TP для каждого из них
+        self.entries = np.flatnonzero(prev_signal != 0)
+        self.side = prev_signal[self.entries]
+        self.entry_price = open_[self.entries]
+        next_short, next_long = next_index(prev_signal == -1), next_index(prev_signal == 1)
+        self.reversal = np.where(self.side == 1, next_short[self.entries + 1], next_long[self.entries + 1])
+        self.limit = np.minimum(self.reversal, n - 1) + 1
+        # Номер входа по номеру бара
+        self.entry_pos = np.full(n, -1, dtype=np.int64)
+        self.entry_pos[self.entries] = np.arange(len(self.entries))
+
+        self.low_min = _sparse_table(low, np.minimum)
+        self.high_max = _sparse_table(high, np.maximum)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "ExitIndex":
+        return cls(df["open"].to_numpy(dtype=np.float64),
+                   df["high"].to_numpy(dtype=np.float64),
+                   df["low"].to_numpy(dtype=np.float64),
+                   df["close"].to_numpy(dtype=np.float64),
+                   df["signal"].fillna(0).to_numpy(dtype=np.int64))
+
+    def _first_hit(self, table: list, level: np.ndarray, below: bool) -> np.ndarray:
+        """
+        Первый бар в [entry + 1, limit), где low <= level (below) или high >= level;
+        limit, если касания нет. level - массив (входы x уровни).
+        """
+        start = np.broadcast_to((self.entries + 1)[:, None], level.shape)
+        limit = np.broadcast_to(self.limit[:, None], level.shape)
+        pos = start.copy()
+        # Сдвигаем pos, пока весь отрезок [pos, pos + 2**k) не касается уровня
+        for k in range(len(table) - 1, -1, -1):
+            width = 1 << k
+            can_jump = pos + width <= limit
+            idx = np.where(can_jump, pos, 0)
+            extreme = table[k][idx]
+            no_hit = extreme > level if below else extreme < level
+            pos = np.where(can_jump & no_hit, pos + width, pos)
+        return pos
+
+    def level_hits(self, stop_loss_pcts, take_profit_pcts) -> tuple:
+        """
+        Цены и бары касания для всех входов и уровней: (stop_price, sl_idx, tp_price, tp_idx),
+        массивы формы (входы x уровни SL) и (входы x уровни TP).
+        """
+        long = (self.side == 1)[:, None]
+        entry = self.entry_price[:, None]
+        sl = np.asarray(stop_loss_pcts, dtype=np.float64)[None, :]
+        tp = np.asarray(take_profit_pcts, dtype=np.float64)[None, :]
+
+        stop_price = np.where(long, entry * (1 - sl / 100.0), entry * (1 + sl / 100.0))
+        tp_price = np.where(long, entry * (1 + tp / 100.0), entry * (1 - tp / 100.0))
+
+        sl_idx = np.where(long, self._first_hit(self.low_min, stop_price, below=True),
+                          self._first_hit(self.high_max, stop_price, below=False))
+        tp_idx = np.where(long, self._first_hit(self.high_max, tp_price, below=False),
+                          self._first_hit(self.low_min, tp_price, below=True))
+        return stop_price, sl_idx, tp_price, tp_idx
+
+    def resolve(self, stop_price: np.ndarray, sl_idx: np.ndarray,
+                tp_price: np.ndarray, tp_idx: np.ndarray) -> dict:
+        """Сделки для одной пары SL/TP по барам касания всех входов (одномерные массивы)."""
+        n = self.n
+        long = self.side == 1
+        is_tp = tp_idx < sl_idx
+        is_sl = ~is_tp & (sl_idx < self.limit)
+        is_reversal = ~is_tp & ~is_sl & (self.reversal < n)
+
+        exit_idx = np.where(is_tp, tp_idx, np.where(is_sl, sl_idx, np.where(is_reversal, self.reversal, n - 1)))
+        reason = np.where(is_tp, TAKE_PROFIT, np.where(is_sl, STOP_LOSS,
+                                                        np.where(is_reversal, SIGNAL_REVERSAL, END_OF_DATA)))
+        exit_open = self.open[np.minimum(exit_idx, n - 1)]
+        level = np.where(is_tp, tp_price, stop_price)
+        exit_price = np.where(is_tp | is_sl,
+                              np.where(long, np.maximum(level, exit_open), np.minimum(level, exit_open)),
+                              np.where(is_reversal, exit_open, self.close[n - 1] if n else np.nan))
+
+        # Цепочка вход -> выход -> следующий вход (на баре выхода или позже):
+        # следующий вход для каждого входа считается векторно, обход - по списку
+        next_bar = self.next_entry[exit_idx]
+        successor = np.where((reason == END_OF_DATA) | (next_bar >= n), -1,
+                             self.entry_pos[np.minimum(next_bar, n - 1)]).tolist()
+        chain = []
+        k = 0 if len(self.entries) else -1
+        while k != -1:
+            chain.append(k)
+            k = successor[k]
+        chain = np.array(chain, dtype=np.int64)
+
+        return {
+            "entry_idx": self.entries[chain],
+            "exit_idx": exit_idx[chain],
+            "entry_price": self.entry_price[chain],
+            "exit_price": exit_price[chain],
+            "side": self.side[chain],
+            "reason": reason[chain],
+        }
+
+    def trades(self, stop_loss_pct: float, take_profit_pct: float) -> dict:
+        stop_price, sl_idx, tp_price, tp_idx = self.level_hits([stop_loss_pct], [take_profit_pct])
+        return self.resolve(stop_price[:, 0], sl_idx[:, 0], tp_price[:, 0], tp_idx[:, 0])
+
+
+def sweep_sl_tp(df: pd.DataFrame,
+                pairs: list,
+                initial_balance: float = 10000.0,
+                trade_size: float = 1.0,
+                commission_pct: float = 0.1,
+                slippage_pct: float = 0.005) -> dict:
+    """
+    Метрики run_backtest для многих пар (stop_loss_pct, take_profit_pct) на одном signal_df.
+    Касания уровней считаются один раз для всех уровней SL и TP (ExitIndex).
+    Возвращает {(stop_loss_pct, take_profit_pct): метрики}.
+    """
+    index = ExitIndex.from_frame(df)
+    sl_levels = sorted({sl for sl, _ in pairs})
+    tp_levels = sorted({tp for _, tp in pairs})
+    stop_price, sl_idx, tp_price, tp_idx = index.level_hits(sl_levels, tp_levels)
+    sl_col = {sl: k for k, sl in enumerate(sl_levels)}
+    tp_col = {tp: k for k, tp in enumerate(tp_levels)}
+
+    results = {}
+    for stop_loss_pct, take_profit_pct in pairs:
+        a, b = sl_col[stop_loss_pct], tp_col[take_profit_pct]
+        trades = index.resolve(stop_price[:, a], sl_idx[:, a], tp_price[:, b], tp_idx[:, b])
+        pnl = trade_pnl_pct(trades["entry_price"], trades["exit_price"], trades["side"],
+                            trade_size, commission_pct, slippage_pct)
+        trades_df = pd.DataFrame({"pnl_pct": pnl})
+        results[(stop_loss_pct, take_profit_pct)] = trade_metrics(trades_df, initial_balance)
+    return results
+
+
+def run_backtest(df: pd.DataFrame,
+                 stop_loss_pct: float,
+                 take_profit_pct: float,
+                 initial_balance: float = 10000.0,
+                 trade_size: float = 1.0,
+                 commission_pct: float = 0.1,
+                 slippage_pct: float = 0.005,
+                 return_trades: bool = False) -> dict:
+    """
+    Бэктест signal_df: те же сделки и метрики, что и у strategy_stat.backtest_strategy_loop.
+    return_trades - добавить в результат сделки (trades_df), например для monte_carlo.py.
+    """
+    trades_df = trades_frame(df, stop_loss_pct, take_profit_pct, trade_size, commission_pct, slippage_pct)
+    result = trade_metrics(trades_df, initial_balance)
+    if return_trades:
+        result["trades_df"] = trades_df
+    return result
@@ -0,0 +1,237 @@
+# --- Инкрементальный бэктест: состояние между запусками ---
+# Еженедельный strategy_stat.py не пересчитывает сделки с первого бара: после прогона
+# в JSON сохраняется конец бэктеста - открытая позиция (сторона, цена входа, стоп и тейк),
+# сигнал последнего бара, время последнего обработанного бара и накопители метрик
+# (число сделок, суммы, среднее и дисперсия PnL по Уэлфорду, капитал, пик и просадка),
+# а также PnL закрытых сделок (для monte_carlo.py).
+# Следующий прогон считает сигналы и сделки только по барам после этого времени
+# (сигналы - на окне LOOKBACK стратегии, как в runner.py) и продолжает с сохранённой позиции.
+# Полный пересчёт - если изменились файл стратегии, параметры, SL/TP, настройки бэктеста
+# или backtest_engine.py, либо история котировок (нет последнего бара, другой первый бар).
+# Незакрытая позиция в отчёте закрывается по close последнего бара, как в полном бэктесте,
+# но в накопители не попадает - в следующий раз она продолжится.
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from backtest_engine import END_OF_DATA, simulate_trades, trade_pnl_pct
+from backtest_cache import cache_key
+
+BACKTEST_STATE_DIR = os.getenv("BACKTEST_STATE_DIR", os.path.join(os.getenv("STATE_DIR", "state"), "backtest_state"))
+# Запас баров сверх заявленного стратегией окна (как LOOKBACK_MARGIN в runner.py)
+LOOKBACK_MARGIN = 10
+
+
+def _empty_accumulators(initial_balance: float) -> dict:
+    return {
+        "count": 0,
+        "wins": 0,
+        "total": 0.0,           # сумма PnL, %
+        "gross_profit": 0.0,
+        "gross_loss": 0.0,
+        "mean": 0.0,            # среднее и сумма квадратов отклонений (Уэлфорд)
+        "m2": 0.0,
+        "equity": initial_balance,
+        "peak": initial_balance,
+        "max_drawdown": 0.0,
+    }
+
+
+def accumulate(acc: dict, pnl: np.ndarray) -> dict:
+    """Добавляет PnL закрытых сделок (в порядке закрытия) к накопителям метрик."""
+    acc = dict(acc)
+    for value in pnl.tolist():
+        acc["count"] += 1
+        acc["wins"] += value > 0
+        acc["total"] += value
+        if value > 0:
+            acc["gross_profit"] += value
+        elif value < 0:
+            acc["gross_loss"] += value
+        delta = value - acc["mean"]
+        acc["mean"] += delta / acc["count"]
+        acc["m2"] += delta * (value - acc["mean"])
+        acc["equity"] *= 1 + value / 100.0
+        acc["peak"] = max(acc["peak"], acc["equity"])
+        acc["max_drawdown"] = min(acc["max_drawdown"], (acc["equity"] - acc["peak"]) / acc["peak"] * 100)
+    return acc
+
+
+def accumulated_metrics(acc: dict) -> dict:
+    """Метрики в формате backtest_engine.trade_metrics по накопителям."""
+    count = acc["count"]
+    if count == 0:
+        return {"total_return": 0.0, "win_rate": 0.0, "total_trades": 0, "avg_trade": 0.0,
+                "sharpe_ratio": 0.0, "max_drawdown": 0.0, "profit_factor": 0.0}
+
+    gross_loss = abs(acc["gross_loss"])
+    profit_factor = acc["gross_profit"] / gross_loss if gross_loss != 0 else np.inf
+    sharpe = 0.0
+    if count > 1:
+        std = (acc["m2"] / (count - 1)) ** 0.5
+        sharpe = (acc["mean"] / std) * np.sqrt(252) if std != 0 else 0
+    return {
+        "total_return": round(acc["total"], 2),
+        "win_rate": round(acc["wins"] / count * 100.0, 1),
+        "total_trades": count,
+        "avg_trade": round(acc["mean"], 2),
+        "sharpe_ratio": round(sharpe, 2),
+        "max_drawdown": round(acc["max_drawdown"], 2),
+        "profit_factor": round(profit_factor, 2) if profit_factor != np.inf else float('inf'),
+    }
+
+
+class BacktestState:
+    """
+    Конец бэктеста стратегии на момент last_timestamp.
+    signature - ключ стратегии, параметров, SL/TP и настроек: при его изменении бэктест пересчитывается.
+    """
+
+    def __init__(self, signature: str, initial_balance: float, first_timestamp: pd.Timestamp = None,
+                 last_timestamp: pd.Timestamp = None, last_signal: int = 0,
+                 position: dict = None, accumulators: dict = None, pnl: list = None):
+        self.signature = signature
+        self.first_timestamp = first_timestamp
+        self.last_timestamp = last_timestamp
+        self.last_signal = last_signal
+        self.position = position
+        self.accumulators = accumulators or _empty_accumulators(initial_balance)
+        self.pnl = pnl or []   # PnL закрытых сделок, %
+
+    def save(self, path: str):
+        data = {
+            "signature": self.signature,
+            "first_timestamp": None if self.first_timestamp is None else self.first_timestamp.isoformat(),
+            "last_timestamp": None if self.last_timestamp is None else self.last_timestamp.isoformat(),
+            "last_signal": self.last_signal,
+            "position": self.position,
+            "accumulators": self.accumulators,
+            "pnl": self.pnl,
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(
+            signature=data["signature"],
+            initial_balance=None,
+            first_timestamp=pd.Timestamp(data["first_timestamp"]) if data["first_timestamp"] else None,
+            last_timestamp=pd.Timestamp(data["last_timestamp"]) if data["last_timestamp"] else None,
+            last_signal=data["last_signal"],
+            position=data["position"],
+            accumulators=data["accumulators"],
+            pnl=data.get("pnl"),
+        )
+
+
+def run_incremental(info,
+                    data: pd.DataFrame,
+                    stop_loss_pct: float,
+                    take_profit_pct: float,
+                    settings: dict,
+                    state_path: str,
+                    params: dict = None,
+                    source: str = "") -> tuple:
+    """
+    Бэктест стратегии info (StrategyInfo реестра) с продолжением с сохранённого состояния.
+    settings - initial_balance, trade_size, commission_pct, slippage_pct (как BACKTEST_SETTINGS).
+    Возвращает (метрики, дата начала, дата конца, число обработанных баров,
+    PnL всех сделок в % - с незакрытой позицией, как trades_df полного бэктеста).
+    """
+    params = params or {}
+    signature = cache_key(info.source_hash, params, stop_loss_pct, take_profit_pct, settings, {"source": source})
+
+    state = None
+    if os.path.exists(state_path):
+        state = BacktestState.load(state_path)
+        if (state.signature != signature or state.last_timestamp not in data.index
+                or state.first_timestamp != data.index[0]
+                or len(state.pnl) != state.accumulators["count"]):
+            print(f"{info.name}: состояние бэктеста устарело, полный пересчёт")
+            state = None
+
+    if state is None:
+        state = BacktestState(signature, settings["initial_balance"], first_timestamp=data.index[0])
+        start = 0
+    else:
+        start = data.index.get_loc(state.last_timestamp) + 1
+
+    # Сигналы новых баров - на окне LOOKBACK перед ними (без LOOKBACK - на всей истории)
+    signal_df = data.iloc[:0]
+    if start < len(data):
+        window_start = 0
+        if start and info.lookback is not None:
+            window_start = max(0, start - info.lookback - LOOKBACK_MARGIN)
+        signal_df = info.module.trading_strategy(data.iloc[window_start:], **params)
+        if state.last_timestamp is not None:
+            signal_df = signal_df[signal_df.index > state.last_timestamp]
+
+    open_pnl = None
+    if not signal_df.empty:
+        open_, high, low, close = (signal_df[c].to_numpy(dtype=np.float64) for c in ("open", "high", "low", "close"))
+        signal = signal_df["signal"].fillna(0).to_numpy(dtype=np.int64)
+        offset = 0
+        open_side = 0
+        if start:
+            # Бар 0 - последний обработанный: по его сигналу возможен вход на первом новом баре,
+            # открытая позиция продолжается с ценой входа на его open
+            last = data.loc[state.last_timestamp]
+            entry_price = state.position["entry_price"] if state.position else last["open"]
+            open_ = np.concatenate(([entry_price], open_))
+            high = np.concatenate(([last["high"]], high))
+            low = np.concatenate(([last["low"]], low))
+            close = np.concatenate(([last["close"]], close))
+            signal = np.concatenate(([state.last_signal], signal))
+            offset = 1
+            open_side = state.position["side"] if state.position else 0
+
+        trades = simulate_trades(open_, high, low, close, signal, stop_loss_pct, take_profit_pct, open_side=open_side)
+        pnl = trade_pnl_pct(trades["entry_price"], trades["exit_price"], trades["side"],
+                            settings["trade_size"], settings["commission_pct"], settings["slippage_pct"])
+
+        position = None
+        closed = len(pnl)
+        if closed and trades["reason"][-1] == END_OF_DATA:
+            # Позиция не закрыта: в отчёте - по close последнего бара, в состоянии - открытой
+            closed -= 1
+            open_pnl = pnl[-1]
+            entry_idx = int(trades["entry_idx"][-1])
+            side = int(trades["side"][-1])
+            entry_price = float(trades["entry_price"][-1])
+            entry_time = (state.position["entry_time"] if offset and entry_idx == 0
+                          else signal_df.index[entry_idx - offset].isoformat())
+            position = {
+                "side": side,
+                "entry_time": entry_time,
+                "entry_price": entry_price,
+                "stop_price": entry_price * (1 - side * stop_loss_pct / 100.0),
+                "take_profit_price": entry_price * (1 + side * take_profit_pct / 100.0),
+            }
+
+        state.accumulators = accumulate(state.accumulators, pnl[:closed])
+        state.pnl.extend(pnl[:closed].tolist())
+        state.position = position
+        state.last_signal = int(signal[-1])
+        state.last_timestamp = signal_df.index[-1]
+        state.save(state_path)
+    elif state.position is not None:
+        # Новых баров нет: открытая позиция, как и в прошлый раз, закрывается по последнему close
+        last = data.loc[state.last_timestamp]
+        open_pnl = trade_pnl_pct(np.array([state.position["entry_price"]]), np.array([last["close"]]),
+                                 np.array([state.position["side"]]), settings["trade_size"],
+                                 settings["commission_pct"], settings["slippage_pct"])[0]
+
+    acc = state.accumulators
+    pnl = np.array(state.pnl, dtype=np.float64)
+    if open_pnl is not None:
+        acc = accumulate(acc, np.array([open_pnl]))
+        pnl = np.append(pnl, open_pnl)
+    return accumulated_metrics(acc), state.first_timestamp, state.last_timestamp, len(signal_df), pnl
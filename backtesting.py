@@ -1,16 +1,17 @@
 # --- Бэктестинг ---
 import pandas as pd
-import importlib.util
+from strategy_registry import StrategyRegistry
+
+# Модули стратегий кэшируются между вызовами и перечитываются только при изменении файла
+REGISTRY = StrategyRegistry()
 
 def backtest_strategy(strategy_path: str, df: pd.DataFrame) -> pd.DataFrame:
   """
   Загружает стратегию, прогоняет её по df, возвращает df с колонкой 'signal'.
   signal: 1 = buy, -1 = sell, 0 = no signal
   """
-  # Загружаем стратегию из файла
-  spec = importlib.util.spec_from_file_location("strategy", strategy_path)
-  strategy = importlib.util.module_from_spec(spec)
-  spec.loader.exec_module(strategy)
+  # Загружаем стратегию из файла (из кэша реестра)
+  strategy = REGISTRY.load(strategy_path).module
   
   # Получаем сигналы от стратегии
   df_with_signals = strategy.trading_strategy(df)
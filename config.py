@@ -1 +1,16 @@
-# ToDo перенести сюда переменные подключений
+# --- Общие настройки подключения к БД ---
+import os
+
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT")
+DB_NAME = os.getenv("DB_NAME")
+DB_USER = os.getenv("DB_USER")
+DB_PASS = os.getenv("DB_PASS")
+
+# Пул соединений (db.py): постоянные соединения и сколько можно открыть сверх них
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+# Соединения старше этого возраста (секунды) переоткрываются
+DB_POOL_RECYCLE_SEC = int(os.getenv("DB_POOL_RECYCLE_SEC", "1800"))
+# Сколько ждать свободное соединение из пула (секунды)
+DB_POOL_TIMEOUT_SEC = int(os.getenv("DB_POOL_TIMEOUT_SEC", "30"))
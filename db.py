@@ -0,0 +1,119 @@
+# --- Доступ к Postgres: общий пул соединений процесса ---
+# Все модули берут соединения из одного пула SQLAlchemy:
+#   get_engine()          - engine для pd.read_sql / to_sql;
+#   pooled_connection()   - «сырое» соединение psycopg2 из того же пула (COPY, курсоры);
+#   connect()             - отдельное соединение вне пула (LISTEN, сессии с временными таблицами);
+#   get_async_pool()      - пул asyncpg, если он установлен.
+# Перед выдачей соединение проверяется (pool_pre_ping), поэтому обрыв связи с БД
+# между циклами демона не приводит к ошибке первого запроса.
+import os
+import threading
+from contextlib import contextmanager
+
+import psycopg2
+from sqlalchemy import create_engine
+
+import config
+
+try:
+    import asyncpg
+except ImportError:  # async-доступ необязателен
+    asyncpg = None
+
+_engine = None
+_engine_lock = threading.Lock()
+_async_pool = None
+
+
+def _dsn_params() -> dict:
+    return {
+        "host": config.DB_HOST,
+        "port": config.DB_PORT,
+        "dbname": config.DB_NAME,
+        "user": config.DB_USER,
+        "password": config.DB_PASS,
+    }
+
+
+def get_engine():
+    """Engine процесса с пулом соединений (создаётся при первом обращении)."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = create_engine(
+                "postgresql+psycopg2://",
+                connect_args={k: v for k, v in _dsn_params().items() if v is not None},
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_MAX_OVERFLOW,
+                pool_recycle=config.DB_POOL_RECYCLE_SEC,
+                pool_timeout=config.DB_POOL_TIMEOUT_SEC,
+                pool_pre_ping=True,
+            )
+        return _engine
+
+
+@contextmanager
+def pooled_connection():
+    """
+    Соединение psycopg2 из пула на время блока with.
+    При выходе без ошибки выполняется commit, при исключении - rollback;
+    соединение возвращается в пул.
+    """
+    conn = get_engine().raw_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def connect(autocommit: bool = False, **overrides):
+    """
+    Отдельное соединение вне пула - для LISTEN и долгих сессий с временными таблицами.
+    overrides - параметры psycopg2.connect вместо значений из config.py (None игнорируются).
+    """
+    params = _dsn_params()
+    params.update({k: v for k, v in overrides.items() if v is not None})
+    conn = psycopg2.connect(**params)
+    conn.autocommit = autocommit
+    return conn
+
+
+def dispose():
+    """Закрыть все соединения пула (при завершении процесса)."""
+    if _engine is not None:
+        _engine.dispose()
+
+
+def _reset_after_fork():
+    # Соединения пула, унаследованные от родителя, в дочернем процессе использовать нельзя:
+    # забываем их (не закрывая - они принадлежат родителю), пул наполнится заново
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+async def get_async_pool():
+    """Пул asyncpg того же размера (создаётся при первом обращении)."""
+    global _async_pool
+    if asyncpg is None:
+        raise RuntimeError("Для async-доступа нужен asyncpg (pip install asyncpg)")
+    if _async_pool is None:
+        params = _dsn_params()
+        _async_pool = await asyncpg.create_pool(
+            host=params["host"],
+            port=params["port"],
+            database=params["dbname"],
+            user=params["user"],
+            password=params["password"],
+            min_size=1,
+            max_size=config.DB_POOL_SIZE + config.DB_MAX_OVERFLOW,
+            max_inactive_connection_lifetime=config.DB_POOL_RECYCLE_SEC,
+        )
+    return _async_pool
@@ -0,0 +1,279 @@
+# --- Инкрементальные (online) индикаторы ---
+# Каждый индикатор обновляется за O(1) на новый бар и хранит своё состояние,
+# которое можно сохранить между запусками runner.py.
+# Арифметика повторяет реализацию pandas (rolling().mean(), ewm(adjust=False).mean(),
+# rolling().max()/min(), shift()), поэтому на одном и том же ряде результаты совпадают.
+import json
+import math
+import os
+from abc import ABC, abstractmethod
+from collections import deque
+
+import pandas as pd
+
+NAN = float("nan")
+
+
+class SMA:
+    """Скользящее среднее, аналог series.rolling(window).mean()."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values = deque()
+        self.nobs = 0
+        self.sum_x = 0.0
+        self.neg_ct = 0
+        self.compensation_add = 0.0
+        self.compensation_remove = 0.0
+        self.num_consecutive_same_value = 0
+        self.prev_value = NAN
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        # Сначала удаляем выпавшее из окна значение, затем добавляем новое - как в pandas
+        if len(self.values) == self.window:
+            self._remove(self.values.popleft())
+        self.values.append(x)
+        self._add(x)
+        self.value = self._mean()
+        return self.value
+
+    def _add(self, x: float):
+        if x == x:
+            self.nobs += 1
+            y = x - self.compensation_add
+            t = self.sum_x + y
+            self.compensation_add = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, x) < 0:
+                self.neg_ct += 1
+            if x == self.prev_value:
+                self.num_consecutive_same_value += 1
+            else:
+                self.num_consecutive_same_value = 1
+            self.prev_value = x
+
+    def _remove(self, x: float):
+        if x == x:
+            self.nobs -= 1
+            y = -x - self.compensation_remove
+            t = self.sum_x + y
+            self.compensation_remove = t - self.sum_x - y
+            self.sum_x = t
+            if math.copysign(1.0, x) < 0:
+                self.neg_ct -= 1
+
+    def _mean(self) -> float:
+        if self.nobs < self.window or self.nobs == 0:
+            return NAN
+        result = self.sum_x / self.nobs
+        if self.num_consecutive_same_value >= self.nobs:
+            result = self.prev_value
+        elif self.neg_ct == 0 and result < 0:
+            result = 0.0
+        elif self.neg_ct == self.nobs and result > 0:
+            result = 0.0
+        return result
+
+
+class EMA:
+    """Экспоненциальное среднее, аналог series.ewm(span=span, adjust=False).mean()."""
+
+    def __init__(self, span: float):
+        self.span = span
+        com = (span - 1) / 2
+        self.alpha = 1.0 / (1.0 + com)
+        self.old_wt = 1.0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if self.value != self.value:
+            # Первое наблюдение (или только NaN до него)
+            self.value = x
+            self.old_wt = 1.0
+        else:
+            # Пропуски (NaN) не сбрасывают вес истории, а продолжают его уменьшать
+            self.old_wt *= 1.0 - self.alpha
+            if x == x:
+                if self.value != x:
+                    self.value = (self.old_wt * self.value + self.alpha * x) / (self.old_wt + self.alpha)
+                self.old_wt = 1.0
+        return self.value
+
+
+class _RollingExtremum(ABC):
+    """Монотонная очередь: амортизированно O(1) на бар. Наследник задаёт _dominates."""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.count = 0
+        self.candidates = deque()   # пары (номер бара, значение)
+        self.nobs = deque()         # номера баров с не-NaN значениями в окне
+        self.value = NAN
+
+    @abstractmethod
+    def _dominates(self, new: float, old: float) -> bool:
+        """True, если новое значение вытесняет из очереди более старое."""
+
+    def update(self, x: float) -> float:
+        i = self.count
+        self.count += 1
+        oldest = i - self.window + 1
+
+        if x == x:
+            while self.candidates and self._dominates(x, self.candidates[-1][1]):
+                self.candidates.pop()
+            self.candidates.append((i, x))
+            self.nobs.append(i)
+        while self.candidates and self.candidates[0][0] < oldest:
+            self.candidates.popleft()
+        while self.nobs and self.nobs[0] < oldest:
+            self.nobs.popleft()
+
+        full = len(self.nobs) >= self.window
+        self.value = self.candidates[0][1] if full and self.candidates else NAN
+        return self.value
+
+
+class RollingMax(_RollingExtremum):
+    """Аналог series.rolling(window).max()."""
+
+    def _dominates(self, new: float, old: float) -> bool:
+        return new >= old
+
+
+class RollingMin(_RollingExtremum):
+    """Аналог series.rolling(window).min()."""
+
+    def _dominates(self, new: float, old: float) -> bool:
+        return new <= old
+
+
+class Shift:
+    """
+    Сдвиг ряда, аналог series.shift(periods).
+    update() возвращает значение periods баров назад, lag(k) - значение k баров назад.
+    """
+
+    def __init__(self, periods: int):
+        self.periods = periods
+        self.values = deque(maxlen=periods + 1)
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        self.values.append(x)
+        self.value = self.lag(self.periods)
+        return self.value
+
+    def lag(self, k: int) -> float:
+        if k > self.periods:
+            raise ValueError(f"lag({k}) больше глубины сдвига {self.periods}")
+        if k >= len(self.values):
+            return NAN
+        return self.values[-1 - k]
+
+
+INDICATOR_TYPES = {cls.__name__: cls for cls in (SMA, EMA, RollingMax, RollingMin, Shift)}
+
+
+# ============================================================
+# Состояние индикаторов стратегии и его хранение
+# ============================================================
+def _dump_indicator(indicator) -> dict:
+    state = {}
+    for key, value in vars(indicator).items():
+        if isinstance(value, deque):
+            value = {"deque": [list(v) if isinstance(v, tuple) else v for v in value],
+                     "maxlen": value.maxlen}
+        state[key] = value
+    return {"type": type(indicator).__name__, "state": state}
+
+
+def _load_indicator(data: dict):
+    indicator = INDICATOR_TYPES[data["type"]].__new__(INDICATOR_TYPES[data["type"]])
+    for key, value in data["state"].items():
+        if isinstance(value, dict) and "deque" in value:
+            value = deque([tuple(v) if isinstance(v, list) else v for v in value["deque"]],
+                          maxlen=value["maxlen"])
+        setattr(indicator, key, value)
+    return indicator
+
+
+class IndicatorState:
+    """
+    Набор индикаторов одной стратегии + отметка последнего обработанного бара.
+    source_hash - хеш файла стратегии: при его изменении состояние пересчитывается.
+    """
+
+    def __init__(self, indicators: dict, source_hash: str = None,
+                 last_timestamp: pd.Timestamp = None, last_row: dict = None):
+        self.indicators = indicators
+        self.source_hash = source_hash
+        self.last_timestamp = last_timestamp
+        self.last_row = last_row
+
+    def __getitem__(self, name):
+        return self.indicators[name]
+
+    def save(self, path: str):
+        data = {
+            "source_hash": self.source_hash,
+            "last_timestamp": None if self.last_timestamp is None else self.last_timestamp.isoformat(),
+            "last_row": self.last_row,
+            "indicators": {name: _dump_indicator(ind) for name, ind in self.indicators.items()},
+        }
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path) as f:
+            data = json.load(f)
+        last_timestamp = data["last_timestamp"]
+        return cls(
+            indicators={name: _load_indicator(ind) for name, ind in data["indicators"].items()},
+            source_hash=data["source_hash"],
+            last_timestamp=None if last_timestamp is None else pd.Timestamp(last_timestamp),
+            last_row=data["last_row"],
+        )
+
+
+def run_online(strategy, data: pd.DataFrame, state_path: str, source_hash: str = None) -> pd.DataFrame:
+    """
+    Прогоняет через online-версию стратегии только бары, которых ещё не было в состоянии.
+
+    Стратегия должна объявить:
+        create_indicators() -> dict  - набор индикаторов;
+        update_bar(state, bar) -> dict - колонки результата для одного бара (в т.ч. 'signal').
+
+    Если состояния нет, оно устарело (разрыв в данных) или изменился файл стратегии,
+    индикаторы прогреваются заново на всём переданном окне.
+    Возвращает DataFrame только с новыми барами (или последним баром, если новых нет).
+    """
+    state = None
+    if os.path.exists(state_path):
+        state = IndicatorState.load(state_path)
+        if state.source_hash != source_hash or state.last_timestamp not in data.index:
+            state = None
+
+    if state is None:
+        state = IndicatorState(strategy.create_indicators(), source_hash=source_hash)
+        new_bars = data
+    else:
+        new_bars = data[data.index > state.last_timestamp]
+
+    if new_bars.empty:
+        return pd.DataFrame([state.last_row], index=pd.Index([state.last_timestamp], name=data.index.name))
+
+    rows = []
+    for ts, bar in zip(new_bars.index, new_bars.to_dict("records")):
+        rows.append({**bar, **strategy.update_bar(state, bar)})
+
+    state.last_timestamp = new_bars.index[-1]
+    state.last_row = {k: (v.item() if hasattr(v, "item") else v) for k, v in rows[-1].items()}
+    state.save(state_path)
+
+    return pd.DataFrame(rows, index=new_bars.index)
@@ -0,0 +1,217 @@
+# --- Загрузка истории котировок за период ---
+# Период делится на куски по CHUNK_DAYS дней, куски скачиваются параллельно
+# (в пределах EXCHANGE_CONCURRENCY биржи) и каждый сразу записывается в БД через COPY.
+# Готовые куски отмечаются в checkpoint-файле: прерванная загрузка при повторном
+# запуске с теми же параметрами продолжается с недокачанных кусков. Если --end не задан,
+# конец периода берётся из незавершённого checkpoint (иначе - текущее время).
+#
+# Пример:
+#   python backfill.py --exchange okx --symbol BTC/USDT --timeframe 1h --start 2021-01-01 --end 2024-01-01
+# Прогон на записанных данных без обращения к бирже:
+#   python backfill.py ... --replay recorded_ohlcv.json
+from market_data_fetcher import MarketDataFetcher
+from pg_client import PostgresClient
+from load_main import ExchangePool, EXCHANGE_CONCURRENCY, DEFAULT_EXCHANGE_CONCURRENCY, TABLE
+import os
+import json
+import logging
+import argparse
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+CHUNK_DAYS = int(os.getenv("BACKFILL_CHUNK_DAYS", "30"))
+CHECKPOINT_DIR = os.getenv("STATE_DIR", "state")
+
+
+# ============================================================
+# 1. Записанная биржа (для проверки без сети)
+# ============================================================
+class RecordedExchange:
+    """
+    Минимальная замена объекта ccxt: отдаёт свечи из JSON-файла вида
+    {"BTC/USDT|1h": [[timestamp_ms, open, high, low, close, volume], ...], ...}
+    с той же постраничной семантикой fetch_ohlcv(since, limit).
+    """
+
+    def __init__(self, path: str, now_ms: int = None):
+        with open(path) as f:
+            self.candles = {key: sorted(rows) for key, rows in json.load(f).items()}
+        self.now_ms = now_ms
+        self.requests = 0
+
+    def parse_timeframe(self, timeframe: str) -> int:
+        return int(pd.Timedelta(timeframe).total_seconds())
+
+    def milliseconds(self) -> int:
+        if self.now_ms is not None:
+            return self.now_ms
+        return int(pd.Timestamp.now(tz="UTC").timestamp() * 1000)
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = "1h", since: int = None, limit: int = 500) -> list:
+        self.requests += 1
+        rows = self.candles.get(f"{symbol}|{timeframe}", [])
+        if since is not None:
+            rows = [row for row in rows if row[0] >= since]
+        return rows[:limit] if since is not None else rows[-limit:]
+
+
+# ============================================================
+# 2. Разбиение периода и checkpoint
+# ============================================================
+def split_range(start: pd.Timestamp, end: pd.Timestamp, chunk_days: int) -> list:
+    """Полуинтервалы [начало, конец) по chunk_days дней, покрывающие [start, end)."""
+    chunks = []
+    chunk_start = start
+    while chunk_start < end:
+        chunk_end = min(chunk_start + pd.Timedelta(days=chunk_days), end)
+        chunks.append((chunk_start, chunk_end))
+        chunk_start = chunk_end
+    return chunks
+
+
+def default_checkpoint_path(exchange_name: str, symbol: str, timeframe: str) -> str:
+    name = f"backfill_{exchange_name}_{symbol.replace('/', '_')}_{timeframe}.json"
+    return os.path.join(CHECKPOINT_DIR, name)
+
+
+def load_checkpoint(path: str, params: dict) -> set:
+    """Начала уже загруженных кусков. Checkpoint с другими параметрами не используется."""
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("params") != params:
+        print(f"[WARN] {path}: параметры загрузки изменились, checkpoint не используется")
+        return set()
+    return set(data.get("done", []))
+
+
+def resume_end(path: str, params: dict):
+    """
+    Конец периода незавершённой загрузки с теми же параметрами (кроме end) или None.
+    Нужен, чтобы повторный запуск без --end продолжил прерванную загрузку, а не начал новую.
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        data = json.load(f)
+    saved = data.get("params", {})
+    if {k: v for k, v in saved.items() if k != "end"} != params or "end" not in saved:
+        return None
+    start = pd.Timestamp(params["start"])
+    end = pd.Timestamp(saved["end"])
+    if len(data.get("done", [])) >= len(split_range(start, end, params["chunk_days"])):
+        return None   # загрузка завершена - новый период до текущего времени
+    return end
+
+
+def save_checkpoint(path: str, params: dict, done: set):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"params": params, "done": sorted(done)}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+# ============================================================
+# 3. Загрузка
+# ============================================================
+def backfill(client: PostgresClient,
+             exchanges: ExchangePool,
+             exchange_name: str,
+             symbol: str,
+             timeframe: str,
+             start,
+             end=None,
+             chunk_days: int = CHUNK_DAYS,
+             workers: int = None,
+             checkpoint_path: str = None,
+             table: str = TABLE) -> int:
+    """
+    Загружает свечи [start, end) в table. Возвращает число вставленных строк.
+    end=None - конец незавершённой загрузки из checkpoint, если её нет - текущее время.
+    Куски качаются параллельно, запись в БД - в основном потоке по мере готовности.
+    """
+    start = pd.Timestamp(start)
+    if workers is None:
+        workers = EXCHANGE_CONCURRENCY.get(exchange_name, DEFAULT_EXCHANGE_CONCURRENCY)
+    if checkpoint_path is None:
+        checkpoint_path = default_checkpoint_path(exchange_name, symbol, timeframe)
+
+    identity = {"exchange": exchange_name, "symbol": symbol, "timeframe": timeframe,
+                "start": start.isoformat(), "chunk_days": chunk_days}
+    if end is None:
+        end = resume_end(checkpoint_path, identity)
+        if end is not None:
+            print(f"Продолжение прерванной загрузки до {end}")
+        else:
+            # Время без зоны трактуется как UTC, как и в таблице котировок
+            end = pd.Timestamp.now(tz="UTC").tz_localize(None).floor(timeframe)
+    end = pd.Timestamp(end)
+
+    params = {**identity, "end": end.isoformat()}
+    done = load_checkpoint(checkpoint_path, params)
+
+    chunks = [c for c in split_range(start, end, chunk_days) if c[0].isoformat() not in done]
+    print(f"{exchange_name} {symbol} {timeframe}: {start} - {end}, "
+          f"кусков к загрузке {len(chunks)} (уже загружено {len(done)})")
+
+    inserted = 0
+    failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(exchanges.fetch, exchange_name, symbol, timeframe, chunk_start, chunk_end):
+                (chunk_start, chunk_end)
+            for chunk_start, chunk_end in chunks
+        }
+        for future in as_completed(futures):
+            chunk_start, chunk_end = futures[future]
+            try:
+                df = future.result()
+                # История не должна будить демон стратегий на каждом куске
+                rows = client.save_market_data(df, table, notify=False)
+            except Exception as e:
+                # кусок не отмечается в checkpoint и будет загружен при следующем запуске
+                logging.error(f"{symbol} {timeframe} {chunk_start} - {chunk_end}: ошибка загрузки: {e}")
+                failed += 1
+                continue
+
+            inserted += rows
+            done.add(chunk_start.isoformat())
+            save_checkpoint(checkpoint_path, params, done)
+            print(f"{chunk_start} - {chunk_end}: получено {len(df)}, вставлено {rows}")
+
+    print(f"[BACKFILL] вставлено строк: {inserted}, ошибок: {failed}, "
+          f"загружено кусков: {len(done)} из {len(split_range(start, end, chunk_days))}")
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка истории котировок за период")
+    parser.add_argument("--exchange", default="okx")
+    parser.add_argument("--symbol", default="BTC/USDT")
+    parser.add_argument("--timeframe", default="1h")
+    parser.add_argument("--start", required=True, help="начало периода, например 2021-01-01")
+    parser.add_argument("--end", default=None, help="конец периода (не включительно), по умолчанию - сейчас")
+    parser.add_argument("--chunk-days", type=int, default=CHUNK_DAYS)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", default=None, help="путь к checkpoint-файлу")
+    parser.add_argument("--table", default=TABLE)
+    parser.add_argument("--replay", default=None, help="JSON с записанными свечами вместо запросов к бирже")
+    args = parser.parse_args()
+
+    if args.replay:
+        recorded = RecordedExchange(args.replay)
+        exchanges = ExchangePool(factory=lambda name: MarketDataFetcher(name, exchange=recorded))
+    else:
+        exchanges = ExchangePool()
+
+    client = PostgresClient()
+
+    backfill(client, exchanges, args.exchange, args.symbol, args.timeframe,
+             start=args.start, end=args.end, chunk_days=args.chunk_days,
+             workers=args.workers, checkpoint_path=args.checkpoint, table=args.table)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,109 @@
 from market_data_fetcher import MarketDataFetcher
 from pg_client import PostgresClient
 import os
+import queue
 import logging
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Источники данных: (биржа ccxt, инструмент, таймфрейм).
+# Можно переопределить переменной окружения MARKET_DATA_SOURCES="okx:BTC/USDT:1h,okx:ETH/USDT:4h"
+MARKET_DATA_SOURCES = [
+    ("okx", "BTC/USDT", "1h"),
+]
+# Максимум одновременных запросов к одной бирже
+EXCHANGE_CONCURRENCY = {
+    "okx": 4,
+    "binance": 4,
+}
+DEFAULT_EXCHANGE_CONCURRENCY = 2
+TABLE = "btc_usd_t"
+
+
+def get_sources() -> list:
+    env_sources = os.getenv("MARKET_DATA_SOURCES")
+    if not env_sources:
+        return MARKET_DATA_SOURCES
+    return [tuple(item.strip().split(":", 2)) for item in env_sources.split(",") if item.strip()]
+
+
+class ExchangePool:
+    """
+    Ограничивает число одновременных запросов к каждой бирже.
+    Объекты ccxt не делятся между потоками: у каждого слота свой экземпляр биржи.
+    """
+
+    def __init__(self, factory=MarketDataFetcher):
+        # factory(exchange_name) -> MarketDataFetcher; подменяется для записанных/тестовых бирж
+        self._factory = factory
+        self._pools = {}
+
+    def _pool(self, exchange_name: str) -> queue.Queue:
+        if exchange_name not in self._pools:
+            limit = EXCHANGE_CONCURRENCY.get(exchange_name, DEFAULT_EXCHANGE_CONCURRENCY)
+            pool = queue.Queue()
+            for _ in range(limit):
+                pool.put(None)   # экземпляр создаётся при первом использовании слота
+            self._pools[exchange_name] = pool
+        return self._pools[exchange_name]
+
+    def fetch(self, exchange_name: str, symbol: str, timeframe: str, since, end=None) -> pd.DataFrame:
+        """Свечи с since (до end, если задан) на свободном слоте биржи."""
+        pool = self._pool(exchange_name)
+        fetcher = pool.get()
+        try:
+            if fetcher is None:
+                fetcher = self._factory(exchange_name)
+            if end is None:
+                return fetcher.fetch_ohlcv_since(symbol, timeframe, since=since)
+            return fetcher.fetch_ohlcv_range(symbol, timeframe, since, end)
+        finally:
+            pool.put(fetcher)
+
 
 def main():
-    symbol = "BTC/USDT"
-    timeframe = "1h"
+    sources = get_sources()
+
+    # 1. Подключение к БД
+    client = PostgresClient()
+
+    # 2. Получение только новых свечей по всем источникам параллельно
+    last_timestamps = client.get_last_timestamps(TABLE)
+    exchanges = ExchangePool()
+    max_workers = sum(EXCHANGE_CONCURRENCY.get(e, DEFAULT_EXCHANGE_CONCURRENCY)
+                      for e in {exchange_name for exchange_name, _, _ in sources})
 
-    # 1. Получение данных
-    fetcher = MarketDataFetcher("binance")
-    df = fetcher.fetch_ohlcv(symbol, timeframe)
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for exchange_name, symbol, timeframe in sources:
+            last_ts = last_timestamps.get((symbol, timeframe))
+            since = None if last_ts is None else last_ts + pd.Timedelta(timeframe)
+            print(f'{exchange_name} {symbol} {timeframe}: last stored candle {last_ts}, fetching since {since}')
+            future = executor.submit(exchanges.fetch, exchange_name, symbol, timeframe, since)
+            futures[future] = (exchange_name, symbol, timeframe)
+
+        for future in as_completed(futures):
+            exchange_name, symbol, timeframe = futures[future]
+            try:
+                df = future.result()
+            except Exception as e:
+                # ошибка одного источника не мешает загрузке остальных
+                logging.error(f"{exchange_name} {symbol} {timeframe}: ошибка загрузки: {e}")
+                continue
+            print(f'{exchange_name} {symbol} {timeframe}: получено свечей {len(df)}')
+            frames.append(df)
+
+    frames = [df for df in frames if not df.empty]
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
 
     print('_________________df_________________')
     print('df', df)
     print('_________________df.info()_________________')
     print('df.info()', df.info())
-    
-    # 2. Подключение к БД
-    client = PostgresClient(
-        host = os.getenv("DB_HOST"),
-        port = os.getenv("DB_PORT"),
-        user = os.getenv("DB_USER"),
-        password = os.getenv("DB_PASS"),
-        database = os.getenv("DB_NAME")
-    )
-
-    # 3. Запись
-    client.save_market_data(df, "btc_usd_t")
+
+    # 3. Запись всех источников одной пачкой
+    client.save_market_data(df, TABLE)
 
 
 if __name__ == "__main__":
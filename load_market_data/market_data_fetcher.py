@@ -3,9 +3,10 @@ import pandas as pd
 from datetime import datetime
 
 class MarketDataFetcher:
-    def __init__(self, exchange_name="binance"):
-        # self.exchange = getattr(ccxt, exchange_name)()
-        self.exchange = ccxt.okx()
+    def __init__(self, exchange_name="okx", exchange=None):
+        # exchange - готовый объект биржи (например, записанные ответы для тестов)
+        self.exchange_name = exchange_name
+        self.exchange = exchange or getattr(ccxt, exchange_name)({"enableRateLimit": True})
 
     def fetch_ohlcv(self, symbol: str, timeframe: str = "1h", limit: int = 500) -> pd.DataFrame:
         """Запрос OHLCV данных."""
@@ -22,3 +23,45 @@ class MarketDataFetcher:
         df["timeframe"] = timeframe
         df = df[:-1]
         return df
+
+    def fetch_ohlcv_since(self, symbol: str, timeframe: str = "1h", since=None, limit: int = 500) -> pd.DataFrame:
+        """
+        Запрос только закрытых свечей, начиная с since (включительно).
+        Если since не задан - последние limit свечей, как в fetch_ohlcv.
+        При пропуске в данных запросы идут страницами по limit свечей до текущего момента.
+        """
+        if since is None:
+            return self.fetch_ohlcv(symbol, timeframe, limit)
+        return self.fetch_ohlcv_range(symbol, timeframe, since, None, limit)
+
+    def fetch_ohlcv_range(self, symbol: str, timeframe: str, start, end=None, limit: int = 500) -> pd.DataFrame:
+        """
+        Закрытые свечи с временем открытия в [start, end) постранично.
+        end=None - до текущего момента.
+        """
+        tf_ms = self.exchange.parse_timeframe(timeframe) * 1000
+        since_ms = int(pd.Timestamp(start).timestamp() * 1000)
+        now_ms = self.exchange.milliseconds()
+        until_ms = now_ms if end is None else min(int(pd.Timestamp(end).timestamp() * 1000), now_ms)
+
+        raw = []
+        while since_ms < until_ms and since_ms + tf_ms <= now_ms:
+            page = self.exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since_ms, limit=limit)
+            page = [candle for candle in page if since_ms <= candle[0] < until_ms]
+            if not page:
+                break
+            raw.extend(page)
+            since_ms = page[-1][0] + tf_ms
+
+        df = pd.DataFrame(
+            raw,
+            columns=["timestamp", "open", "high", "low", "close", "volume"]
+        )
+
+        # Только закрытые свечи: время открытия + длительность свечи уже в прошлом
+        df = df[df["timestamp"] + tf_ms <= now_ms].drop_duplicates("timestamp")
+
+        df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ms")
+        df["symbol"] = symbol
+        df["timeframe"] = timeframe
+        return df.reset_index(drop=True)
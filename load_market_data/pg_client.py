@@ -1,22 +1,52 @@
-import psycopg2
-import psycopg2.extras
+import io
+import os
+import sys
+import json
 import pandas as pd
 import logging
 
+# config.py и db.py лежат в корне репозитория, а скрипты загрузки запускаются из load_market_data
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+# Канал LISTEN/NOTIFY, в который публикуется факт появления новых свечей
+MARKET_DATA_CHANNEL = "market_data"
+# Числовые колонки котировок (хранятся как double precision, читаются сразу во float64)
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+TABLE_COLUMNS_DDL = """
+    timestamp   timestamptz NOT NULL,
+    open        double precision,
+    high        double precision,
+    low         double precision,
+    close       double precision,
+    volume      double precision,
+    symbol      text NOT NULL,
+    timeframe   text NOT NULL
+"""
+
 
 class PostgresClient:
-    def __init__(self, host, port, user, password, database):
-        self.conn = psycopg2.connect(
+    def __init__(self, host=None, port=None, user=None, password=None, database=None,
+                 partitioned: bool = True):
+        # Параметры по умолчанию - из config.py. Соединение отдельное, не из пула:
+        # в сессии живёт staging-таблица, а режим autocommit переключается при записи
+        self.conn = db.connect(
+            autocommit=True,
             host=host,
             port=port,
             user=user,
             password=password,
             dbname=database
         )
-        self.conn.autocommit = True
+        # Таблица котировок секционирована по месяцам (см. раздел 2.3)
+        self.partitioned = partitioned
 
         self._ensure_schema()
-        self._ensure_table()
+        if partitioned:
+            self._ensure_partitioned_table()
+        else:
+            self._ensure_table()
+        self._migrate_ohlcv_to_double()
         # self._truncate_table()
         self._ensure_index()
 
@@ -33,24 +63,132 @@ class PostgresClient:
     # 2. Создание таблицы
     # --------------------------------------------------------
     def _ensure_table(self):
-        query = """
-        CREATE TABLE IF NOT EXISTS test.btc_usd_t (
-            timestamp   timestamptz NOT NULL,
-            open        numeric,
-            high        numeric,
-            low         numeric,
-            close       numeric,
-            volume      numeric,
-            symbol      text NOT NULL,
-            timeframe   text NOT NULL
-        );
+        query = f"""
+        CREATE TABLE IF NOT EXISTS test.btc_usd_t ({TABLE_COLUMNS_DDL});
         """
         with self.conn.cursor() as cur:
             cur.execute(query)
         logging.info("Table test.btc_usd_t checked/ensured.")
 
     # --------------------------------------------------------
-    # 2.1. Очистка таблицы
+    # 2.1. Перевод numeric -> double precision
+    # --------------------------------------------------------
+    def _migrate_ohlcv_to_double(self, table: str = "btc_usd_t"):
+        """
+        Старые таблицы создавались с numeric: psycopg2 отдаёт такие значения как Decimal.
+        Колонки переводятся в double precision один раз (значения писались из float, потерь нет).
+        """
+        query = """
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'test' AND table_name = %s
+          AND column_name = ANY(%s) AND data_type = 'numeric';
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(query, (table, OHLCV_COLUMNS))
+            columns = [row[0] for row in cur.fetchall()]
+            if not columns:
+                return
+            alter = ", ".join(f"ALTER COLUMN {c} TYPE double precision" for c in columns)
+            cur.execute(f"ALTER TABLE test.{table} {alter};")
+        logging.info(f"Table test.{table}: columns {columns} migrated to double precision.")
+
+    # --------------------------------------------------------
+    # 2.3. Секционирование по месяцам
+    # --------------------------------------------------------
+    def _relkind(self, table: str):
+        """'p' - секционированная таблица, 'r' - обычная, None - таблицы нет."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+            SELECT c.relkind
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'test' AND c.relname = %s;
+            """, (table,))
+            row = cur.fetchone()
+        return None if row is None else row[0]
+
+    def _ensure_partitioned_table(self, table: str = "btc_usd_t"):
+        """
+        Создаёт test.<table> как PARTITION BY RANGE (timestamp) с помесячными секциями.
+        Существующая обычная таблица один раз переносится в новую структуру (в одной транзакции).
+        Запросы с границей по timestamp (runner, кэш котировок, догрузка) читают только нужные секции.
+        """
+        relkind = self._relkind(table)
+        if relkind == "p":
+            return
+
+        self.conn.autocommit = False
+        try:
+            with self.conn.cursor() as cur:
+                heap = f"{table}_heap"
+                if relkind == "r":
+                    cur.execute(f"ALTER TABLE test.{table} RENAME TO {heap};")
+                cur.execute(f"""
+                CREATE TABLE test.{table} ({TABLE_COLUMNS_DDL})
+                PARTITION BY RANGE (timestamp);
+                """)
+                if relkind == "r":
+                    cur.execute(f"SELECT min(timestamp), max(timestamp) FROM test.{heap};")
+                    first_ts, last_ts = cur.fetchone()
+                    if first_ts is not None:
+                        self._create_partitions(cur, table, first_ts, last_ts)
+                    columns = "timestamp, " + ", ".join(OHLCV_COLUMNS) + ", symbol, timeframe"
+                    cur.execute(f"""
+                    INSERT INTO test.{table} ({columns})
+                    SELECT {columns} FROM test.{heap};
+                    DROP TABLE test.{heap};
+                    """)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.autocommit = True
+        logging.info(f"Table test.{table} is partitioned by month"
+                     f"{' (data moved from the plain table)' if relkind == 'r' else ''}.")
+
+    def _create_partitions(self, cur, table: str, first_ts, last_ts):
+        """Создаёт недостающие помесячные секции, покрывающие [first_ts, last_ts]."""
+        cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'test' AND p.relname = %s;
+        """, (table,))
+        existing = {row[0] for row in cur.fetchall()}
+
+        first_ts = pd.Timestamp(first_ts)
+        last_ts = pd.Timestamp(last_ts)
+        # Время без зоны - UTC, как его пишет MarketDataFetcher
+        first_ts = first_ts.tz_convert("UTC").tz_localize(None) if first_ts.tzinfo else first_ts
+        last_ts = last_ts.tz_convert("UTC").tz_localize(None) if last_ts.tzinfo else last_ts
+
+        for month in pd.period_range(first_ts, last_ts, freq="M"):
+            name = f"{table}_p{month.year}_{month.month:02d}"
+            if name in existing:
+                continue
+            start = month.start_time.strftime("%Y-%m-%d")
+            end = (month + 1).start_time.strftime("%Y-%m-%d")
+            cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS test.{name}
+                PARTITION OF test.{table}
+                FOR VALUES FROM ('{start} 00:00:00+00') TO ('{end} 00:00:00+00');
+            """)
+            logging.info(f"Partition test.{name} created.")
+
+    def ensure_partitions(self, df: pd.DataFrame, table: str = "btc_usd_t"):
+        """Секции под все месяцы из df (и следующий месяц - заранее, чтобы не создавать его на лету)."""
+        if not self.partitioned or df.empty:
+            return
+        last_ts = pd.Timestamp(df["timestamp"].max())
+        with self.conn.cursor() as cur:
+            self._create_partitions(cur, table, df["timestamp"].min(), last_ts + pd.DateOffset(months=1))
+
+    # --------------------------------------------------------
+    # 2.2. Очистка таблицы
     # --------------------------------------------------------
     # def _truncate_table(self):
     #     query = """
@@ -64,45 +202,220 @@ class PostgresClient:
     # 3. Создание уникального индекса
     # --------------------------------------------------------
     def _ensure_index(self):
-        query = """
-        CREATE UNIQUE INDEX IF NOT EXISTS market_data_idx
-            ON test.btc_usd_t (timestamp, symbol, timeframe);
-        """
+        if self.partitioned:
+            # (symbol, timeframe, timestamp) - и ключ для ON CONFLICT, и "последние N баров пары";
+            # BRIN по timestamp - компактный индекс для диапазонных запросов внутри секции
+            query = """
+            CREATE UNIQUE INDEX IF NOT EXISTS market_data_idx
+                ON test.btc_usd_t (symbol, timeframe, timestamp);
+            CREATE INDEX IF NOT EXISTS market_data_ts_brin
+                ON test.btc_usd_t USING brin (timestamp);
+            """
+        else:
+            query = """
+            CREATE UNIQUE INDEX IF NOT EXISTS market_data_idx
+                ON test.btc_usd_t (timestamp, symbol, timeframe);
+            """
         with self.conn.cursor() as cur:
             cur.execute(query)
         logging.info("Unique index checked/created.")
 
+    # --------------------------------------------------------
+    # 3.1. Время последней сохранённой свечи
+    # --------------------------------------------------------
+    def get_last_timestamp(self, symbol: str, timeframe: str, table: str = "btc_usd_t"):
+        """Возвращает max(timestamp) по паре (symbol, timeframe) или None, если данных нет."""
+        query = f"""
+        SELECT max(timestamp)
+        FROM test.{table}
+        WHERE symbol = %s AND timeframe = %s;
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(query, (symbol, timeframe))
+            last_ts = cur.fetchone()[0]
+        return None if last_ts is None else pd.Timestamp(last_ts)
+
+    def get_last_timestamps(self, table: str = "btc_usd_t") -> dict:
+        """Возвращает {(symbol, timeframe): max(timestamp)} одним запросом по всем парам."""
+        query = f"""
+        SELECT symbol, timeframe, max(timestamp)
+        FROM test.{table}
+        GROUP BY symbol, timeframe;
+        """
+        with self.conn.cursor() as cur:
+            cur.execute(query)
+            rows = cur.fetchall()
+        return {(symbol, timeframe): pd.Timestamp(ts) for symbol, timeframe, ts in rows}
+
     # --------------------------------------------------------
     # 4. Сохранение данных UPSERT
     # --------------------------------------------------------
-    def save_market_data(self, df: pd.DataFrame, table: str = "btc_usd_t"):
-        """Вставляет только новые строки (UPSERT DO NOTHING)."""
+    def save_market_data(self, df: pd.DataFrame, table: str = "btc_usd_t", notify: bool = True) -> int:
+        """
+        Вставляет только новые строки (UPSERT DO NOTHING).
+        Данные передаются потоком COPY во временную staging-таблицу и сливаются
+        в целевую одним INSERT ... SELECT. Возвращает число реально вставленных строк.
+        notify=False - не публиковать NOTIFY (например, при загрузке истории).
+        """
 
         if df.empty:
             logging.info("DataFrame is empty — nothing to insert.")
-            return
+            return 0
 
         columns = [
             "timestamp", "open", "high", "low", "close", "volume", "symbol", "timeframe"
         ]
+        column_list = ", ".join(columns)
+        staging = f"staging_{table}"
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, columns=columns, header=False, index=False, na_rep="\\N")
+        buffer.seek(0)
+
+        self.ensure_partitions(df, table)
+
+        # staging-таблица живёт до конца сессии, поэтому весь обмен идёт одной транзакцией
+        self.conn.autocommit = False
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"""
+                CREATE TEMP TABLE IF NOT EXISTS {staging}
+                    (LIKE test.{table} INCLUDING DEFAULTS);
+                TRUNCATE {staging};
+                """)
+                cur.copy_expert(
+                    f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                    buffer
+                )
+                cur.execute(f"""
+                WITH inserted AS (
+                    INSERT INTO test.{table} ({column_list})
+                    SELECT {column_list} FROM {staging}
+                    ON CONFLICT (timestamp, symbol, timeframe) DO NOTHING
+                    RETURNING timestamp, symbol, timeframe
+                )
+                SELECT symbol, timeframe, count(*), max(timestamp)
+                FROM inserted
+                GROUP BY symbol, timeframe;
+                """)
+                inserted = cur.fetchall()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.autocommit = True
+
+        inserted_rows = sum(count for _, _, count, _ in inserted)
+        logging.info(f"Inserted new rows: {inserted_rows} of {len(df)} (duplicates skipped automatically).")
+
+        if notify:
+            self._notify_new_data(table, inserted)
+        return inserted_rows
 
-        insert_query = f"""
-        INSERT INTO test.{table} ({', '.join(columns)})
-        VALUES %s
-        ON CONFLICT (timestamp, symbol, timeframe) DO NOTHING;
+    # --------------------------------------------------------
+    # 4.1. Свёртка старых данных в более крупный таймфрейм
+    # --------------------------------------------------------
+    def rollup_market_data(self,
+                           table: str = "btc_usd_t",
+                           source_tf: str = "1h",
+                           target_tf: str = "1d",
+                           older_than_days: int = 365,
+                           delete_source: bool = False) -> tuple:
         """
+        Строит свечи target_tf из свечей source_tf старше older_than_days дней
+        (open - первая, close - последняя, high/low - экстремумы, volume - сумма).
+        Берутся только полные интервалы (есть все свечи source_tf), уже свёрнутые не перезаписываются.
+        delete_source=True - исходные свечи свёрнутых интервалов удаляются.
+        Возвращает (вставлено свечей target_tf, удалено свечей source_tf).
+        """
+        source_sec = int(pd.Timedelta(source_tf).total_seconds())
+        target_sec = int(pd.Timedelta(target_tf).total_seconds())
+        if target_sec <= source_sec or target_sec % source_sec:
+            raise ValueError(f"{target_tf} должен быть кратен {source_tf}")
 
-        values = [
-            tuple(row[col] for col in columns)
-            for _, row in df.iterrows()
-        ]
+        # Граница выравнивается по интервалу target_tf, чтобы не свернуть неполный интервал
+        cutoff = pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=older_than_days)
+        cutoff = cutoff.floor(f"{target_sec}s")
+
+        params = {"source_tf": source_tf, "target_tf": target_tf, "cutoff": cutoff,
+                  "target_sec": target_sec, "bars": target_sec // source_sec}
+        buckets = f"""
+            SELECT symbol,
+                   to_timestamp(floor(extract(epoch FROM timestamp) / %(target_sec)s) * %(target_sec)s) AS bucket,
+                   timestamp, open, high, low, close, volume
+            FROM test.{table}
+            WHERE timeframe = %(source_tf)s AND timestamp < %(cutoff)s
+        """
+        self.conn.autocommit = False
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute(f"SELECT min(timestamp) FROM test.{table} WHERE timeframe = %(source_tf)s;", params)
+                first_ts = cur.fetchone()[0]
+                if first_ts is None or first_ts >= cutoff:
+                    self.conn.rollback()
+                    return 0, 0
+                if self.partitioned:
+                    self._create_partitions(cur, table, first_ts, cutoff)
+
+                cur.execute(f"""
+                CREATE TEMP TABLE rollup_buckets ON COMMIT DROP AS
+                SELECT symbol, bucket,
+                       (array_agg(open ORDER BY timestamp ASC))[1]   AS open,
+                       max(high)                                     AS high,
+                       min(low)                                      AS low,
+                       (array_agg(close ORDER BY timestamp DESC))[1] AS close,
+                       sum(volume)                                   AS volume
+                FROM ({buckets}) b
+                GROUP BY symbol, bucket
+                HAVING count(*) = %(bars)s;
+
+                INSERT INTO test.{table} (timestamp, open, high, low, close, volume, symbol, timeframe)
+                SELECT bucket, open, high, low, close, volume, symbol, %(target_tf)s
+                FROM rollup_buckets
+                ON CONFLICT DO NOTHING;
+                """, params)
+                inserted = cur.rowcount
+
+                deleted = 0
+                if delete_source:
+                    cur.execute(f"""
+                    DELETE FROM test.{table} t
+                    USING rollup_buckets r
+                    WHERE t.timeframe = %(source_tf)s
+                      AND t.symbol = r.symbol
+                      AND t.timestamp >= r.bucket
+                      AND t.timestamp < r.bucket + make_interval(secs => %(target_sec)s)
+                      AND t.timestamp < %(cutoff)s;
+                    """, params)
+                    deleted = cur.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        finally:
+            self.conn.autocommit = True
+
+        logging.info(f"Rollup {source_tf} -> {target_tf} before {cutoff}: inserted {inserted}, deleted {deleted}.")
+        return inserted, deleted
+
+    # --------------------------------------------------------
+    # 5. Уведомление подписчиков (runner.py --daemon) о новых свечах
+    # --------------------------------------------------------
+    def _notify_new_data(self, table: str, inserted: list):
+        """
+        Публикует NOTIFY по каждой паре (symbol, timeframe), где появились новые строки.
+        inserted - строки (symbol, timeframe, count, max_timestamp).
+        """
+        last_ts = {(symbol, timeframe): ts for symbol, timeframe, _, ts in inserted}
 
         with self.conn.cursor() as cur:
-            psycopg2.extras.execute_values(
-                cur,
-                insert_query,
-                values,
-                page_size=500
-            )
-
-        logging.info(f"Inserted new rows: {len(values)} (duplicates skipped automatically).")
+            for (symbol, timeframe), ts in last_ts.items():
+                payload = json.dumps({
+                    "table": f"test.{table}",
+                    "symbol": symbol,
+                    "timeframe": timeframe,
+                    "timestamp": ts.isoformat(),
+                })
+                cur.execute("SELECT pg_notify(%s, %s);", (MARKET_DATA_CHANNEL, payload))
+                logging.info(f"NOTIFY {MARKET_DATA_CHANNEL}: {payload}")
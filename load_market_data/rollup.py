@@ -0,0 +1,27 @@
+# --- Свёртка старых свечей (например, 1h старше года -> 1d) ---
+# Пример:
+#   python rollup.py --source-tf 1h --target-tf 1d --older-than-days 365 --delete-source
+from pg_client import PostgresClient
+from load_main import TABLE
+import argparse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Свёртка старых свечей в более крупный таймфрейм")
+    parser.add_argument("--source-tf", default="1h")
+    parser.add_argument("--target-tf", default="1d")
+    parser.add_argument("--older-than-days", type=int, default=365)
+    parser.add_argument("--delete-source", action="store_true",
+                        help="удалить исходные свечи свёрнутых интервалов")
+    parser.add_argument("--table", default=TABLE)
+    args = parser.parse_args()
+
+    client = PostgresClient()
+
+    inserted, deleted = client.rollup_market_data(args.table, args.source_tf, args.target_tf,
+                                                  args.older_than_days, args.delete_source)
+    print(f"[ROLLUP] {args.source_tf} -> {args.target_tf}: вставлено {inserted}, удалено {deleted}")
+
+
+if __name__ == "__main__":
+    main()
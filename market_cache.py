@@ -0,0 +1,207 @@
+# --- Локальное колоночное зеркало таблицы котировок (Parquet) ---
+# Раскладка: <root>/<schema.table>/symbol=BTC-USDT/timeframe=1h/2024-01.parquet
+# Обновление инкрементальное: из Postgres забираются только строки новее последней
+# закэшированной, дописывается (перезаписывается) лишь месяц, в который они попали.
+# Если число строк в БД разошлось с кэшем (догрузка истории, удаления) -
+# пара (symbol, timeframe) перестраивается целиком.
+import json
+import os
+import shutil
+
+import pandas as pd
+from sqlalchemy import text
+
+from market_data import fetch_ohlcv
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # кэш необязателен, без pyarrow данные читаются напрямую из БД
+    pa = None
+
+INDEX_COLUMN = "timestamp"
+MANIFEST_FILE = "manifest.json"
+
+
+def _partition_dir(symbol: str, timeframe: str) -> str:
+    return os.path.join(f"symbol={symbol.replace('/', '-')}", f"timeframe={timeframe}")
+
+
+def _month(ts: pd.Timestamp) -> str:
+    return ts.strftime("%Y-%m")
+
+
+def _utc(ts) -> pd.Timestamp:
+    """Время без зоны трактуется как UTC, как и в таблице котировок."""
+    ts = pd.Timestamp(ts)
+    return ts.tz_localize("UTC") if ts.tzinfo is None else ts.tz_convert("UTC")
+
+
+class MarketDataCache:
+    def __init__(self, root: str, table: str = "test.btc_usd_t"):
+        if pa is None:
+            raise RuntimeError("Для кэша котировок нужен pyarrow (pip install pyarrow)")
+        self.table = table
+        self.root = os.path.join(root, table)
+        self.manifest = self._load_manifest()
+
+    # --------------------------------------------------------
+    # 1. Обновление из БД
+    # --------------------------------------------------------
+    def refresh(self, engine, symbol: str = None, timeframe: str = None) -> int:
+        """
+        Догружает в кэш новые строки по всем парам (или по одной паре symbol/timeframe).
+        Возвращает число записанных в кэш строк.
+        """
+        where, params = self._where(symbol, timeframe)
+        stats = pd.read_sql(text(f"""
+            SELECT symbol, timeframe, count(*) AS rows, max(timestamp) AS last_timestamp
+            FROM {self.table}
+            {where}
+            GROUP BY symbol, timeframe
+        """), engine, params=params)
+
+        written = 0
+        for row in stats.itertuples(index=False):
+            key = f"{row.symbol}|{row.timeframe}"
+            cached = self.manifest.get(key)
+            last_timestamp = pd.Timestamp(row.last_timestamp)
+
+            if cached is not None and cached["rows"] == row.rows \
+                    and pd.Timestamp(cached["last_timestamp"]) == last_timestamp:
+                continue
+
+            new_rows = None
+            if cached is not None:
+                new_rows = self._query(engine, row.symbol, row.timeframe,
+                                       after=pd.Timestamp(cached["last_timestamp"]))
+                if cached["rows"] + len(new_rows) != row.rows:
+                    new_rows = None   # в БД изменилась уже закэшированная история
+
+            if new_rows is None:
+                new_rows = self._query(engine, row.symbol, row.timeframe)
+                shutil.rmtree(os.path.join(self.root, _partition_dir(row.symbol, row.timeframe)),
+                              ignore_errors=True)
+
+            self._write(row.symbol, row.timeframe, new_rows)
+            written += len(new_rows)
+            self.manifest[key] = {"rows": int(row.rows), "last_timestamp": last_timestamp.isoformat()}
+            self._save_manifest()
+
+        return written
+
+    def _where(self, symbol: str = None, timeframe: str = None):
+        conditions, params = [], {}
+        if symbol is not None:
+            conditions.append("symbol = :symbol")
+            params["symbol"] = symbol
+        if timeframe is not None:
+            conditions.append("timeframe = :timeframe")
+            params["timeframe"] = timeframe
+        return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+    def _query(self, engine, symbol: str, timeframe: str, after: pd.Timestamp = None) -> pd.DataFrame:
+        return fetch_ohlcv(engine, self.table, symbol, timeframe, after=after).reset_index()
+
+    def _write(self, symbol: str, timeframe: str, df: pd.DataFrame):
+        """Дописывает строки в месячные файлы; затронутый месяц перезаписывается атомарно."""
+        if df.empty:
+            return
+        directory = os.path.join(self.root, _partition_dir(symbol, timeframe))
+        os.makedirs(directory, exist_ok=True)
+
+        df[INDEX_COLUMN] = pd.to_datetime(df[INDEX_COLUMN], utc=True)
+        for month, part in df.groupby(df[INDEX_COLUMN].dt.strftime("%Y-%m"), sort=True):
+            path = os.path.join(directory, f"{month}.parquet")
+            if os.path.exists(path):
+                part = pd.concat([pq.read_table(path).to_pandas(), part], ignore_index=True)
+                part = part.drop_duplicates(INDEX_COLUMN, keep="last").sort_values(INDEX_COLUMN)
+            tmp_path = f"{path}.tmp"
+            pq.write_table(pa.Table.from_pandas(part, preserve_index=False), tmp_path)
+            os.replace(tmp_path, path)
+
+    def _load_manifest(self) -> dict:
+        path = os.path.join(self.root, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, MANIFEST_FILE)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+
+    # --------------------------------------------------------
+    # 2. Чтение
+    # --------------------------------------------------------
+    def _files(self, symbol: str = None, timeframe: str = None, start=None, end=None) -> list:
+        """Месячные файлы нужных пар, отсечённые по периоду по имени файла."""
+        start_month = None if start is None else _month(_utc(start))
+        end_month = None if end is None else _month(_utc(end))
+
+        files = []
+        for key in sorted(self.manifest):
+            key_symbol, key_timeframe = key.split("|", 1)
+            if symbol is not None and key_symbol != symbol:
+                continue
+            if timeframe is not None and key_timeframe != timeframe:
+                continue
+            directory = os.path.join(self.root, _partition_dir(key_symbol, key_timeframe))
+            if not os.path.isdir(directory):
+                continue
+            for name in sorted(os.listdir(directory)):
+                if not name.endswith(".parquet"):
+                    continue
+                month = name[:-len(".parquet")]
+                if (start_month is None or month >= start_month) and (end_month is None or month <= end_month):
+                    files.append(os.path.join(directory, name))
+        return files
+
+    def read(self,
+             symbol: str = None,
+             timeframe: str = None,
+             start=None,
+             end=None,
+             columns: list = None,
+             limit: int = None) -> pd.DataFrame:
+        """
+        OHLCV из кэша в том же виде, что и fetch_market_data: индекс timestamp (UTC),
+        строки по возрастанию времени. start/end - границы включительно,
+        columns - подмножество колонок, limit - только последние limit баров.
+        """
+        files = self._files(symbol, timeframe, start, end)
+
+        if limit is not None and symbol is not None and timeframe is not None:
+            # Последних месяцев обычно хватает: число строк берём из метаданных файлов
+            selected, rows = [], 0
+            for path in reversed(files):
+                selected.append(path)
+                rows += pq.ParquetFile(path).metadata.num_rows
+                if rows >= limit:
+                    break
+            files = selected[::-1]
+
+        read_columns = None if columns is None else [INDEX_COLUMN] + [c for c in columns if c != INDEX_COLUMN]
+        if not files:
+            return pd.DataFrame(columns=read_columns or [INDEX_COLUMN]).set_index(INDEX_COLUMN)
+
+        condition = None
+        if start is not None:
+            condition = ds.field(INDEX_COLUMN) >= _utc(start)
+        if end is not None:
+            end_condition = ds.field(INDEX_COLUMN) <= _utc(end)
+            condition = end_condition if condition is None else condition & end_condition
+
+        dataset = ds.dataset(files, format="parquet")
+        df = dataset.to_table(columns=read_columns, filter=condition).to_pandas()
+        if symbol is None or timeframe is None:
+            df = df.sort_values(INDEX_COLUMN, kind="stable")
+        if limit is not None:
+            df = df.tail(limit)
+
+        df.set_index(INDEX_COLUMN, inplace=True)
+        return df
@@ -0,0 +1,132 @@
+# --- Чтение OHLCV из Postgres ---
+# Колонки OHLCV приводятся к double precision на стороне сервера и выгружаются
+# одним потоком COPY ... TO STDOUT (FORMAT binary). Строки такой выгрузки имеют
+# фиксированную длину, поэтому разбираются numpy.frombuffer сразу в float64 -
+# без построчной конвертации через Decimal в psycopg2 и без разбора текста.
+import io
+
+import numpy as np
+import pandas as pd
+
+OHLCV_COLUMNS = ["open", "high", "low", "close", "volume"]
+INDEX_COLUMN = "timestamp"
+
+# Формат COPY BINARY: заголовок PGCOPY, затем на строку int16 число полей
+# и для каждого поля int32 длина + значение (big-endian)
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_COPY_ROW = np.dtype(
+    [("fields", ">i2"), ("ts_len", ">i4"), ("ts", ">i8")]
+    + [item for c in OHLCV_COLUMNS for item in ((f"{c}_len", ">i4"), (c, ">f8"))]
+)
+# timestamptz в binary-формате - микросекунды от 2000-01-01 UTC
+_PG_EPOCH_US = 946684800 * 1_000_000
+
+
+def fetch_ohlcv(engine,
+                table: str,
+                symbol: str = None,
+                timeframe: str = None,
+                since=None,
+                after=None,
+                limit: int = None) -> pd.DataFrame:
+    """
+    OHLCV из table по возрастанию времени с индексом timestamp (UTC)
+    и колонками open, high, low, close, volume (float64), symbol, timeframe.
+
+    since / after - нижняя граница времени включительно / строго после;
+    limit - только limit последних баров (для каждой пары symbol/timeframe).
+    Без symbol/timeframe читаются все пары таблицы.
+    """
+    if symbol is None or timeframe is None:
+        frames = [fetch_ohlcv(engine, table, pair_symbol, pair_timeframe, since, after, limit)
+                  for pair_symbol, pair_timeframe in _pairs(engine, table, symbol, timeframe)]
+        if not frames:
+            return _frame(np.empty(0, dtype=_COPY_ROW), symbol, timeframe)
+        return pd.concat(frames).sort_index(kind="stable")
+
+    conditions = ["symbol = %(symbol)s", "timeframe = %(timeframe)s"]
+    params = {"symbol": symbol, "timeframe": timeframe}
+    if since is not None:
+        conditions.append("timestamp >= %(since)s")
+        params["since"] = since
+    if after is not None:
+        conditions.append("timestamp > %(after)s")
+        params["after"] = after
+    where = " AND ".join(conditions)
+
+    # NULL заменяется на NaN, чтобы все поля строки были фиксированной длины
+    select = ", ".join(["timestamp"] + [f"coalesce({c}::double precision, 'NaN') AS {c}" for c in OHLCV_COLUMNS])
+    if limit is None:
+        query = f"SELECT {select} FROM {table} WHERE {where} ORDER BY timestamp ASC"
+    else:
+        params["limit"] = limit
+        query = f"""
+            SELECT * FROM (
+                SELECT {select} FROM {table} WHERE {where}
+                ORDER BY timestamp DESC
+                LIMIT %(limit)s
+            ) t
+            ORDER BY timestamp ASC
+        """
+
+    buffer = io.BytesIO()
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            copy_sql = cur.mogrify(f"COPY ({query}) TO STDOUT WITH (FORMAT binary)", params).decode()
+            cur.copy_expert(copy_sql, buffer)
+        raw_conn.rollback()
+    finally:
+        raw_conn.close()
+
+    return _frame(_decode_copy_binary(buffer.getbuffer()), symbol, timeframe)
+
+
+def _pairs(engine, table: str, symbol: str = None, timeframe: str = None) -> list:
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT DISTINCT symbol, timeframe
+                FROM {table}
+                WHERE (%(symbol)s IS NULL OR symbol = %(symbol)s)
+                  AND (%(timeframe)s IS NULL OR timeframe = %(timeframe)s)
+                ORDER BY symbol, timeframe
+            """, {"symbol": symbol, "timeframe": timeframe})
+            pairs = cur.fetchall()
+        raw_conn.rollback()
+    finally:
+        raw_conn.close()
+    return pairs
+
+
+def _decode_copy_binary(data) -> np.ndarray:
+    if bytes(data[:len(_COPY_SIGNATURE)]) != _COPY_SIGNATURE:
+        raise ValueError("Неожиданный формат COPY BINARY")
+    extension_len = int.from_bytes(data[15:19], "big")
+    offset = 19 + extension_len
+    # В конце выгрузки - int16 -1
+    count = (len(data) - offset - 2) // _COPY_ROW.itemsize
+    rows = np.frombuffer(data, dtype=_COPY_ROW, count=count, offset=offset)
+    if count and ((rows["fields"] != 1 + len(OHLCV_COLUMNS)).any() or (rows["ts_len"] != 8).any()):
+        raise ValueError("Неожиданная структура строк COPY BINARY")
+    return rows
+
+
+def _frame(rows: np.ndarray, symbol: str, timeframe: str) -> pd.DataFrame:
+    index = pd.DatetimeIndex(
+        ((rows["ts"].astype(np.int64) + _PG_EPOCH_US) * 1000).astype("datetime64[ns]"),
+        name=INDEX_COLUMN,
+    ).tz_localize("UTC")
+    df = pd.DataFrame({c: rows[c].astype(np.float64) for c in OHLCV_COLUMNS}, index=index)
+    df["symbol"] = symbol
+    df["timeframe"] = timeframe
+    return df
+
+
+def assert_float_ohlcv(df: pd.DataFrame, source: str = "") -> pd.DataFrame:
+    """Проверяет, что колонки OHLCV - float64 (не object/Decimal), иначе TypeError."""
+    bad = {c: str(df[c].dtype) for c in OHLCV_COLUMNS if c in df.columns and df[c].dtype != np.float64}
+    if bad:
+        raise TypeError(f"Колонки OHLCV{' ' + source if source else ''} должны быть float64: {bad}")
+    return df
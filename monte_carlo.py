@@ -0,0 +1,114 @@
+# --- Монте-Карло по последовательности сделок ---
+# Метрики бэктеста - одна реализация истории. Здесь из PnL сделок (trades_df бэктеста,
+# backtest_strategy(..., return_trades=True)) строятся тысячи альтернативных последовательностей:
+#   * bootstrap - сделки выбираются с возвращением (другой состав сделок той же стратегии);
+#   * shuffle   - те же сделки в случайном порядке (доходность та же, меняется просадка).
+# Все пути - одна матрица (пути x сделки): капитал - cumprod по оси сделок, просадка -
+# maximum.accumulate по той же оси, без цикла по путям. Большие матрицы считаются
+# блоками строк (MC_MAX_CELLS ячеек), чтобы ограничить память.
+# Результат - перцентили (по умолчанию 5/50/95) доходности, просадки, Шарпа и profit factor.
+# У путей без убыточных сделок profit factor бесконечен: перцентили считаются по конечным
+# значениям, а число таких путей возвращается отдельно (infinite_profit_factor).
+#
+# Пример:
+#   result = backtest_strategy(signal_df, 0.8, 3.5, return_trades=True)
+#   bands = monte_carlo(result["trades_df"], paths=10000)
+#   bands["bootstrap"]["max_drawdown"]  ->  {5: -31.2, 50: -17.5, 95: -10.1}
+import os
+
+import numpy as np
+import pandas as pd
+
+MC_PATHS = int(os.getenv("MC_PATHS", "10000"))
+MC_SEED = int(os.getenv("MC_SEED", "42"))
+MC_MAX_CELLS = int(os.getenv("MC_MAX_CELLS", "20000000"))   # ~160 МБ float64 на блок
+PERCENTILES = (5, 50, 95)
+METHODS = ("bootstrap", "shuffle")
+
+
+def resample(pnl: np.ndarray, paths: int, method: str, rng: np.random.Generator) -> np.ndarray:
+    """Матрица (пути x сделки) PnL сделок, выбранных с возвращением или переставленных."""
+    if method == "bootstrap":
+        return rng.choice(pnl, size=(paths, len(pnl)), replace=True)
+    if method == "shuffle":
+        return rng.permuted(np.broadcast_to(pnl, (paths, len(pnl))), axis=1)
+    raise ValueError(f"Неизвестный метод {method}, доступны: {', '.join(METHODS)}")
+
+
+def path_metrics(matrix: np.ndarray, initial_balance: float = 10000.0) -> dict:
+    """Метрики каждого пути (как backtest_engine.trade_metrics) по матрице PnL сделок, %."""
+    n = matrix.shape[1]
+    equity = initial_balance * np.cumprod(1 + matrix / 100.0, axis=1)
+    # Пик считается и по начальному капиталу (просадка с первой же сделки)
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), initial_balance)
+    max_drawdown = np.minimum(((equity - peak) / peak * 100).min(axis=1), 0.0)
+
+    mean = matrix.mean(axis=1)
+    if n > 1:
+        std = matrix.std(axis=1, ddof=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            sharpe = np.where(std != 0, mean / std * np.sqrt(252), 0.0)
+    else:
+        sharpe = np.zeros(len(matrix))
+
+    gross_profits = np.where(matrix > 0, matrix, 0).sum(axis=1)
+    gross_losses = -np.where(matrix < 0, matrix, 0).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_factor = np.where(gross_losses != 0, gross_profits / gross_losses, np.inf)
+
+    return {
+        "total_return": matrix.sum(axis=1),
+        "compound_return": (equity[:, -1] / initial_balance - 1) * 100,
+        "max_drawdown": max_drawdown,
+        "sharpe_ratio": sharpe,
+        "profit_factor": profit_factor,
+    }
+
+
+def monte_carlo(trades_df: pd.DataFrame,
+                paths: int = MC_PATHS,
+                methods: tuple = METHODS,
+                percentiles: tuple = PERCENTILES,
+                initial_balance: float = 10000.0,
+                seed: int = MC_SEED) -> dict:
+    """
+    Перцентили метрик по paths путям каждого метода:
+    {метод: {метрика: {перцентиль: значение}}, "infinite_profit_factor": число путей без убытков}.
+    Если конечных значений метрики нет, её перцентили - пустой словарь. Без сделок - пустой словарь.
+    """
+    pnl = trades_df["pnl_pct"].to_numpy(dtype=np.float64) if not trades_df.empty else np.array([])
+    if len(pnl) == 0:
+        return {}
+
+    rng = np.random.default_rng(seed)
+    chunk = max(1, MC_MAX_CELLS // len(pnl))
+    bands = {}
+    for method in methods:
+        blocks = [path_metrics(resample(pnl, min(chunk, paths - start), method, rng), initial_balance)
+                  for start in range(0, paths, chunk)]
+        bands[method] = {}
+        for metric in blocks[0]:
+            values = np.concatenate([block[metric] for block in blocks])
+            finite = values[np.isfinite(values)]
+            if metric == "profit_factor":
+                bands[method]["infinite_profit_factor"] = int(len(values) - len(finite))
+            bands[method][metric] = (dict(zip(percentiles, np.round(np.percentile(finite, percentiles), 2).tolist()))
+                                     if len(finite) else {})
+    return bands
+
+
+def format_bands(bands: dict, paths: int = MC_PATHS) -> str:
+    """Строки для отчёта в Telegram: коридор между крайними перцентилями и медиана."""
+    if not bands:
+        return ""
+    lines = [f"🎲 *Монте-Карло* ({paths} путей)"]
+    for method, label in (("bootstrap", "бутстрап"), ("shuffle", "перестановки")):
+        if method not in bands:
+            continue
+        for metric, title in (("total_return", "доходность"), ("max_drawdown", "просадка")):
+            if method == "shuffle" and metric == "total_return":
+                continue   # у перестановок сумма PnL не меняется
+            band = bands[method][metric]
+            low, mid, high = band[min(band)], band[sorted(band)[len(band) // 2]], band[max(band)]
+            lines.append(f"{title} ({label}, {min(band)}-{max(band)}%): `{low:.2f}% … {high:.2f}%`, медиана `{mid:.2f}%`")
+    return "\n".join(lines)
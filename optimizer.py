@@ -0,0 +1,270 @@
+# --- Подбор параметров стратегий по сетке ---
+# Стратегия объявляет сетку своих параметров в модуле:
+#   PARAM_GRID = {"fast": [3, 5, 8], "slow": [20, 40]}
+# (значения передаются в trading_strategy(df, **params)). Для каждой комбинации
+# сигналы считаются один раз, вся сетка SL/TP (доли цены, как в sl_tp_setter) оценивается
+# на них за один проход backtest_engine.sweep_sl_tp.
+# Комбинации считаются в пуле процессов; котировки передаются воркерам один раз
+# при запуске (при fork - общие страницы памяти), а не с каждой задачей.
+# Результаты ранжируются по выбранной метрике backtest_strategy и дописываются в test.<таблица>.
+# Уже посчитанные прогоны берутся из кэша бэктеста (backtest_cache.py, как в strategy_stat).
+#
+# Пример:
+#   python optimizer.py --strategies macd_hist candles --metric sharpe_ratio --workers 4
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import pandas as pd
+
+from strategy_stat import (REGISTRY, TABLE_MD, SYMBOL, TIMEFRAME, BACKTEST_SETTINGS, BACKTEST_CACHE,
+                           engine, fetch_market_data)
+from backtest_engine import sweep_sl_tp
+from backtest_cache import cache_key, data_fingerprint
+from market_data import assert_float_ohlcv
+from db import dispose
+
+# ============================================================
+# 1. Конфигурация
+# ============================================================
+OPTIMIZER_WORKERS = int(os.getenv("OPTIMIZER_WORKERS", str(os.cpu_count() or 1)))
+RESULTS_TABLE = "optimizer_results"   # в схеме test
+SIGNAL_SCHEMA = "test"
+
+# Сетка SL/TP по умолчанию (доли от цены входа)
+SL_GRID = [0.004, 0.006, 0.008, 0.011, 0.015, 0.02]
+TP_GRID = [0.015, 0.025, 0.035, 0.04, 0.05, 0.07]
+
+METRICS = ["total_return", "win_rate", "total_trades", "avg_trade",
+           "sharpe_ratio", "max_drawdown", "profit_factor"]
+
+# Котировки и их отпечаток для кэша в воркере (заполняются в _init_worker)
+_DATA = None
+_FINGERPRINT = None
+
+
+# ============================================================
+# 2. Сетка параметров
+# ============================================================
+def param_combinations(grid: dict) -> list:
+    """Все комбинации сетки {параметр: [значения]}; пустая сетка - одна комбинация без параметров."""
+    if not grid:
+        return [{}]
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def build_tasks(strategies: dict, sl_grid: list, tp_grid: list) -> list:
+    tasks = []
+    for info in strategies.values():
+        grid = getattr(info.module, "PARAM_GRID", None) or {}
+        for params in param_combinations(grid):
+            tasks.append((info.path, params, sl_grid, tp_grid))
+    return tasks
+
+
+# ============================================================
+# 3. Расчёт в воркерах
+# ============================================================
+def _init_worker(data, fingerprint):
+    """Инициализация процесса-воркера: котировки передаются один раз и только читаются."""
+    # Унаследованный пул соединений сбрасывается в db._reset_after_fork
+    global _DATA, _FINGERPRINT
+    _DATA = data
+    _FINGERPRINT = fingerprint
+
+
+def evaluate_combination(data: pd.DataFrame,
+                         fingerprint: dict,
+                         path: str,
+                         params: dict,
+                         sl_grid: list,
+                         tp_grid: list) -> tuple:
+    """
+    Сигналы стратегии с параметрами params и метрики по всем парам SL/TP.
+    Возвращает (строки результатов, число прогонов из кэша).
+    Если все пары SL/TP есть в кэше, сигналы не считаются.
+    """
+    info = REGISTRY.load(path)
+    pairs = list(itertools.product(sl_grid, tp_grid))
+
+    results = {}
+    keys = {}
+    if BACKTEST_CACHE is not None:
+        for stop_loss, take_profit in pairs:
+            key = cache_key(info.source_hash, params, stop_loss * 100, take_profit * 100,
+                            BACKTEST_SETTINGS, fingerprint)
+            keys[(stop_loss, take_profit)] = key
+            cached = BACKTEST_CACHE.get(key)
+            if cached is not None:
+                results[(stop_loss, take_profit)] = cached["result"]
+    hits = len(results)
+
+    missing = [pair for pair in pairs if pair not in results]
+    if missing:
+        signal_df = info.module.trading_strategy(data, **params)
+        # Касания всех уровней SL/TP считаются за один проход (ExitIndex)
+        swept = sweep_sl_tp(signal_df, [(sl * 100, tp * 100) for sl, tp in missing], **BACKTEST_SETTINGS)
+        for stop_loss, take_profit in missing:
+            result = swept[(stop_loss * 100, take_profit * 100)]
+            results[(stop_loss, take_profit)] = result
+            if BACKTEST_CACHE is not None:
+                BACKTEST_CACHE.put(keys[(stop_loss, take_profit)], {"result": result})
+
+    rows = []
+    for stop_loss, take_profit in pairs:
+        result = results[(stop_loss, take_profit)]
+        rows.append({
+            "strategy": info.name,
+            "params": json.dumps(params, sort_keys=True),
+            "stop_loss": stop_loss,
+            "take_profit": take_profit,
+            **{metric: result[metric] for metric in METRICS},
+        })
+    return rows, hits
+
+
+def _evaluate_in_worker(task):
+    """
+    Выполняется в воркере. Исключения не пробрасываются наружу,
+    чтобы ошибка одной комбинации не останавливала перебор.
+    """
+    path, params, sl_grid, tp_grid = task
+    try:
+        rows, hits = evaluate_combination(_DATA, _FINGERPRINT, path, params, sl_grid, tp_grid)
+        return {"status": "ok", "rows": rows, "hits": hits}
+    except Exception:
+        return {"status": "error", "error": traceback.format_exc()}
+
+
+def run_grid(data: pd.DataFrame, tasks: list, workers: int) -> pd.DataFrame:
+    fingerprint = data_fingerprint(data, TABLE_MD)
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(processes=min(workers, len(tasks)),
+                                  initializer=_init_worker, initargs=(data, fingerprint)) as pool:
+            results = pool.imap_unordered(_evaluate_in_worker, tasks)
+            rows = _collect(results, tasks)
+    else:
+        _init_worker(data, fingerprint)
+        rows = _collect(map(_evaluate_in_worker, tasks), tasks)
+    return pd.DataFrame(rows, columns=["strategy", "params", "stop_loss", "take_profit"] + METRICS)
+
+
+def _collect(results, tasks) -> list:
+    rows = []
+    hits = 0
+    for done, result in enumerate(results, start=1):
+        if result["status"] != "ok":
+            print(f"[ERROR] комбинация завершилась с ошибкой\n{result['error']}")
+            continue
+        rows.extend(result["rows"])
+        hits += result["hits"]
+        if done % 10 == 0 or done == len(tasks):
+            print(f"Посчитано комбинаций: {done}/{len(tasks)}")
+    if BACKTEST_CACHE is not None:
+        print(f"Прогонов из кэша бэктеста: {hits} из {len(rows)}")
+    return rows
+
+
+# ============================================================
+# 4. Ранжирование и сохранение
+# ============================================================
+def rank_results(results: pd.DataFrame, metric: str, min_trades: int = 0) -> pd.DataFrame:
+    """
+    Ранг комбинации внутри стратегии по метрике (1 - лучшая, больше - лучше;
+    у max_drawdown значения отрицательные, поэтому тоже). Комбинации меньше
+    чем с min_trades сделками не ранжируются (rank = NaN).
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Неизвестная метрика {metric}, доступны: {', '.join(METRICS)}")
+    results = results.copy()
+    results["metric"] = metric
+    eligible = results["total_trades"] >= min_trades
+    results["rank"] = (results[metric].where(eligible)
+                       .groupby(results["strategy"])
+                       .rank(ascending=False, method="first"))
+    return results.sort_values(["strategy", "rank"], na_position="last", kind="stable").reset_index(drop=True)
+
+
+def save_results(results: pd.DataFrame, table_name: str = RESULTS_TABLE) -> int:
+    results.to_sql(name=table_name
+                  ,schema=SIGNAL_SCHEMA
+                  ,con=engine
+                  ,if_exists="append"
+                  ,index=False)
+    return len(results)
+
+
+def print_top(results: pd.DataFrame, top: int):
+    for strategy, group in results.groupby("strategy", sort=True):
+        print(f"----------------{strategy}-----------------")
+        best = group[group["rank"] <= top]
+        columns = ["rank", "params", "stop_loss", "take_profit"] + METRICS
+        print(best[columns].to_string(index=False) if not best.empty else "нет комбинаций с достаточным числом сделок")
+        if not best.empty:
+            row = best.iloc[0]
+            print(f'лучшие SL/TP: "{strategy}": {{"sl": {row.stop_loss},  "tp": {row.take_profit}}}')
+
+
+def select_strategies(names: list = None) -> dict:
+    """Стратегии реестра по именам (None или пустой список - все)."""
+    strategies = REGISTRY.discover()
+    if names:
+        unknown = set(names) - set(strategies)
+        if unknown:
+            raise SystemExit(f"Стратегии не найдены: {', '.join(sorted(unknown))}")
+        strategies = {name: info for name, info in strategies.items() if name in names}
+    return strategies
+
+
+def _float_list(value: str) -> list:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров стратегий и SL/TP по сетке")
+    parser.add_argument("--strategies", nargs="*", default=None, help="имена стратегий (по умолчанию - все)")
+    parser.add_argument("--metric", default="sharpe_ratio", choices=METRICS)
+    parser.add_argument("--min-trades", type=int, default=10, help="минимум сделок для попадания в рейтинг")
+    parser.add_argument("--sl", type=_float_list, default=SL_GRID, help="сетка стоп-лосса, доли через запятую")
+    parser.add_argument("--tp", type=_float_list, default=TP_GRID, help="сетка тейк-профита, доли через запятую")
+    parser.add_argument("--workers", type=int, default=OPTIMIZER_WORKERS)
+    parser.add_argument("--top", type=int, default=5)
+    parser.add_argument("--table", default=RESULTS_TABLE, help=f"таблица результатов в схеме {SIGNAL_SCHEMA}")
+    parser.add_argument("--no-save", action="store_true", help="не записывать результаты в БД")
+    args = parser.parse_args()
+
+    strategies = select_strategies(args.strategies)
+    data = assert_float_ohlcv(fetch_market_data(TABLE_MD, SYMBOL, TIMEFRAME), TABLE_MD)
+    tasks = build_tasks(strategies, args.sl, args.tp)
+    print(f"Стратегий: {len(strategies)}, комбинаций параметров: {len(tasks)}, "
+          f"пар SL/TP: {len(args.sl) * len(args.tp)}, баров: {len(data)}")
+
+    started = time.perf_counter()
+    results = run_grid(data, tasks, args.workers)
+    print(f"[TIME] Перебор за {time.perf_counter() - started:.1f} с ({len(results)} прогонов)")
+
+    results = rank_results(results, args.metric, args.min_trades)
+    results["run_at"] = pd.Timestamp.now(tz="UTC")
+    results["data_start"] = data.index.min()
+    results["data_end"] = data.index.max()
+
+    print_top(results, args.top)
+
+    if not args.no_save and not results.empty:
+        saved = save_results(results, args.table)
+        print(f"Сохранено строк в {SIGNAL_SCHEMA}.{args.table}: {saved}")
+
+    if BACKTEST_CACHE is not None:
+        print(f"Удалено старых записей кэша бэктеста: {BACKTEST_CACHE.evict()}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        dispose()
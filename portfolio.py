@@ -0,0 +1,341 @@
+# --- Портфельный бэктест: все стратегии на одном счёте ---
+# Стратегии (каждая - на своём символе) проходят одну общую шкалу времени, как в бою,
+# где все сигналы исполняет один TradeExecutor:
+#   * по символу не больше одной позиции (как _position_exists): сигнал стратегии,
+#     пока символ занят другой, пропускается; при одновременных сигналах входит
+#     стратегия, стоящая раньше в списке;
+#   * на сделку выделяется доля weight текущего капитала, суммарно открытые позиции
+#     не больше капитала x max_leverage (как _check_margin), иначе вход пропускается;
+#   * выход - по SL/TP или развороту сигнала стратегии-владельца, как в backtest_engine.
+# Состояние меняется только на входах и выходах: по матрице сигналов (бары x стратегии)
+# заранее считается ближайший бар, где хоть одна стратегия символа хочет войти,
+# поэтому цикл идёт по событиям, а не по барам и стратегиям.
+# Доля на вход считается от капитала по закрытым сделкам; кривая капитала и просадка -
+# с переоценкой открытых позиций по close каждого бара (как если бы их закрыли на нём).
+#
+# Пример:
+#   python portfolio.py --weights macd_hist=0.3,candles=0.2 --max-leverage 1
+#   python strategy_stat.py --portfolio
+import argparse
+import heapq
+import os
+
+import numpy as np
+import pandas as pd
+
+from strategy_stat import TABLE_MD, TIMEFRAME, BACKTEST_SETTINGS, NOTIFIER, fetch_market_data
+from optimizer import select_strategies
+from backtest_engine import REASONS, END_OF_DATA, next_index, resolve_exit, trade_pnl_pct, trade_metrics
+from market_data import assert_float_ohlcv
+from db import dispose
+
+# ============================================================
+# 1. Конфигурация
+# ============================================================
+PORTFOLIO_MAX_LEVERAGE = float(os.getenv("PORTFOLIO_MAX_LEVERAGE", "1.0"))
+PORTFOLIO_TIMEFRAME = os.getenv("PORTFOLIO_TIMEFRAME", TIMEFRAME)
+
+OHLC_COLUMNS = ["open", "high", "low", "close"]
+# Порядок событий на одном баре: сначала выходы (освобождают символ и маржу), затем входы
+_EXIT, _ENTRY = 0, 1
+
+
+# ============================================================
+# 2. Матрица сигналов
+# ============================================================
+def signal_matrix(signal_dfs: list, index: pd.DatetimeIndex) -> np.ndarray:
+    """Сигналы стратегий на общей шкале времени (бары x стратегии); бары без сигнала - 0."""
+    if not signal_dfs:
+        return np.zeros((len(index), 0), dtype=np.int64)
+    return np.column_stack([df["signal"].reindex(index).fillna(0).to_numpy(dtype=np.int64)
+                            for df in signal_dfs])
+
+
+# ============================================================
+# 3. Бэктест
+# ============================================================
+def portfolio_backtest(markets: dict,
+                       signals: np.ndarray,
+                       names: list,
+                       symbols: list,
+                       stop_loss_pcts: list,
+                       take_profit_pcts: list,
+                       weights: list,
+                       initial_balance: float = 10000.0,
+                       trade_size: float = 1.0,
+                       commission_pct: float = 0.1,
+                       slippage_pct: float = 0.005,
+                       max_leverage: float = PORTFOLIO_MAX_LEVERAGE) -> dict:
+    """
+    markets - {символ: OHLC на общей шкале}, signals - матрица (бары x стратегии),
+    names/symbols/stop_loss_pcts/take_profit_pcts/weights - по стратегиям (столбцам матрицы).
+    Возвращает trades, equity (капитал по барам), strategies (разбивка по стратегиям) и summary.
+    """
+    index = next(iter(markets.values())).index if markets else pd.DatetimeIndex([])
+    n = len(index)
+
+    # Сигнал предыдущего бара исполняется на open текущего
+    prev_signal = np.zeros_like(signals)
+    prev_signal[1:] = signals[:-1]
+
+    books = {}
+    for symbol, market in markets.items():
+        columns = np.array([k for k, s in enumerate(symbols) if s == symbol], dtype=np.int64)
+        open_, high, low, close = (market[c].to_numpy(dtype=np.float64) for c in OHLC_COLUMNS)
+        # Общая шкала - объединение баров всех символов: в пропусках символа котировок нет (NaN).
+        # Сигнал исполняется на следующем баре самого символа, а не на пропуске
+        bars = np.flatnonzero(~np.isnan(open_))
+        prev_signal[:, columns] = 0
+        prev_signal[bars[1:, None], columns] = signals[bars[:-1, None], columns]
+        books[symbol] = {
+            "columns": columns,
+            # Позиция в конце данных закрывается по последнему известному close символа
+            "prices": [open_, high, low, pd.Series(close).ffill().to_numpy()],
+            # ближайший бар, где хоть одна стратегия символа хочет войти
+            "next_entry": next_index((prev_signal[:, columns] != 0).any(axis=1)),
+            "position": None,
+        }
+    next_reversal = [{1: next_index(prev_signal[:, k] == -1), -1: next_index(prev_signal[:, k] == 1)}
+                     for k in range(signals.shape[1])]
+
+    equity = initial_balance
+    allocated = 0.0
+    margin_skips = np.zeros(signals.shape[1], dtype=np.int64)
+    trades = []
+    events = []
+    sequence = 0
+    for symbol, book in books.items():
+        if n:
+            heapq.heappush(events, (int(book["next_entry"][0]), _ENTRY, sequence, symbol))
+            sequence += 1
+
+    while events:
+        bar, kind, _, symbol = heapq.heappop(events)
+        if bar >= n:
+            continue
+        book = books[symbol]
+        open_, high, low, close = book["prices"]
+
+        if kind == _EXIT:
+            trade = book["position"]
+            book["position"] = None
+            pnl_pct = trade_pnl_pct(np.array([trade["entry_price"]]), np.array([trade["exit_price"]]),
+                                    np.array([trade["side"]]), trade_size, commission_pct, slippage_pct)[0]
+            trade["pnl_pct"] = pnl_pct
+            trade["pnl"] = trade["allocation"] * pnl_pct / 100.0
+            trade["return_pct"] = trade["pnl"] / equity * 100.0   # вклад в капитал счёта
+            equity += trade["pnl"]
+            allocated -= trade["allocation"]
+            trade["equity"] = equity
+            trades.append(trade)
+            if trade["reason"] != REASONS[END_OF_DATA]:
+                # Новый вход возможен на том же баре, где закрылась позиция
+                heapq.heappush(events, (int(book["next_entry"][bar]), _ENTRY, sequence, symbol))
+                sequence += 1
+            continue
+
+        # Вход: кандидаты - стратегии символа с сигналом на этом баре, по порядку списка
+        chosen = None
+        for k in book["columns"][prev_signal[bar, book["columns"]] != 0]:
+            allocation = weights[k] * equity
+            if allocated + allocation > equity * max_leverage:
+                margin_skips[k] += 1
+                continue
+            chosen = k
+            break
+
+        if chosen is None:
+            heapq.heappush(events, (int(book["next_entry"][bar + 1]), _ENTRY, sequence, symbol))
+            sequence += 1
+            continue
+
+        side = int(prev_signal[bar, chosen])
+        exit_idx, exit_price, reason = resolve_exit(open_, high, low, close, bar, side,
+                                                    next_reversal[chosen][side][bar + 1],
+                                                    stop_loss_pcts[chosen], take_profit_pcts[chosen])
+        allocated += allocation
+        book["position"] = {"strategy": names[chosen], "column": int(chosen), "symbol": symbol,
+                            "entry_idx": bar, "exit_idx": int(exit_idx),
+                            "entry_price": open_[bar], "exit_price": exit_price, "side": side,
+                            "reason": REASONS[reason], "allocation": allocation}
+        heapq.heappush(events, (int(exit_idx), _EXIT, sequence, symbol))
+        sequence += 1
+
+    trades_df = pd.DataFrame(trades, columns=["strategy", "column", "symbol", "entry_idx", "exit_idx",
+                                              "entry_price", "exit_price", "side", "reason", "allocation",
+                                              "pnl_pct", "pnl", "return_pct", "equity"])
+    trades_df.insert(0, "entry_time", index[trades_df["entry_idx"].to_numpy(dtype=np.int64)])
+    trades_df.insert(1, "exit_time", index[trades_df["exit_idx"].to_numpy(dtype=np.int64)])
+
+    # Капитал по барам: закрытые сделки (меняется на барах выхода) + переоценка открытых по close
+    equity_curve = np.full(n, np.nan)
+    if n:
+        equity_curve[0] = initial_balance
+        equity_curve[trades_df["exit_idx"].to_numpy(dtype=np.int64)] = trades_df["equity"].to_numpy()
+    realized = pd.Series(equity_curve, index=index).ffill().to_numpy()
+    equity_series = pd.Series(realized + _unrealized_pnl(trades_df, books, n, trade_size, commission_pct,
+                                                         slippage_pct), index=index, name="equity")
+    drawdown = equity_series / equity_series.cummax() - 1
+
+    strategies = _strategy_breakdown(trades_df, prev_signal, books, names, n, margin_skips, initial_balance)
+    metrics = trade_metrics(trades_df[["return_pct"]].rename(columns={"return_pct": "pnl_pct"}), initial_balance)
+    summary = {
+        "final_equity": round(float(equity), 2),
+        "total_return": round(float(equity / initial_balance - 1) * 100, 2),
+        "max_drawdown": round(float(drawdown.min()) * 100, 2) if n else 0.0,
+        "total_trades": len(trades_df),
+        "win_rate": float(metrics["win_rate"]),
+        "sharpe_ratio": float(metrics["sharpe_ratio"]),
+        "profit_factor": float(metrics["profit_factor"]),
+    }
+    return {"trades": trades_df, "equity": equity_series, "drawdown": drawdown,
+            "strategies": strategies, "summary": summary}
+
+
+def _unrealized_pnl(trades_df: pd.DataFrame, books: dict, n: int,
+                    trade_size: float, commission_pct: float, slippage_pct: float) -> np.ndarray:
+    """PnL открытых позиций по close каждого бара [вход, выход) в деньгах счёта."""
+    unrealized = np.zeros(n)
+    for symbol, book in books.items():
+        trades = trades_df[trades_df["symbol"] == symbol]
+        if trades.empty:
+            continue
+        close = book["prices"][3]   # в пропусках символа - последний известный close
+        entry_idx = trades["entry_idx"].to_numpy(dtype=np.int64)
+        durations = trades["exit_idx"].to_numpy(dtype=np.int64) - entry_idx
+        trade_of_bar = np.repeat(np.arange(len(trades)), durations)
+        bars = entry_idx[trade_of_bar] + (np.arange(len(trade_of_bar)) - np.repeat(np.cumsum(durations) - durations, durations))
+        pnl_pct = trade_pnl_pct(trades["entry_price"].to_numpy(dtype=np.float64)[trade_of_bar], close[bars],
+                                trades["side"].to_numpy(dtype=np.int64)[trade_of_bar],
+                                trade_size, commission_pct, slippage_pct)
+        pnl = trades["allocation"].to_numpy(dtype=np.float64)[trade_of_bar] * pnl_pct / 100.0
+        np.add.at(unrealized, bars, np.nan_to_num(pnl))
+    return unrealized
+
+
+def _strategy_breakdown(trades_df: pd.DataFrame, prev_signal: np.ndarray, books: dict, names: list,
+                        n: int, margin_skips: np.ndarray, initial_balance: float) -> pd.DataFrame:
+    """Сделки, вклад в капитал и пропущенные сигналы по каждой стратегии."""
+    # Владелец позиции по символу на каждом баре [вход, выход): сигналы других стратегий пропускаются
+    blocked = np.zeros(prev_signal.shape[1], dtype=np.int64)
+    for symbol, book in books.items():
+        owner = np.full(n, -1, dtype=np.int64)
+        for trade in trades_df[trades_df["symbol"] == symbol].itertuples(index=False):
+            owner[trade.entry_idx:trade.exit_idx] = trade.column
+        for k in book["columns"]:
+            blocked[k] = np.count_nonzero((prev_signal[:, k] != 0) & (owner != -1) & (owner != k))
+
+    grouped = trades_df.groupby("column")
+    rows = []
+    for k, name in enumerate(names):
+        group = grouped.get_group(k) if k in grouped.groups else trades_df.iloc[:0]
+        rows.append({
+            "strategy": name,
+            "trades": len(group),
+            "win_rate": round((group["pnl_pct"] > 0).mean() * 100, 1) if len(group) else 0.0,
+            "pnl": round(group["pnl"].sum(), 2),
+            "contribution_pct": round(group["pnl"].sum() / initial_balance * 100, 2),
+            "blocked_signals": int(blocked[k]),
+            "margin_skips": int(margin_skips[k]),
+        })
+    return pd.DataFrame(rows)
+
+
+# ============================================================
+# 4. Запуск по стратегиям реестра
+# ============================================================
+def run_portfolio(strategies: dict, data: pd.DataFrame, symbols: list, timeframe: str,
+                  weights: dict = None, max_leverage: float = PORTFOLIO_MAX_LEVERAGE) -> dict:
+    """Сигналы всех стратегий по всем символам и портфельный бэктест на общей шкале времени."""
+    weights = weights or {}
+    frames = {}
+    for symbol in symbols:
+        frame = data
+        if "symbol" in data.columns:
+            frame = data[(data["symbol"] == symbol) & (data["timeframe"] == timeframe)]
+        if frame.empty:
+            raise SystemExit(f"Нет котировок {symbol} {timeframe} в {TABLE_MD}")
+        frames[symbol] = frame
+
+    index = frames[symbols[0]].index
+    for frame in list(frames.values())[1:]:
+        index = index.union(frame.index)
+    markets = {symbol: frame[OHLC_COLUMNS].reindex(index) for symbol, frame in frames.items()}
+
+    names, sleeve_symbols, signal_dfs, stop_losses, take_profits, sleeve_weights = [], [], [], [], [], []
+    for symbol in symbols:
+        for info in strategies.values():
+            name = info.name if len(symbols) == 1 else f"{info.name}@{symbol}"
+            names.append(name)
+            sleeve_symbols.append(symbol)
+            signal_dfs.append(info.module.trading_strategy(frames[symbol]))
+            stop_losses.append(info.stop_loss * 100)
+            take_profits.append(info.take_profit * 100)
+            sleeve_weights.append(weights.get(name, weights.get(info.name, BACKTEST_SETTINGS["trade_size"])))
+
+    return portfolio_backtest(markets, signal_matrix(signal_dfs, index), names, sleeve_symbols,
+                              stop_losses, take_profits, sleeve_weights,
+                              initial_balance=BACKTEST_SETTINGS["initial_balance"],
+                              trade_size=BACKTEST_SETTINGS["trade_size"],
+                              commission_pct=BACKTEST_SETTINGS["commission_pct"],
+                              slippage_pct=BACKTEST_SETTINGS["slippage_pct"],
+                              max_leverage=max_leverage)
+
+
+def _weights(value: str) -> dict:
+    """"macd_hist=0.3,candles=0.2" -> {"macd_hist": 0.3, "candles": 0.2}"""
+    weights = {}
+    for item in value.split(","):
+        if item.strip():
+            name, weight = item.split("=", 1)
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Портфельный бэктест всех стратегий на одном счёте")
+    parser.add_argument("--strategies", nargs="*", default=None, help="имена стратегий в порядке приоритета")
+    parser.add_argument("--symbols", nargs="*", default=None, help="символы (по умолчанию - все в таблице)")
+    parser.add_argument("--timeframe", default=PORTFOLIO_TIMEFRAME)
+    parser.add_argument("--weights", type=_weights, default={},
+                        help="доли капитала на сделку: имя=доля через запятую "
+                             f"(по умолчанию {BACKTEST_SETTINGS['trade_size']})")
+    parser.add_argument("--max-leverage", type=float, default=PORTFOLIO_MAX_LEVERAGE)
+    parser.add_argument("--no-notify", action="store_true", help="не отправлять сводку в Telegram")
+    args = parser.parse_args(argv)
+
+    strategies = select_strategies(args.strategies)
+    if args.strategies:
+        strategies = {name: strategies[name] for name in args.strategies}
+    # Все пары одного таймфрейма (свёрнутые свечи других таймфреймов не попадают)
+    data = assert_float_ohlcv(fetch_market_data(TABLE_MD, symbol=None, timeframe=args.timeframe), TABLE_MD)
+    symbols = args.symbols or sorted(data["symbol"].unique())
+
+    result = run_portfolio(strategies, data, symbols, args.timeframe, args.weights, args.max_leverage)
+    summary = result["summary"]
+
+    print("----------------portfolio-----------------")
+    print(result["strategies"].to_string(index=False))
+    print(", ".join(f"{key}: {value}" for key, value in summary.items()))
+
+    start_date, end_date = result["equity"].index.min(), result["equity"].index.max()
+    msg = (
+        f"📊 *Портфель* ({len(result['strategies'])} стратегий, {', '.join(symbols)})\n\n"
+        f"📅 *Период:* `{start_date.strftime('%Y-%m-%d')}` - `{end_date.strftime('%Y-%m-%d')}`\n"
+        f"💰 *Доходность:* `{summary['total_return']:.2f}%`\n"
+        f"📉 *Макс. просадка:* `{summary['max_drawdown']:.2f}%`\n"
+        f"🔄 *Всего сделок:* `{summary['total_trades']}`\n"
+        f"🎯 *Win-rate:* `{summary['win_rate']:.1f}%`\n"
+        f"⚖️ *Коэффициент Шарпа:* `{summary['sharpe_ratio']:.3f}`"
+    )
+    if not args.no_notify:
+        NOTIFIER.notify(msg)
+    return result
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        NOTIFIER.close()
+        dispose()
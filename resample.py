@@ -0,0 +1,102 @@
+# --- Старшие таймфреймы из базовых свечей (1h -> 4h, 1d, 1w ...) ---
+# Свечи строятся из уже сохранённых в БД базовых баров, без запросов к бирже.
+# Интервалы выравниваются от начала эпохи UTC (недели - от понедельника), как у бирж.
+import pandas as pd
+
+from signal_store import save_signal_df
+
+OHLCV_AGG = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+EPOCH = pd.Timestamp("1970-01-01", tz="UTC")
+# 1970-01-01 - четверг, недельные свечи на биржах начинаются с понедельника
+WEEK_ORIGIN = pd.Timestamp("1970-01-05", tz="UTC")
+
+
+def timeframe_delta(timeframe: str) -> pd.Timedelta:
+    """Длительность таймфрейма ccxt ("1h", "4h", "1d", "1w"). Месячные свечи не поддерживаются."""
+    if timeframe.endswith("M"):
+        raise ValueError(f"Таймфрейм {timeframe} не имеет фиксированной длины")
+    return pd.Timedelta(timeframe)
+
+
+def bucket_start(timestamps, timeframe: str):
+    """Начало интервала timeframe, в который попадает каждое время (UTC)."""
+    delta = timeframe_delta(timeframe)
+    origin = WEEK_ORIGIN if delta % pd.Timedelta("7D") == pd.Timedelta(0) else EPOCH
+    return origin + ((timestamps - origin) // delta) * delta
+
+
+def last_closed_bar(timeframe: str, now: pd.Timestamp = None) -> pd.Timestamp:
+    """Время открытия последней закрытой свечи timeframe (для 1h - предыдущий полный час)."""
+    now = pd.Timestamp.now(tz="UTC") if now is None else pd.Timestamp(now).tz_convert("UTC")
+    return bucket_start(now, timeframe) - timeframe_delta(timeframe)
+
+
+def resample_ohlcv(df: pd.DataFrame,
+                   timeframe: str,
+                   base_timeframe: str = "1h",
+                   complete_only: bool = True) -> pd.DataFrame:
+    """
+    Свечи timeframe из базовых свечей df (индекс timestamp UTC, колонки OHLCV).
+
+    open - первая, high/low - экстремумы, close - последняя, volume - сумма.
+    complete_only=True - только закрытые интервалы: начало интервала не раньше
+    первого базового бара и конец не позже закрытия последнего.
+    """
+    delta = timeframe_delta(timeframe)
+    base_delta = timeframe_delta(base_timeframe)
+    if delta < base_delta or delta % base_delta != pd.Timedelta(0):
+        raise ValueError(f"{timeframe} должен быть кратен базовому таймфрейму {base_timeframe}")
+    if delta == base_delta or df.empty:
+        return df
+
+    buckets = bucket_start(df.index, timeframe)
+    result = df[list(OHLCV_AGG)].groupby(buckets).agg(OHLCV_AGG)
+    result.index.name = df.index.name
+
+    if complete_only:
+        result = result[(result.index >= df.index[0])
+                        & (result.index + delta <= df.index[-1] + base_delta)]
+
+    if "symbol" in df.columns:
+        result["symbol"] = df["symbol"].iloc[-1]
+    if "timeframe" in df.columns:
+        result["timeframe"] = timeframe
+    return result
+
+
+class OhlcvResampler:
+    """
+    Инкрементальная версия resample_ohlcv для долгоживущего процесса (runner --daemon).
+    update() пересчитывает только интервалы после последнего закрытого,
+    результат совпадает с resample_ohlcv на том же окне базовых свечей.
+    """
+
+    def __init__(self, timeframe: str, base_timeframe: str = "1h"):
+        self.timeframe = timeframe
+        self.base_timeframe = base_timeframe
+        self.delta = timeframe_delta(timeframe)
+        self.base_delta = timeframe_delta(base_timeframe)
+        self.frame = None
+
+    def update(self, base: pd.DataFrame) -> pd.DataFrame:
+        reusable = (self.frame is not None and not self.frame.empty and not base.empty
+                    and base.index[0] <= self.frame.index[-1] + self.delta)
+        if not reusable:
+            self.frame = resample_ohlcv(base, self.timeframe, self.base_timeframe)
+            return self.frame
+
+        # Закрытые интервалы уже посчитаны, пересчитываем только новые
+        # (начало первого нового интервала уже выровнено, проверяем только его закрытие)
+        start = self.frame.index[-1] + self.delta
+        tail = resample_ohlcv(base[base.index >= start], self.timeframe, self.base_timeframe,
+                              complete_only=False)
+        tail = tail[tail.index + self.delta <= base.index[-1] + self.base_delta]
+        frame = pd.concat([self.frame, tail]) if not tail.empty else self.frame
+        # Окно базовых свечей сдвигается - отбрасываем интервалы, начавшиеся до него
+        self.frame = frame[frame.index >= base.index[0]]
+        return self.frame
+
+
+def materialize(df: pd.DataFrame, engine, table_name: str) -> int:
+    """Сохраняет построенные свечи в test.<table_name> (upsert по timestamp)."""
+    return save_signal_df(df, table_name, engine, mode="upsert")
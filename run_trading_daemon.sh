@@ -0,0 +1,18 @@
+#!/usr/bin/env bash
+set -euo pipefail
+
+PROJECT_DIR="/home/appuser/trading-bot"
+
+# --- Подгружаем переменные из .env ---
+if [[ -f "${PROJECT_DIR}/.env" ]]; then
+export $(grep -v '^#' "${PROJECT_DIR}/.env" | xargs)
+fi
+
+# --- Переходим в каталог проекта ---
+cd "${PROJECT_DIR}"
+
+# --- Активируем виртуальное окружение ---
+source "${PROJECT_DIR}/venv/bin/activate"
+
+# --- Запускаем runner в режиме демона (стратегии считаются по NOTIFY от load_main.py) ---
+exec python "${PROJECT_DIR}/runner.py" --daemon
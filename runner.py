@@ -1,12 +1,24 @@
 from hist_data import fetch_data
-from tg_notification import send_telegram_message
+from tg_notification import TelegramNotifier
 from sl_tp_setter import get_sl_tp_val
+from signal_store import save_signal_df
+from indicators import run_online
+from strategy_registry import StrategyRegistry
+from market_cache import MarketDataCache
+from market_data import fetch_ohlcv, assert_float_ohlcv
+from resample import OhlcvResampler, last_closed_bar, materialize, timeframe_delta
+from db import get_engine, pooled_connection, connect, dispose
 
 import os
-import importlib.util
+import json
+import time
+import select
+import argparse
+import signal
+import traceback
+import multiprocessing
 import psycopg2
-from sqlalchemy import create_engine, text
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import pytz
 import pandas as pd
 
@@ -15,206 +27,541 @@ import pandas as pd
 # ============================================================
 # 1. Конфигурация окружения
 # ============================================================
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT= os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
+# Параметры подключения к БД и пула - в config.py
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 # Папка со стратегиями
 STRATEGIES_FOLDER = "strategies"
 SYMBOL = "BTC/USDT"
+# Базовый таймфрейм в БД; стратегия может объявить свой TIMEFRAME ("4h", "1d", "1w"),
+# такие свечи строятся из базовых (resample.py)
 TIMEFRAME = "1h"
 TABLE_MD = "test.btc_usd_t"   # таблица с рыночными данными
+# Запас баров сверх заявленного стратегиями окна (пропуски, незакрытые бары)
+LOOKBACK_MARGIN = 10
+# Число процессов для расчёта стратегий (1 - последовательный запуск)
+RUNNER_WORKERS = int(os.getenv("RUNNER_WORKERS", "1"))
+# Лимит времени на одну стратегию в секундах (0 - без ограничения)
+STRATEGY_TIMEOUT_SEC = int(os.getenv("STRATEGY_TIMEOUT_SEC", "300"))
+# Режим сохранения signal_df_*: upsert - дописываются только новые бары, replace - полная перезапись
+# (для online-индикаторов всегда upsert - они возвращают только новые бары)
+SIGNAL_PERSIST_MODE = os.getenv("SIGNAL_PERSIST_MODE", "upsert")
+# Online-индикаторы: стратегии с create_indicators/update_bar считают только новые бары
+ONLINE_INDICATORS = os.getenv("ONLINE_INDICATORS", "0") == "1"
+# Папка для состояния online-индикаторов между запусками
+STATE_DIR = os.getenv("STATE_DIR", "state")
+# Режим демона: канал LISTEN/NOTIFY (см. PostgresClient.save_market_data)
+MARKET_DATA_CHANNEL = "market_data"
+# Сколько секунд собирать уведомления перед запуском цикла (пачка вставок = один цикл)
+DAEMON_DEBOUNCE_SEC = float(os.getenv("DAEMON_DEBOUNCE_SEC", "2"))
+# Интервал проверки соединения LISTEN при отсутствии уведомлений
+DAEMON_POLL_SEC = float(os.getenv("DAEMON_POLL_SEC", "60"))
+# Папка локального Parquet-кэша котировок (пусто - данные читаются напрямую из БД)
+MARKET_CACHE_DIR = os.getenv("MARKET_CACHE_DIR")
+# Сохранять построенные свечи старших таймфреймов в test.<таблица>_<таймфрейм>
+RESAMPLE_MATERIALIZE = os.getenv("RESAMPLE_MATERIALIZE", "0") == "1"
+
+# Copy-on-Write: стратегии получают общий DataFrame без физического копирования,
+# а любая запись в него внутри стратегии создаёт собственную копию
+pd.set_option("mode.copy_on_write", True)
 
 # ============================================================
 # 2. Подключение к БД Postgres
 # ============================================================
-engine = create_engine(
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
-
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASS,
-    host=DB_HOST,
-    port=DB_PORT
-)
-conn.autocommit = True
-cur = conn.cursor()
+# Общий пул соединений процесса (db.py): чтение данных, signal_df и запись сигналов
+# идут через него, соединения переиспользуются между стратегиями и циклами демона
+engine = get_engine()
 
 # ============================================================
 # 3. Получение последних данных OHLCV из БД
 # ============================================================
-def fetch_market_data(symbol: str, timeframe: str) -> pd.DataFrame:
-    query = text(f"""
-        SELECT *
-        FROM {TABLE_MD}
-        ORDER BY timestamp ASC
-    """)
+def fetch_market_data(symbol: str, timeframe: str, limit: int = None) -> pd.DataFrame:
+    """
+    Загружает OHLCV по инструменту и таймфрейму.
+    limit=None — вся история, иначе только limit последних баров.
+    """
+    if MARKET_CACHE is not None:
+        # Из БД забираются только новые строки, чтение - из локальных Parquet-файлов
+        MARKET_CACHE.refresh(engine, symbol, timeframe)
+        df = MARKET_CACHE.read(symbol, timeframe, limit=limit)
+        return _check_market_data(df, symbol, timeframe, limit)
+
+    since = None
+    if limit is not None:
+        # Нижняя граница по времени с двойным запасом на пропуски в данных,
+        # чтобы БД не сканировала всю историю ради LIMIT
+        since = datetime.now(timezone.utc) - pd.Timedelta(timeframe) * limit * 2
 
-    df = pd.read_sql(query, engine)
+    df = fetch_ohlcv(engine, TABLE_MD, symbol, timeframe, since=since, limit=limit)
+    return _check_market_data(df, symbol, timeframe, limit)
 
+
+def _check_market_data(df: pd.DataFrame, symbol: str, timeframe: str, limit: int = None) -> pd.DataFrame:
     if df.empty:
         raise RuntimeError("❌ Нет данных OHLCV в БД для стратегии!")
 
-    df.set_index("timestamp", inplace=True)
-    return df
+    if limit is not None and len(df) < limit:
+        print(f"[WARN] Получено {len(df)} баров из {limit} запрошенных для {symbol} {timeframe}")
 
+    # Стратегии должны получать float64, а не object/Decimal
+    return assert_float_ohlcv(df, f"{symbol} {timeframe}")
 
-def run_strategy(file):
-    spec = importlib.util.spec_from_file_location("strategy", file)
-    strategy = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(strategy)
 
-    # Загружаем данные от биржи ToDO - переписать чтобы забирали данные из БД по любому таймфрейму
-    data = fetch_market_data(SYMBOL, TIMEFRAME)
+# Локальное зеркало котировок (см. market_cache.py), включается переменной MARKET_CACHE_DIR
+MARKET_CACHE = MarketDataCache(MARKET_CACHE_DIR, TABLE_MD) if MARKET_CACHE_DIR else None
+
+
+# Очередь уведомлений Telegram: отправка идёт в фоновом потоке и не тормозит цикл стратегий
+NOTIFIER = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+
+# Реестр стратегий: модули импортируются один раз и перечитываются только при изменении файла
+REGISTRY = StrategyRegistry(STRATEGIES_FOLDER)
+
+# Кэш рыночных данных на один цикл запуска: (symbol, timeframe) -> DataFrame
+MARKET_DATA_CACHE = {}
+# Сколько баров грузить в цикле: (symbol, timeframe) -> limit (None - вся история)
+MARKET_DATA_LIMIT = {}
+# Время загрузки данных по каждой стратегии: strategy_name -> секунды
+LOAD_STATS = {}
+# Построение старших таймфреймов между циклами: (symbol, timeframe) -> OhlcvResampler
+RESAMPLERS = {}
+
+
+def _load_market_data(symbol: str, timeframe: str) -> pd.DataFrame:
+    """Базовый таймфрейм - из БД, старшие - из базовых свечей кэша цикла."""
+    if timeframe == TIMEFRAME:
+        return fetch_market_data(symbol, timeframe, MARKET_DATA_LIMIT.get((symbol, timeframe)))
+
+    base_key = (symbol, TIMEFRAME)
+    if base_key not in MARKET_DATA_CACHE:
+        MARKET_DATA_CACHE[base_key] = _load_market_data(symbol, TIMEFRAME)
+
+    # Пересчитываются только интервалы, закрывшиеся после прошлого цикла
+    resampler = RESAMPLERS.setdefault((symbol, timeframe), OhlcvResampler(timeframe, TIMEFRAME))
+    data = resampler.update(MARKET_DATA_CACHE[base_key])
+
+    if RESAMPLE_MATERIALIZE:
+        table_name = f"{TABLE_MD.split('.')[-1]}_{timeframe}"
+        print(f"Свечи {symbol} {timeframe} сохранены в {table_name}: {materialize(data, engine, table_name)}")
+    return data
+
+
+def _base_window(info):
+    """Сколько базовых свечей нужно стратегии (None - вся история)."""
+    if info.lookback is None:
+        return None
+    ratio = timeframe_delta(info.timeframe or TIMEFRAME) // timeframe_delta(TIMEFRAME)
+    # Для старшего таймфрейма +1 интервал: первый интервал окна может оказаться неполным
+    return (info.lookback + LOOKBACK_MARGIN + (ratio > 1)) * ratio
+
+
+def get_market_data(symbol: str, timeframe: str, strategy_name: str,
+                    lookback: int = None) -> pd.DataFrame:
+    """
+    Возвращает OHLCV из кэша цикла, при первом обращении загружает его из БД.
+    Каждая стратегия получает поверхностную копию общего DataFrame: данные
+    не дублируются, а благодаря Copy-on-Write исходный кадр остаётся неизменным.
+    При заданном lookback отдаются только последние бары нужного стратегии окна.
+    """
+    key = (symbol, timeframe)
+    started = time.perf_counter()
+
+    if key not in MARKET_DATA_CACHE:
+        MARKET_DATA_CACHE[key] = _load_market_data(symbol, timeframe)
+        source = "БД" if timeframe == TIMEFRAME else f"свечей {TIMEFRAME}"
+    else:
+        source = "кэш"
+
+    elapsed = time.perf_counter() - started
+    LOAD_STATS[strategy_name] = elapsed
+    print(f"[TIME] {strategy_name}: данные {symbol} {timeframe} получены из {source} за {elapsed:.3f} с")
+
+    data = MARKET_DATA_CACHE[key]
+    if lookback is not None:
+        data = data.tail(lookback + LOOKBACK_MARGIN)
+    return data.copy(deep=False)
+
+
+def evaluate_strategy(file):
+    """
+    Считает сигналы стратегии и сохраняет signal_df.
+    Возвращает словарь сигнала за последнюю закрытую свечу таймфрейма стратегии или None.
+    В БД сигналов и в Telegram ничего не пишет - это делает publish_signal.
+    """
+    info = REGISTRY.load(file)
+    strategy = info.module
+    strategy_name = info.name
+    timeframe = info.timeframe or TIMEFRAME
+
+    # Загружаем данные из кэша цикла (старшие таймфреймы строятся из базовых свечей)
+    data = get_market_data(SYMBOL, timeframe, strategy_name, info.lookback)
 
     print('data is:')
     print(data)
 
     # Стратегия возвращает DataFrame с сигналами по стратегии
-    signal_df = strategy.trading_strategy(data)
+    online = ONLINE_INDICATORS and hasattr(strategy, "update_bar")
+    if online:
+        state_path = os.path.join(STATE_DIR, f"indicators_{strategy_name}.json")
+        signal_df = run_online(strategy, data, state_path, info.source_hash)
+    else:
+        signal_df = strategy.trading_strategy(data)
 
     print('signal_df is:')
     print(signal_df)
 
-    if signal_df is not None and not signal_df.empty:
-        # сохраняем весь датафрейм в отдельную таблицу
-        strategy_name = os.path.splitext(os.path.basename(file))[0]
-        table_name = f"signal_df_{strategy_name}"
-
-        signal_df.to_sql(name=table_name
-                        ,schema='test'
-                        ,con=engine
-                        ,if_exists="replace"
-                        ,index=True)
-        print(f"DataFrame сохранён в таблицу {table_name}")
-        
-        # берём последнюю строку
-        # Текущее время в Московском часовом поясе
-        moscow_tz = pytz.timezone('Europe/Moscow')
-        current_time = datetime.now(moscow_tz)
+    if signal_df is None or signal_df.empty:
+        print('Пустой результат от стратегии')
+        return None
 
-        # Время последнего закрытого часа (предыдущий час)
-        last_closed_hour = current_time.replace(minute=0, second=0, microsecond=0).astimezone(pytz.UTC) - timedelta(hours=1)
+    # сохраняем весь датафрейм в отдельную таблицу
+    table_name = f"signal_df_{strategy_name}"
 
-        print(f"Текущее время по МСК: {current_time}")
-        print(f"Последний закрытый час по UTC: {last_closed_hour}")
-        
-        # Ищем запись за последний закрытый час
-        last_closed_row = signal_df[signal_df.index == last_closed_hour].iloc[-1]
-
-        # Проверяем наличие сигнала
-        if last_closed_row["signal"] in ["1", 1, "-1", -1]:
-            print('Сигнал присутствует')
-            
-            signal_dict = {
-                "symbol": SYMBOL,
-                "timestamp": last_closed_hour,
-                "timeframe": TIMEFRAME,
-                "side": "buy" if last_closed_row["signal"] in ["1", 1] else "sell" if last_closed_row["signal"] in ["-1", -1] else None,
-                "volume": 10,
-                "open_price": float(last_closed_row["open"]),
-                "close_price": float(last_closed_row["close"])
-            }
-
-            sl, tp = get_sl_tp_val(strategy_name,signal_dict["side"].lower(),signal_dict['close_price'])
-
-            signal_dict.update({
-                "stop_loss": float(sl),
-                "take_profit": float(tp)
-            })
-
-
-            cur.execute(
-                """
-                INSERT INTO test.signals (strategy_name, symbol, timestamp, timeframe, side, volume, open_price, close_price, stop_loss, take_profit, created_at)
-                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                """,
-                (
-                    os.path.basename(file),
-                    signal_dict["symbol"],
-                    signal_dict["timestamp"],
-                    signal_dict["timeframe"],
-                    signal_dict["side"],
-                    signal_dict["volume"],
-                    signal_dict["open_price"],
-                    signal_dict["close_price"],
-                    signal_dict["stop_loss"],
-                    signal_dict["take_profit"],
-                    datetime.now()
-                )
-            )
-            conn.commit()
-            print(f"[INFO] Сигнал добавлен: {signal_dict}")
-
-
-            # # ------------------- ПАРАМЕТРЫ ОТ СИГНАЛОВ -------------------
-            #     signal = 1                     # 1 – BUY, -1 – SELL
-            #     ticker = "BTCUSDT"
-            #     sl_price = 24000.0             # уровень стоп‑лосса
-            #     tp_price = 28000.0             # уровень тейк‑профита
-            #     percent = 5.0                  # 5 % от USDT‑баланса
-            
-            # trader = BybitTrader()
-            # # ------------------- ОТПРАВКА ОРДЕРА ------------------------
-            # try:
-            #     res = trader.execute_signal(
-            #         signal=signal,
-            #         symbol=ticker,
-            #         stoploss=sl_price,
-            #         takeprofit=tp_price,
-            #         percent_of_balance=percent,
-            #         order_type="Market",   # можно "Limit"
-            #         leverage=1,           # при необходимости
-            #     )
-            #     print("\n Операция выполнена")
-            #     print("Entry :", res["entry"])
-            #     print("OCO linkId :", res["oco"]["linkId"])
-            #     print("SL   :", res["oco"]["stopLoss"])
-            #     print("TP   :", res["oco"]["takeProfit"])
-            # except Exception as e:
-            #     print("\n Ошибка:", e)
-
-
-            
-            # формируем уведомление с визуальными маркерами
-            side_emoji = "🟢 BUY 📈" if signal_dict["side"].lower() == "buy" else "🔴 SELL 📉"
-            strategy_name = os.path.basename(file).replace(".py", "")
-            
-            # отправляем уведомление в Telegram
-            
-            msg = (
-                f"🚀 *НОВЫЙ СИГНАЛ!*\n\n"
-                f"🎯 *Стратегия:* `{strategy_name}`\n"
-                f"💹 *Инструмент:* {signal_dict['symbol']}\n"
-                f"💹 *Дата и время свечи:* {signal_dict['timestamp']}\n"
-                f"⏱ *Таймфрейм:* {signal_dict['timeframe']}\n\n"
-                f"{side_emoji}\n"
-                f"📦 *Объём:* {signal_dict['volume']}\n"
-                f"💰 *Цена открытия:* {signal_dict['open_price']}\n"
-                f"💸 *Цена закрытия:* {signal_dict['close_price']}\n\n"
-                f"🛡 *SL:* {sl:.1f}\n"
-                f"🎯 *TP:* {tp:.1f}\n\n"
-                f"🕒 {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"
+    # Online-путь возвращает только новые бары: replace оставил бы в таблице лишь их,
+    # поэтому он всегда дописывает (upsert) независимо от SIGNAL_PERSIST_MODE
+    mode = "upsert" if online else SIGNAL_PERSIST_MODE
+
+    # Стратегия может ограничить сохраняемые колонки через PERSIST_COLUMNS
+    saved = save_signal_df(signal_df
+                          ,table_name
+                          ,engine
+                          ,mode=mode
+                          ,columns=getattr(strategy, "PERSIST_COLUMNS", None))
+    print(f"DataFrame сохранён в таблицу {table_name} ({mode}, строк: {saved})")
+
+    # берём последнюю строку
+    # Текущее время в Московском часовом поясе
+    moscow_tz = pytz.timezone('Europe/Moscow')
+    current_time = datetime.now(moscow_tz)
+
+    # Время открытия последней закрытой свечи (для 1h - предыдущий час)
+    last_closed_hour = last_closed_bar(timeframe, current_time)
+
+    print(f"Текущее время по МСК: {current_time}")
+    print(f"Последняя закрытая свеча {timeframe} по UTC: {last_closed_hour}")
+
+    # Ищем запись за последнюю закрытую свечу
+    last_closed_row = signal_df[signal_df.index == last_closed_hour].iloc[-1]
+
+    # Проверяем наличие сигнала
+    if last_closed_row["signal"] not in ["1", 1, "-1", -1]:
+        print('Сигнал отсутствует')
+        return None
+
+    print('Сигнал присутствует')
+
+    signal_dict = {
+        "strategy_file": os.path.basename(file),
+        "strategy_name": strategy_name,
+        "symbol": SYMBOL,
+        "timestamp": last_closed_hour,
+        "timeframe": timeframe,
+        "side": "buy" if last_closed_row["signal"] in ["1", 1] else "sell" if last_closed_row["signal"] in ["-1", -1] else None,
+        "volume": 10,
+        "open_price": float(last_closed_row["open"]),
+        "close_price": float(last_closed_row["close"])
+    }
+
+    sl, tp = get_sl_tp_val(strategy_name,signal_dict["side"].lower(),signal_dict['close_price'])
+
+    signal_dict.update({
+        "stop_loss": float(sl),
+        "take_profit": float(tp)
+    })
+
+    return signal_dict
+
+
+def publish_signal(signal_dict):
+    """Записывает сигнал в test.signals и отправляет уведомление в Telegram."""
+    with pooled_connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO test.signals (strategy_name, symbol, timestamp, timeframe, side, volume, open_price, close_price, stop_loss, take_profit, created_at)
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
+            """,
+            (
+                signal_dict["strategy_file"],
+                signal_dict["symbol"],
+                signal_dict["timestamp"],
+                signal_dict["timeframe"],
+                signal_dict["side"],
+                signal_dict["volume"],
+                signal_dict["open_price"],
+                signal_dict["close_price"],
+                signal_dict["stop_loss"],
+                signal_dict["take_profit"],
+                datetime.now()
             )
+        )
+    print(f"[INFO] Сигнал добавлен: {signal_dict}")
 
-            send_telegram_message(tg_token = TELEGRAM_TOKEN
-                                 ,tg_chat_id = TELEGRAM_CHAT_ID 
-                                 ,message = msg
-                                 ,parse_mode="Markdown")
-        else:
-            print('Сигнал отсутствует')
+
+        # # ------------------- ПАРАМЕТРЫ ОТ СИГНАЛОВ -------------------
+        #     signal = 1                     # 1 – BUY, -1 – SELL
+        #     ticker = "BTCUSDT"
+        #     sl_price = 24000.0             # уровень стоп‑лосса
+        #     tp_price = 28000.0             # уровень тейк‑профита
+        #     percent = 5.0                  # 5 % от USDT‑баланса
+        
+        # trader = BybitTrader()
+        # # ------------------- ОТПРАВКА ОРДЕРА ------------------------
+        # try:
+        #     res = trader.execute_signal(
+        #         signal=signal,
+        #         symbol=ticker,
+        #         stoploss=sl_price,
+        #         takeprofit=tp_price,
+        #         percent_of_balance=percent,
+        #         order_type="Market",   # можно "Limit"
+        #         leverage=1,           # при необходимости
+        #     )
+        #     print("\n Операция выполнена")
+        #     print("Entry :", res["entry"])
+        #     print("OCO linkId :", res["oco"]["linkId"])
+        #     print("SL   :", res["oco"]["stopLoss"])
+        #     print("TP   :", res["oco"]["takeProfit"])
+        # except Exception as e:
+        #     print("\n Ошибка:", e)
+
+
+    # формируем уведомление с визуальными маркерами
+    side_emoji = "🟢 BUY 📈" if signal_dict["side"].lower() == "buy" else "🔴 SELL 📉"
+
+    # отправляем уведомление в Telegram
+
+    msg = (
+        f"🚀 *НОВЫЙ СИГНАЛ!*\n\n"
+        f"🎯 *Стратегия:* `{signal_dict['strategy_name']}`\n"
+        f"💹 *Инструмент:* {signal_dict['symbol']}\n"
+        f"💹 *Дата и время свечи:* {signal_dict['timestamp']}\n"
+        f"⏱ *Таймфрейм:* {signal_dict['timeframe']}\n\n"
+        f"{side_emoji}\n"
+        f"📦 *Объём:* {signal_dict['volume']}\n"
+        f"💰 *Цена открытия:* {signal_dict['open_price']}\n"
+        f"💸 *Цена закрытия:* {signal_dict['close_price']}\n\n"
+        f"🛡 *SL:* {signal_dict['stop_loss']:.1f}\n"
+        f"🎯 *TP:* {signal_dict['take_profit']:.1f}\n\n"
+        f"🕒 {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S UTC')}"
+    )
+
+    # сигналы одного цикла уходят одним дайджестом
+    NOTIFIER.notify(msg)
+
+
+def run_strategy(file):
+    signal_dict = evaluate_strategy(file)
+    if signal_dict is not None:
+        publish_signal(signal_dict)
+
+
+# ============================================================
+# 4. Параллельный запуск стратегий
+# ============================================================
+def _init_worker(market_data_cache, market_data_limit):
+    """Инициализация процесса-воркера: общие данные цикла передаются один раз."""
+    # Унаследованный пул соединений сбрасывается в db._reset_after_fork
+    MARKET_DATA_CACHE.update(market_data_cache)
+    MARKET_DATA_LIMIT.update(market_data_limit)
+
+
+def _strategy_timeout_handler(signum, frame):
+    raise TimeoutError(f"Стратегия не уложилась в {STRATEGY_TIMEOUT_SEC} с")
+
+
+def _evaluate_in_worker(file):
+    """
+    Выполняется в воркере. Исключения не пробрасываются наружу,
+    чтобы падение одной стратегии не влияло на остальные.
+    """
+    strategy_name = os.path.splitext(os.path.basename(file))[0]
+    use_alarm = STRATEGY_TIMEOUT_SEC > 0 and hasattr(signal, "SIGALRM")
+
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _strategy_timeout_handler)
+        signal.alarm(STRATEGY_TIMEOUT_SEC)
+    try:
+        return {"status": "ok",
+                "signal": evaluate_strategy(file),
+                "load_time": LOAD_STATS.get(strategy_name, 0.0)}
+    except Exception:
+        return {"status": "error", "error": traceback.format_exc()}
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+
+
+def run_strategies_parallel(files, workers):
+    """
+    Считает стратегии в пуле процессов.
+    Возвращает словари сигналов; ошибки и таймауты стратегий только логируются.
+    """
+    signals = []
+    pool = multiprocessing.Pool(processes=workers,
+                                initializer=_init_worker,
+                                initargs=(MARKET_DATA_CACHE, MARKET_DATA_LIMIT))
+    tasks = {file: pool.apply_async(_evaluate_in_worker, (file,)) for file in files}
+
+    # Страховка на случай, если таймаут внутри воркера не сработал:
+    # стратегии в очереди ждут свободный воркер, поэтому лимит общий на цикл
+    rounds = -(-len(files) // workers)
+    deadline = time.monotonic() + STRATEGY_TIMEOUT_SEC * rounds + 5 if STRATEGY_TIMEOUT_SEC > 0 else None
+
+    hung = False
+    for file, task in tasks.items():
+        strategy_name = os.path.splitext(os.path.basename(file))[0]
+        try:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            result = task.get(timeout=timeout)
+        except multiprocessing.TimeoutError:
+            hung = True
+            print(f"[ERROR] {strategy_name}: превышено время ожидания результата")
+            continue
+
+        if result["status"] != "ok":
+            print(f"[ERROR] {strategy_name}: стратегия завершилась с ошибкой\n{result['error']}")
+            continue
+
+        LOAD_STATS[strategy_name] = result["load_time"]
+        if result["signal"] is not None:
+            signals.append(result["signal"])
+
+    if hung:
+        pool.terminate()
     else:
-        print('Пустой результат от стратегии')
+        pool.close()
+    pool.join()
+
+    return signals
+
+
+def run_all_strategies(workers: int = None):
+    """
+    Один цикл: данные грузятся один раз и передаются всем стратегиям.
+    Сигналы собираются по всем стратегиям и публикуются после их завершения.
+    """
+    workers = RUNNER_WORKERS if workers is None else workers
+
+    MARKET_DATA_CACHE.clear()
+    MARKET_DATA_LIMIT.clear()
+    LOAD_STATS.clear()
+
+    strategies = REGISTRY.discover()
+    files = [info.path for info in strategies.values()]
+
+    # Грузим из БД только максимальное окно среди всех стратегий (в базовых свечах)
+    windows = [_base_window(info) for info in strategies.values()]
+    if windows and None not in windows:
+        MARKET_DATA_LIMIT[(SYMBOL, TIMEFRAME)] = max(windows)
+
+    if workers > 1:
+        # Данные (и старшие таймфреймы) готовятся в родительском процессе до старта воркеров
+        started = time.perf_counter()
+        timeframes = sorted({info.timeframe or TIMEFRAME for info in strategies.values()} | {TIMEFRAME},
+                            key=timeframe_delta)
+        for timeframe in timeframes:
+            MARKET_DATA_CACHE[(SYMBOL, timeframe)] = _load_market_data(SYMBOL, timeframe)
+        print(f"[TIME] Данные {SYMBOL} {', '.join(timeframes)} загружены за {time.perf_counter() - started:.3f} с")
+        LOAD_STATS["_preload"] = time.perf_counter() - started
+
+        signals = run_strategies_parallel(files, workers)
+    else:
+        signals = []
+        for file in files:
+            try:
+                signal_dict = evaluate_strategy(file)
+            except Exception:
+                print(f"[ERROR] {file}: стратегия завершилась с ошибкой\n{traceback.format_exc()}")
+                continue
+            if signal_dict is not None:
+                signals.append(signal_dict)
+
+    for signal_dict in signals:
+        publish_signal(signal_dict)
+
+    print("[TIME] Загрузка данных по стратегиям:")
+    for name, elapsed in LOAD_STATS.items():
+        print(f"    {name}: {elapsed:.3f} с")
+    print(f"[TIME] Всего на загрузку данных: {sum(LOAD_STATS.values()):.3f} с")
+
+
+# ============================================================
+# 5. Режим демона: запуск по NOTIFY от загрузчика данных
+# ============================================================
+def _listen_connection():
+    # LISTEN держит соединение всё время работы демона, поэтому оно вне пула
+    listen_conn = connect(autocommit=True)
+    with listen_conn.cursor() as listen_cur:
+        listen_cur.execute(f"LISTEN {MARKET_DATA_CHANNEL};")
+    return listen_conn
+
+
+def _is_relevant(notify) -> bool:
+    """Уведомление относится к инструменту и таймфрейму runner.py."""
+    try:
+        payload = json.loads(notify.payload)
+    except ValueError:
+        return True
+    return payload.get("symbol") == SYMBOL and payload.get("timeframe") == TIMEFRAME
+
+
+def run_daemon():
+    """
+    Долгоживущий процесс: ждёт NOTIFY о новых свечах и сразу запускает цикл стратегий.
+    Ошибки цикла не останавливают демон, при обрыве соединения LISTEN переподключается.
+    """
+    listen_conn = _listen_connection()
+    print(f"[INFO] Демон запущен, LISTEN {MARKET_DATA_CHANNEL}")
+
+    while True:
+        try:
+            ready, _, _ = select.select([listen_conn], [], [], DAEMON_POLL_SEC)
+            if not ready:
+                # Тишина: проверяем, что соединение живо
+                with listen_conn.cursor() as listen_cur:
+                    listen_cur.execute("SELECT 1;")
+                continue
+
+            # Несколько вставок подряд (разные пары/пакеты) обрабатываем одним циклом
+            time.sleep(DAEMON_DEBOUNCE_SEC)
+            listen_conn.poll()
+            notifies = list(listen_conn.notifies)
+            listen_conn.notifies.clear()
+
+            if not any(_is_relevant(n) for n in notifies):
+                continue
+
+            print(f"[INFO] Получено уведомлений о новых данных: {len(notifies)}, запуск стратегий")
+            try:
+                run_all_strategies()
+            except Exception:
+                print(f"[ERROR] Цикл стратегий завершился с ошибкой\n{traceback.format_exc()}")
+
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            print(f"[ERROR] Соединение LISTEN потеряно: {e}, переподключение")
+            time.sleep(5)
+            try:
+                listen_conn.close()
+            except Exception:
+                pass
+            try:
+                listen_conn = _listen_connection()
+            except psycopg2.OperationalError as e:
+                print(f"[ERROR] Не удалось переподключиться: {e}")
+
 
 # Запуск всех стратегий
-for f in os.listdir(STRATEGIES_FOLDER):
-    if f.endswith(".py"):
-        run_strategy(os.path.join(STRATEGIES_FOLDER, f))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Запуск торговых стратегий")
+    parser.add_argument("--daemon", action="store_true",
+                        help="работать постоянно и запускать стратегии по NOTIFY о новых свечах")
+    args = parser.parse_args()
 
-cur.close()
-conn.close()
+    try:
+        if args.daemon:
+            run_daemon()
+        else:
+            run_all_strategies()
+    finally:
+        NOTIFIER.close()
+        dispose()
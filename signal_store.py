@@ -0,0 +1,117 @@
+# --- Сохранение signal_df стратегий в БД ---
+import io
+
+import pandas as pd
+from sqlalchemy import inspect
+
+SIGNAL_SCHEMA = "test"
+INDEX_COLUMN = "timestamp"
+
+
+def save_signal_df(signal_df: pd.DataFrame,
+                   table_name: str,
+                   engine,
+                   mode: str = "upsert",
+                   columns: list = None) -> int:
+    """
+    Сохраняет DataFrame с сигналами стратегии в test.<table_name>.
+
+    Параметры
+    ----------
+    signal_df : pd.DataFrame
+        Результат trading_strategy, индекс - timestamp бара.
+    table_name : str
+        Имя таблицы без схемы (например, ``"signal_df_candles"``).
+    engine :
+        SQLAlchemy engine.
+    mode : {"upsert", "replace"}
+        * **upsert**  - дописываются только бары новее последнего сохранённого,
+          история таблицы не трогается: первые бары окна LOOKBACK посчитаны
+          без прогрева индикаторов и не должны затирать полную историю;
+        * **replace** - таблица пересоздаётся целиком (прежнее поведение).
+    columns : list, optional
+        Белый список колонок для сохранения. None - все колонки.
+
+    Возвращаемое значение
+    ----------------------
+    int
+        Количество вставленных строк.
+    """
+    if columns is not None:
+        signal_df = signal_df[[c for c in columns if c in signal_df.columns]]
+
+    if mode == "replace":
+        signal_df.to_sql(name=table_name
+                        ,schema=SIGNAL_SCHEMA
+                        ,con=engine
+                        ,if_exists="replace"
+                        ,index=True)
+        return len(signal_df)
+
+    if mode != "upsert":
+        raise ValueError(f"Неизвестный режим сохранения: {mode}")
+
+    signal_df = signal_df.rename_axis(INDEX_COLUMN)
+    _ensure_signal_table(signal_df, table_name, engine)
+
+    # Колонки, которых нет в существующей таблице, пропускаем
+    table_columns = {c["name"] for c in inspect(engine).get_columns(table_name, schema=SIGNAL_SCHEMA)}
+    data_columns = [c for c in signal_df.columns if c in table_columns and c != INDEX_COLUMN]
+    skipped = [c for c in signal_df.columns if c not in table_columns]
+    if skipped:
+        print(f"[WARN] {table_name}: колонки отсутствуют в таблице и не сохранены: {skipped}")
+
+    all_columns = [INDEX_COLUMN] + data_columns
+    column_list = ", ".join(f'"{c}"' for c in all_columns)
+    staging = f"tmp_{table_name}"
+
+    # Данные передаются одним потоком COPY во временную таблицу
+    buffer = io.StringIO()
+    signal_df.to_csv(buffer, columns=data_columns, header=False, index=True, na_rep="\\N")
+    buffer.seek(0)
+
+    raw_conn = engine.raw_connection()
+    try:
+        with raw_conn.cursor() as cur:
+            cur.execute(f"""
+                CREATE TEMP TABLE {staging}
+                (LIKE {SIGNAL_SCHEMA}.{table_name} INCLUDING DEFAULTS)
+                ON COMMIT DROP
+            """)
+            cur.copy_expert(
+                f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+                buffer
+            )
+            # Только бары новее уже сохранённых
+            cur.execute(f"""
+                INSERT INTO {SIGNAL_SCHEMA}.{table_name} ({column_list})
+                SELECT {column_list} FROM {staging}
+                WHERE "{INDEX_COLUMN}" > COALESCE(
+                    (SELECT max("{INDEX_COLUMN}") FROM {SIGNAL_SCHEMA}.{table_name}), '-infinity')
+                ON CONFLICT ("{INDEX_COLUMN}") DO NOTHING
+            """)
+            affected = cur.rowcount
+        raw_conn.commit()
+    except Exception:
+        raw_conn.rollback()
+        raise
+    finally:
+        raw_conn.close()
+
+    return affected
+
+
+def _ensure_signal_table(signal_df: pd.DataFrame, table_name: str, engine):
+    """Создаёт таблицу по структуре DataFrame и уникальный ключ по timestamp."""
+    if not inspect(engine).has_table(table_name, schema=SIGNAL_SCHEMA):
+        signal_df.head(0).to_sql(name=table_name
+                                ,schema=SIGNAL_SCHEMA
+                                ,con=engine
+                                ,if_exists="fail"
+                                ,index=True)
+
+    with engine.begin() as conn:
+        conn.exec_driver_sql(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {table_name}_timestamp_uidx
+                ON {SIGNAL_SCHEMA}.{table_name} ("{INDEX_COLUMN}")
+        """)
@@ -1,5 +1,16 @@
 from typing import Literal, Tuple
 
+# Словарь с параметрами стратегий (доли от цены входа)
+# Значения подбираются по истории: python optimizer.py (печатает лучшие SL/TP в этом формате)
+STRATEGY_SL_TP = {
+    "close_open_1pct": {"sl": 0.006,  "tp": 0.035},
+    "close_open_engulfing": {"sl": 0.011,  "tp": 0.035},
+    "macd_hist": {"sl": 0.008,  "tp": 0.035},
+    "candles": {"sl": 0.008,  "tp": 0.04},
+    "fractal": {"sl": 0.004,  "tp": 0.05},
+    # ← здесь можно добавить новые стратегии
+}
+
 def get_sl_tp_val(strategy_name: str
                  ,side: Literal["buy", "sell", "long", "short"]
                  ,deal_price: float):
@@ -42,18 +53,9 @@ def get_sl_tp_val(strategy_name: str
     elif side_norm in ("short", "sell"):
         side_norm = "sell"
 
-    # -------------------- 1. Словарь с параметрами стратегий --------------------
-    strategies = {
-        "close_open_1pct": {"sl": 0.006,  "tp": 0.035},
-        "close_open_engulfing": {"sl": 0.011,  "tp": 0.035},
-        "macd_hist": {"sl": 0.008,  "tp": 0.035},
-        "candles": {"sl": 0.008,  "tp": 0.04},
-        "fractal": {"sl": 0.004,  "tp": 0.05},
-        # ← здесь можно добавить новые стратегии
-    }
-
-    sl_perc = strategies[name]["sl"]   # 0.01 → 1 %
-    tp_perc = strategies[name]["tp"]   # 0.025 → 2,5 %
+    # -------------------- 1. Параметры стратегии --------------------
+    sl_perc = STRATEGY_SL_TP[name]["sl"]   # 0.01 → 1 %
+    tp_perc = STRATEGY_SL_TP[name]["tp"]   # 0.025 → 2,5 %
 
     # -------------------- 2. Расчёт абсолютных цен --------------------
     if side_norm == "buy":
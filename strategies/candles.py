@@ -1,6 +1,14 @@
 import pandas as pd
 import numpy as np
 
+# LOOKBACK не объявлен: фильтр повторных сигналов (ffill по signal) зависит от последнего
+# ненулевого сигнала за всю историю, и на усечённом окне стратегия может выдать сигнал,
+# который на полной истории был бы подавлен. Поэтому runner.py и backtest_state.py
+# передают ей всю историю.
+
+# Сетка параметров trading_strategy для optimizer.py
+PARAM_GRID = {"min_body_ratio": [1.5, 2.0, 2.5, 3.0], "use_volume": [False, True]}
+
 def trading_strategy(df: pd.DataFrame, 
                                    use_volume: bool = False,
                                    min_body_ratio: float = 2.0) -> pd.DataFrame:
@@ -1,5 +1,8 @@
 import pandas as pd
 
+# Сигнал считается по одной свече
+LOOKBACK = 1
+
 def trading_strategy(df: pd.DataFrame) -> pd.DataFrame:
     """
     change_perc = 1.2
@@ -22,3 +25,21 @@ def trading_strategy(df: pd.DataFrame) -> pd.DataFrame:
     df.loc[change < -0.012, "signal"] = -1 # sell
 
     return df
+
+
+# ------------------------------------------------------------
+# Online-версия для runner.py: расчёт только по новому бару
+# ------------------------------------------------------------
+def create_indicators() -> dict:
+    return {}
+
+
+def update_bar(state, bar: dict) -> dict:
+    change = (bar["close"] - bar["open"]) / bar["open"]
+
+    signal = 0
+    if change > 0.012:
+        signal = 1
+    if change < -0.012:
+        signal = -1
+    return {"signal": signal}
@@ -1,5 +1,8 @@
 import pandas as pd
 
+# Текущая и предыдущая свечи
+LOOKBACK = 2
+
 def trading_strategy(df: pd.DataFrame) -> pd.DataFrame:
     """
     change_perc = 0.6
@@ -30,3 +33,26 @@ def trading_strategy(df: pd.DataFrame) -> pd.DataFrame:
     df.loc[buy_cond,  'signal'] = 1
 
     return df
+
+
+# ------------------------------------------------------------
+# Online-версия для runner.py: расчёт только по новому бару
+# ------------------------------------------------------------
+def create_indicators() -> dict:
+    from indicators import Shift
+    return {"prev_close": Shift(1), "prev_open": Shift(1)}
+
+
+def update_bar(state, bar: dict) -> dict:
+    prev_close = state["prev_close"].update(bar["close"])
+    prev_open = state["prev_open"].update(bar["open"])
+
+    sell_cond = (prev_close > prev_open * 1.006) and (bar["close"] < bar["open"])
+    buy_cond = (prev_open > prev_close * 1.006) and (bar["close"] > bar["open"])
+
+    signal = 0
+    if sell_cond:
+        signal = -1
+    if buy_cond:
+        signal = 1
+    return {"signal": signal}
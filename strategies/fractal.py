@@ -1,10 +1,15 @@
 import pandas as pd
 import numpy as np
 
+# Самая длинная EMA стратегии и множитель прогрева:
+# вес отброшенной истории (1 - 2/51)^200 ~ 3e-4
+EMA_SPAN = 50
+EMA_WARMUP_MULT = 4
+
 def trading_strategy(df):
     df = df.copy()
     df['ema25'] = df['close'].ewm(span=25, adjust=False).mean()
-    df['ema50'] = df['close'].ewm(span=50, adjust=False).mean()
+    df['ema50'] = df['close'].ewm(span=EMA_SPAN, adjust=False).mean()
 
     df['fractal_high'] = (
         (df['high'] > df['high'].shift(1)) &
@@ -32,3 +37,36 @@ def trading_strategy(df):
     df.loc[buy_cond,  'signal'] = 1
     df.loc[sell_cond, 'signal'] = -1
     return df
+
+
+# ------------------------------------------------------------
+# Online-версия для runner.py: расчёт только по новому бару
+# ------------------------------------------------------------
+def create_indicators() -> dict:
+    from indicators import EMA, Shift
+    return {"ema25": EMA(25), "ema50": EMA(EMA_SPAN), "high": Shift(4), "low": Shift(4)}
+
+
+def update_bar(state, bar: dict) -> dict:
+    ema25 = state["ema25"].update(bar["close"])
+    ema50 = state["ema50"].update(bar["close"])
+    highs = state["high"]
+    lows = state["low"]
+    highs.update(bar["high"])
+    lows.update(bar["low"])
+
+    # Фрактал подтверждается двумя барами справа, поэтому смотрим на бар t-2
+    h = [highs.lag(k) for k in range(5)]
+    l = [lows.lag(k) for k in range(5)]
+    high_fract = h[2] > h[3] and h[2] > h[4] and h[2] > h[1] and h[2] > h[0]
+    low_fract = l[2] < l[3] and l[2] < l[4] and l[2] < l[1] and l[2] < l[0]
+
+    buy_cond = ema25 > ema50 and low_fract and bar["close"] > h[2]
+    sell_cond = ema25 < ema50 and high_fract and bar["close"] < l[2]
+
+    signal = 0
+    if buy_cond:
+        signal = 1
+    if sell_cond:
+        signal = -1
+    return {"ema25": ema25, "ema50": ema50, "signal": signal}
@@ -1,3 +1,9 @@
+# slow-окно скользящей средней + 2 бара для diff.shift(2)
+LOOKBACK = 40 + 2
+
+# Сетка параметров trading_strategy для optimizer.py
+PARAM_GRID = {"fast": [3, 5, 8, 12], "slow": [20, 30, 40, 60]}
+
 def trading_strategy(df, fast=5, slow=40):
     '''
     stop_loss = 0.8
@@ -56,3 +62,30 @@ def trading_strategy(df, fast=5, slow=40):
             inplace=True)
 
     return df
+
+
+# ------------------------------------------------------------
+# Online-версия для runner.py: расчёт только по новому бару
+# ------------------------------------------------------------
+def create_indicators(fast=5, slow=40) -> dict:
+    from indicators import SMA, Shift
+    return {"fast_ma": SMA(fast), "slow_ma": SMA(slow), "diff": Shift(2)}
+
+
+def update_bar(state, bar: dict) -> dict:
+    fast_ma = state["fast_ma"].update(bar["close"])
+    slow_ma = state["slow_ma"].update(bar["close"])
+
+    diffs = state["diff"]
+    diffs.update(fast_ma - slow_ma)
+    diff, diff_1, diff_2 = diffs.lag(0), diffs.lag(1), diffs.lag(2)
+
+    diff_down = diff < diff_1
+    diff_was_up = diff_1 > diff_2
+
+    signal = 0
+    if fast_ma > slow_ma and diff_down and diff_was_up:
+        signal = -1
+    if fast_ma < slow_ma and diff_down and diff_was_up:
+        signal = 1
+    return {"signal": signal}
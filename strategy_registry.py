@@ -0,0 +1,129 @@
+# --- Реестр стратегий ---
+# Каждая стратегия импортируется один раз под собственным именем модуля и кэшируется
+# вместе с метаданными. Повторный импорт - только если файл изменился (mtime + хеш).
+import hashlib
+import importlib.util
+import os
+import sys
+from dataclasses import dataclass
+from types import ModuleType
+
+from sl_tp_setter import STRATEGY_SL_TP
+
+STRATEGIES_FOLDER = "strategies"
+# Множитель прогрева EMA по умолчанию, если стратегия объявила только EMA_SPAN
+DEFAULT_EMA_WARMUP_MULT = 4
+
+
+@dataclass
+class StrategyInfo:
+    name: str
+    path: str
+    module: ModuleType
+    mtime: float
+    source_hash: str
+    stop_loss: float | None
+    take_profit: float | None
+    lookback: int | None
+    timeframe: str | None
+
+
+def strategy_lookback(module) -> int | None:
+    """
+    Требуемое стратегией окно в барах.
+    Стратегия объявляет LOOKBACK и/или EMA_SPAN (с EMA_WARMUP_MULT) на уровне модуля.
+    None - окно не объявлено, нужна вся история.
+    """
+    lookback = getattr(module, "LOOKBACK", None)
+    ema_span = getattr(module, "EMA_SPAN", None)
+
+    if ema_span is not None:
+        warmup = ema_span * getattr(module, "EMA_WARMUP_MULT", DEFAULT_EMA_WARMUP_MULT)
+        lookback = max(lookback or 0, warmup)
+
+    return lookback
+
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class StrategyRegistry:
+    def __init__(self, folder: str = STRATEGIES_FOLDER):
+        self.folder = folder
+        self._by_path = {}
+
+    def discover(self) -> dict:
+        """
+        Находит все *.py в папке стратегий, подгружает новые и изменившиеся,
+        забывает удалённые. Возвращает {имя стратегии: StrategyInfo} в порядке имён файлов.
+        """
+        paths = [os.path.abspath(os.path.join(self.folder, f))
+                 for f in sorted(os.listdir(self.folder)) if f.endswith(".py")]
+
+        for path in set(self._by_path) - set(paths):
+            if os.path.dirname(path) == os.path.abspath(self.folder):
+                self._forget(path)
+
+        return {info.name: info for info in (self.load(path) for path in paths)}
+
+    def load(self, path: str) -> StrategyInfo:
+        """Возвращает стратегию из кэша, импортируя файл только при первом обращении или изменении."""
+        path = os.path.abspath(path)
+        info = self._by_path.get(path)
+        mtime = os.path.getmtime(path)
+
+        if info is not None and info.mtime == mtime:
+            return info
+
+        source_hash = _file_hash(path)
+        if info is not None and info.source_hash == source_hash:
+            info.mtime = mtime
+            return info
+
+        info = self._import(path, mtime, source_hash)
+        self._by_path[path] = info
+        return info
+
+    def get(self, name: str) -> StrategyInfo:
+        for info in self._by_path.values():
+            if info.name == name:
+                return self.load(info.path)
+        raise KeyError(f"Стратегия {name} не найдена в реестре")
+
+    def _module_name(self, name: str, path: str) -> str:
+        module_name = f"strategy_{name}"
+        registered = sys.modules.get(module_name)
+        if registered is not None and getattr(registered, "__file__", None) != path:
+            # Стратегия с таким же именем из другой папки
+            module_name = f"{module_name}_{hashlib.sha1(path.encode()).hexdigest()[:8]}"
+        return module_name
+
+    def _import(self, path: str, mtime: float, source_hash: str) -> StrategyInfo:
+        name = os.path.splitext(os.path.basename(path))[0]
+        module_name = self._module_name(name, path)
+
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[module_name] = module
+
+        sl_tp = STRATEGY_SL_TP.get(name, {})
+        return StrategyInfo(
+            name=name,
+            path=path,
+            module=module,
+            mtime=mtime,
+            source_hash=source_hash,
+            stop_loss=sl_tp.get("sl"),
+            take_profit=sl_tp.get("tp"),
+            lookback=strategy_lookback(module),
+            # Таймфрейм стратегии (TIMEFRAME в модуле), None - базовый таймфрейм runner.py
+            timeframe=getattr(module, "TIMEFRAME", None),
+        )
+
+    def _forget(self, path: str):
+        info = self._by_path.pop(path)
+        if sys.modules.get(info.module.__name__) is info.module:
+            del sys.modules[info.module.__name__]
@@ -1,63 +1,78 @@
 
 import os
-import importlib.util
-import psycopg2
-from sqlalchemy import create_engine, text
+import argparse
 from datetime import datetime, timedelta
 import pytz
 import pandas as pd
 import numpy as np
 import re
-from tg_notification import send_telegram_message
+from tg_notification import TelegramNotifier
+from strategy_registry import StrategyRegistry
+from market_cache import MarketDataCache
+from market_data import fetch_ohlcv, assert_float_ohlcv
+from db import get_engine, dispose
+from backtest_engine import run_backtest, trade_metrics
+from backtest_cache import BacktestCache, BACKTEST_CACHE_DIR, cache_key, data_fingerprint
+from backtest_state import BACKTEST_STATE_DIR, run_incremental
+from monte_carlo import MC_PATHS, monte_carlo, format_bands
 
 # ============================================================
 # 1. Конфигурация окружения
 # ============================================================
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_USER = os.getenv("DB_USER")
-DB_PASS = os.getenv("DB_PASS")
+# Параметры подключения к БД и пула - в config.py
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
 # Папка со стратегиями
 STRATEGIES_FOLDER = "strategies"
 TABLE_MD = "test.btc_usd_t"   # таблица с рыночными данными
+# Пара и таймфрейм бэктеста: в таблице есть и другие пары, и свёрнутые свечи 1d (load_market_data/rollup.py)
+SYMBOL = "BTC/USDT"
+TIMEFRAME = "1h"
+# Папка локального Parquet-кэша котировок (пусто - данные читаются напрямую из БД)
+MARKET_CACHE_DIR = os.getenv("MARKET_CACHE_DIR")
+
+# Очередь уведомлений Telegram (отчёты по стратегиям отправляются в фоне)
+NOTIFIER = TelegramNotifier(TELEGRAM_TOKEN, TELEGRAM_CHAT_ID)
+
+# Реестр стратегий (SL/TP берутся из sl_tp_setter.STRATEGY_SL_TP)
+REGISTRY = StrategyRegistry(STRATEGIES_FOLDER)
+
+# Параметры бэктеста для отчёта (входят в ключ кэша результатов)
+BACKTEST_SETTINGS = {
+    "initial_balance": 10000.0,
+    "trade_size": 0.5,        # 50% капитала на сделку
+    "commission_pct": 0.1,
+    "slippage_pct": 0.005,
+}
+# Кэш результатов бэктеста (BACKTEST_CACHE_DIR="" - без кэша)
+BACKTEST_CACHE = BacktestCache() if BACKTEST_CACHE_DIR else None
 
 # ============================================================
 # 2. Подключение к БД Postgres
 # ============================================================
-# engine = create_engine(
-#     f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-# )
-
-# conn = psycopg2.connect(
-#     dbname=DB_NAME,
-#     user=DB_USER,
-#     password=DB_PASS,
-#     host=DB_HOST,
-#     port=DB_PORT
-# )
-# conn.autocommit = True
-# cur = conn.cursor()
+# Общий пул соединений процесса (db.py)
+engine = get_engine()
 
 # ============================================================
 # 4. Получение последних данных OHLCV из БД
 # ============================================================
-def fetch_market_data(tbl:str) -> pd.DataFrame:
-    query = text(f"""
-        SELECT *
-        FROM {tbl}
-        ORDER BY timestamp ASC
-    """)
+def fetch_market_data(tbl:str, symbol: str = SYMBOL, timeframe: str = TIMEFRAME) -> pd.DataFrame:
+    """OHLCV одной пары и таймфрейма (symbol=None - все пары этого таймфрейма)."""
+    if MARKET_CACHE_DIR:
+        # Из БД догружаются только новые строки, история читается из Parquet
+        cache = MarketDataCache(MARKET_CACHE_DIR, tbl)
+        cache.refresh(engine, symbol, timeframe)
+        df = cache.read(symbol, timeframe)
+        if df.empty:
+            raise RuntimeError("❌ Нет данных OHLCV в БД для стратегии!")
+        return df
 
-    df = pd.read_sql(query, engine)
+    df = fetch_ohlcv(engine, tbl, symbol, timeframe)
 
     if df.empty:
         raise RuntimeError("❌ Нет данных OHLCV в БД для стратегии!")
 
-    df.set_index("timestamp", inplace=True)
     return df
 
 
@@ -70,9 +85,29 @@ def backtest_strategy(
     trade_size: float = 1.0,
     commission_pct: float = 0.1,
     slippage_pct: float = 0.005,
+    return_trades: bool = False,
+):
+    """
+    Бэктест на массивах NumPy (backtest_engine): те же сделки и метрики,
+    что и у побарного backtest_strategy_loop, без обхода каждого бара.
+    return_trades - вернуть также сделки (trades_df) для monte_carlo.py.
+    """
+    return run_backtest(df, stop_loss_pct, take_profit_pct, initial_balance,
+                        trade_size, commission_pct, slippage_pct, return_trades)
+
+
+def backtest_strategy_loop(
+    df: pd.DataFrame,
+    stop_loss_pct: float,
+    take_profit_pct: float,
+    initial_balance: float = 10000.0,
+    trade_size: float = 1.0,
+    commission_pct: float = 0.1,
+    slippage_pct: float = 0.005,
 ):
     """
     Исправленная версия бэктеста с корректной обработкой стопов и сигналов.
+    Эталонный побарный цикл: по нему проверяется совпадение результатов backtest_engine.
     """
     
     def calc_pnl_fixed(entry_price: float, exit_price: float, side: int) -> float:
@@ -251,104 +286,72 @@ def backtest_strategy(
         })
     
     # ========== РАСЧЕТ МЕТРИК ==========
-    if not trades:
-        return {
-            "total_return": 0.0,
-            "win_rate": 0.0,
-            "total_trades": 0,
-            "avg_trade": 0.0,
-            "sharpe_ratio": 0.0,
-            "max_drawdown": 0.0,
-            "profit_factor": 0.0,
-            "trades_df": pd.DataFrame(),
-            "equity_curve": pd.Series([initial_balance]),
-        }
-    
-    trades_df = pd.DataFrame(trades)
-    
-    # 1. Общая доходность
-    total_return = trades_df["pnl_pct"].sum()
-    
-    # 2. Win rate
-    win_rate = (trades_df["pnl_pct"] > 0).mean() * 100.0
-    
-    # 3. Средняя сделка
-    avg_trade = trades_df["pnl_pct"].mean()
-    
-    # 4. Profit Factor
-    gross_profits = trades_df[trades_df["pnl_pct"] > 0]["pnl_pct"].sum()
-    gross_losses = abs(trades_df[trades_df["pnl_pct"] < 0]["pnl_pct"].sum())
-    profit_factor = gross_profits / gross_losses if gross_losses != 0 else np.inf
-    
-    # 5. Кривая капитала и просадка
-    equity = initial_balance
-    equity_curve = [equity]
-    
-    for pnl in trades_df["pnl_pct"]:
-        equity *= (1 + pnl / 100.0)
-        equity_curve.append(equity)
-    
-    equity_series = pd.Series(equity_curve)
-    rolling_max = equity_series.expanding().max()
-    drawdowns = (equity_series - rolling_max) / rolling_max * 100
-    max_drawdown = drawdowns.min()
-    
-    # 6. Sharpe Ratio (упрощенный)
-    if len(trades_df) > 1:
-        # Предполагаем, что сделки распределены равномерно
-        returns_mean = trades_df["pnl_pct"].mean()
-        returns_std = trades_df["pnl_pct"].std()
-        sharpe = (returns_mean / returns_std) * np.sqrt(252) if returns_std != 0 else 0
-    else:
-        sharpe = 0.0
-    
-    return {
-        "total_return": round(total_return, 2),
-        "win_rate": round(win_rate, 1),
-        "total_trades": len(trades_df),
-        "avg_trade": round(avg_trade, 2),
-        "sharpe_ratio": round(sharpe, 2),
-        "max_drawdown": round(max_drawdown, 2),
-        "profit_factor": round(profit_factor, 2) if profit_factor != np.inf else float('inf'),
-        # "trades_df": trades_df,
-        # "equity_curve": equity_series,
-    }
-
-
-strategies = {
-        "close_open_1pct": {"sl": 0.006,  "tp": 0.035},
-        "close_open_engulfing": {"sl": 0.011,  "tp": 0.035},
-        "macd_hist": {"sl": 0.008,  "tp": 0.035},
-        "candles": {"sl": 0.008,  "tp": 0.04},
-        "fractal": {"sl": 0.004,  "tp": 0.05},
-    }
+    return trade_metrics(pd.DataFrame(trades), initial_balance)
 
 
 def run_strategy_tester(file):
     
-    spec = importlib.util.spec_from_file_location("strategy", file)
-    strategy = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(strategy)
+    info = REGISTRY.load(file)
+    strategy = info.module
 
     # Загружаем данные от биржи ToDO - переписать чтобы забирали данные из БД по любому таймфрейму
-    data = fetch_market_data(TABLE_MD)
+    data = assert_float_ohlcv(fetch_market_data(TABLE_MD, SYMBOL, TIMEFRAME), TABLE_MD)
 
-    # Стратегия возвращает DataFrame с сигналами по стратегии
-    signal_df = strategy.trading_strategy(data)
+    strategy_nm = info.name
+    stop_loss_pct = info.stop_loss * 100
+    take_profit_pct = info.take_profit * 100
 
-    print('signal_df', signal_df)
-    print('min index', signal_df.index.min())
-    print('max index', signal_df.index.max())
-    
-    strategy_nm = os.path.basename(file).replace(".py", "")
-    
-    result = backtest_strategy(
-            df=signal_df,
-            stop_loss_pct=strategies[strategy_nm]['sl'] * 100,   # 0.5% стоп-лосс
-            take_profit_pct=strategies[strategy_nm]['tp'] * 100, # 1.5% тейк-профит
-            initial_balance=10000.0,
-            trade_size=0.5       # 50% капитала на сделку
-        )
+    key = None
+    cached = None
+    if BACKTEST_CACHE is not None:
+        key = cache_key(info.source_hash, {}, stop_loss_pct, take_profit_pct,
+                        BACKTEST_SETTINGS, data_fingerprint(data, TABLE_MD))
+        cached = BACKTEST_CACHE.get(key)
+        # Записи optimizer.py с тем же ключом содержат только метрики
+        if cached is not None and "pnl" not in cached:
+            cached = None
+
+    if cached is not None:
+        # Ни стратегия, ни данные, ни параметры не менялись
+        print(f'{strategy_nm}: результат из кэша бэктеста')
+        result = cached["result"]
+        pnl = np.array(cached["pnl"], dtype=np.float64)
+        start_date = pd.Timestamp(cached["start_date"])
+        end_date = pd.Timestamp(cached["end_date"])
+    elif BACKTEST_STATE_DIR:
+        # Продолжаем бэктест прошлого запуска: считаются только новые бары (backtest_state.py)
+        state_path = os.path.join(BACKTEST_STATE_DIR, f"{strategy_nm}.json")
+        result, start_date, end_date, processed, pnl = run_incremental(
+                info, data, stop_loss_pct, take_profit_pct, BACKTEST_SETTINGS, state_path, source=TABLE_MD)
+        print(f'{strategy_nm}: обработано новых баров {processed}')
+    else:
+        # Стратегия возвращает DataFrame с сигналами по стратегии
+        signal_df = strategy.trading_strategy(data)
+
+        print('signal_df', signal_df)
+        print('min index', signal_df.index.min())
+        print('max index', signal_df.index.max())
+
+        result = backtest_strategy(
+                df=signal_df,
+                stop_loss_pct=stop_loss_pct,
+                take_profit_pct=take_profit_pct,
+                return_trades=True,
+                **BACKTEST_SETTINGS
+            )
+        trades_df = result.pop("trades_df")
+        result.pop("equity_curve", None)
+        pnl = trades_df["pnl_pct"].to_numpy(dtype=np.float64)
+
+        start_date = signal_df.index.min()
+        end_date = signal_df.index.max()
+
+    if key is not None and cached is None:
+        # Пересчитанный (полностью или с сохранённого состояния) результат - в кэш
+        BACKTEST_CACHE.put(key, {"result": result,
+                                 "pnl": pnl.tolist(),
+                                 "start_date": start_date.isoformat(),
+                                 "end_date": end_date.isoformat()})
 
     print(f'----------------{strategy_nm}-----------------')
     print('result')
@@ -357,10 +360,17 @@ def run_strategy_tester(file):
         print(f'{key}: {result[key]} ')
     print(f'----------------strategy {strategy} end-----------------')
 
-    start_date = signal_df.index.min()
-    end_date = signal_df.index.max()
     days = (end_date - start_date).days
 
+    # Разброс доходности и просадки по перестановкам и бутстрапу сделок (monte_carlo.py)
+    bands = ""
+    if MC_PATHS > 0:
+        bands = format_bands(monte_carlo(pd.DataFrame({"pnl_pct": pnl}), paths=MC_PATHS,
+                                         initial_balance=BACKTEST_SETTINGS["initial_balance"]), MC_PATHS)
+        if bands:
+            print(bands)
+            bands += "\n\n"
+
     msg = (
         f"📊 *{strategy_nm}*\n\n"
         f"📅 *Дата начала:* `{start_date.strftime('%Y-%m-%d')}`\n"
@@ -371,32 +381,48 @@ def run_strategy_tester(file):
         f"🔄 *Всего сделок:* `{result['total_trades']}`\n"
         f"📈 *Средняя прибыль на сделку:* `{result['avg_trade']:.3f}%`\n"
         f"⚖️ *Коэффициент Шарпа:* `{result['sharpe_ratio']:.3f}`\n\n"
+        f"{bands}"
         f"🕒 Отчёт сформирован: {end_date.strftime('%Y-%m-%d %H:%M:%S UTC')}"
     )
 
-    send_telegram_message(tg_token = TELEGRAM_TOKEN
-                         ,tg_chat_id = TELEGRAM_CHAT_ID 
-                         ,message = msg
-                         ,parse_mode="Markdown")
-
-engine = create_engine(
-    f"postgresql+psycopg2://{DB_USER}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-)
-
-conn = psycopg2.connect(
-    dbname=DB_NAME,
-    user=DB_USER,
-    password=DB_PASS,
-    host=DB_HOST,
-    port=DB_PORT
-)
-conn.autocommit = True
-cur = conn.cursor()
-
-# Запуск всех стратегий
-for f in os.listdir(STRATEGIES_FOLDER):
-    if f.endswith(".py"):
-        run_strategy_tester(os.path.join(STRATEGIES_FOLDER, f))
-
-cur.close()
-conn.close()
+    NOTIFIER.notify(msg)
+
+def main():
+    # Запуск всех стратегий
+    for info in REGISTRY.discover().values():
+        run_strategy_tester(info.path)
+
+    if BACKTEST_CACHE is not None:
+        removed = BACKTEST_CACHE.evict()
+        print(f"Кэш бэктеста: {BACKTEST_CACHE.stats()}, удалено старых записей {removed}")
+
+    NOTIFIER.close()
+    dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Еженедельная статистика стратегий")
+    parser.add_argument("--walk-forward", action="store_true",
+                        help="walk-forward проверка вместо отчёта по всей истории (параметры - см. walk_forward.py)")
+    parser.add_argument("--portfolio", action="store_true",
+                        help="портфельный бэктест всех стратегий на одном счёте (параметры - см. portfolio.py)")
+    args, rest = parser.parse_known_args()
+
+    if args.walk_forward:
+        import walk_forward
+        try:
+            walk_forward.main(rest)
+        finally:
+            # Скрипт запущен как __main__: walk_forward импортировал отдельный модуль strategy_stat
+            # со своим NOTIFIER - закрывается именно его очередь
+            walk_forward.NOTIFIER.close()
+            dispose()
+    elif args.portfolio:
+        import portfolio
+        try:
+            portfolio.main(rest)
+        finally:
+            portfolio.NOTIFIER.close()   # как и для walk_forward - очередь импортированного strategy_stat
+            dispose()
+    else:
+        main()
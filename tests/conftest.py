@@ -0,0 +1,73 @@
+# Общие данные тестов: синтетические котировки и подключение к тестовой БД
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from strategy_registry import StrategyRegistry   # noqa: E402
+
+# Путь к стратегиям - от корня репозитория, чтобы pytest можно было запускать из любой папки
+REGISTRY = StrategyRegistry(os.path.join(ROOT, "strategies"))
+assert REGISTRY.discover(), f"нет стратегий в {REGISTRY.folder}"
+
+
+def make_ohlcv(n: int = 3000, seed: int = 0, start: str = "2023-01-01") -> pd.DataFrame:
+    """Случайное блуждание цены: часовые бары BTC/USDT в формате fetch_ohlcv."""
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.006, n)))
+    open_ = np.r_[close[0], close[:-1]] * (1 + rng.normal(0, 0.001, n))
+    high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0, 0.004, n)))
+    low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0, 0.004, n)))
+    index = pd.date_range(start, periods=n, freq="h", tz="UTC", name="timestamp")
+    return pd.DataFrame({"open": open_, "high": high, "low": low, "close": close,
+                         "volume": rng.uniform(10, 100, n), "symbol": "BTC/USDT", "timeframe": "1h"},
+                        index=index)
+
+
+@pytest.fixture(scope="session")
+def pg_engine():
+    """Engine тестовой БД (DB_HOST и др. из окружения); без БД тест пропускается."""
+    if not os.getenv("DB_HOST"):
+        pytest.skip("DB_HOST не задан")
+    from db import get_engine
+    engine = get_engine()
+    try:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("CREATE SCHEMA IF NOT EXISTS test")
+            conn.commit()
+    except Exception as exc:
+        pytest.skip(f"БД недоступна: {exc}")
+    return engine
+
+
+OHLCV_TABLE = "test.pytest_ohlcv"
+
+
+@pytest.fixture
+def ohlcv_table(pg_engine):
+    """Пустая таблица котировок в формате test.btc_usd_t (удаляется после теста)."""
+    drop = f"DROP TABLE IF EXISTS {OHLCV_TABLE}"
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(drop)
+        conn.exec_driver_sql(f"""
+            CREATE TABLE {OHLCV_TABLE} (
+                timestamp timestamptz NOT NULL,
+                open double precision, high double precision, low double precision,
+                close double precision, volume double precision,
+                symbol text NOT NULL, timeframe text NOT NULL,
+                UNIQUE (symbol, timeframe, timestamp)
+            )""")
+    yield OHLCV_TABLE
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(drop)
+
+
+def insert_ohlcv(engine, table: str, df: pd.DataFrame):
+    """Дописывает бары make_ohlcv в таблицу котировок."""
+    schema, name = table.split(".")
+    df.reset_index().to_sql(name, engine, schema=schema, if_exists="append", index=False)
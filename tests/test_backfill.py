@@ -0,0 +1,87 @@
+# Загрузка истории кусками: прерванная загрузка продолжается с недокачанных кусков
+# (записанная биржа RecordedExchange и заглушка вместо Postgres)
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "load_market_data"))
+
+from backfill import RecordedExchange, backfill                 # noqa: E402
+from load_main import ExchangePool                              # noqa: E402
+from market_data_fetcher import MarketDataFetcher               # noqa: E402
+
+SYMBOL, TIMEFRAME = "BTC/USDT", "1h"
+CHUNK_DAYS = 10
+
+
+class StubClient:
+    """Вместо PostgresClient: строки по ключу (время, символ, таймфрейм), как UPSERT DO NOTHING."""
+
+    def __init__(self, fail_calls=()):
+        self.rows = set()
+        self.calls = 0
+        self.fail_calls = set(fail_calls)
+
+    def save_market_data(self, df, table, notify=True):
+        self.calls += 1
+        if self.calls in self.fail_calls:
+            raise ConnectionError("соединение с БД потеряно")
+        keys = set(zip(df["timestamp"], df["symbol"], df["timeframe"]))
+        inserted = len(keys - self.rows)
+        self.rows |= keys
+        return inserted
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    """120 дней часовых свечей, заканчивающихся за сутки до текущего часа."""
+    end = pd.Timestamp.now(tz="UTC").floor("h") - pd.Timedelta(days=1)
+    index = pd.date_range(end=end, periods=120 * 24, freq="h")
+    candles = [[int(ts.timestamp() * 1000), 100.0 + i, 101.0 + i, 99.0 + i, 100.5 + i, 1.0]
+               for i, ts in enumerate(index)]
+    path = tmp_path / "recorded_ohlcv.json"
+    path.write_text(json.dumps({f"{SYMBOL}|{TIMEFRAME}": candles}))
+    return str(path), index
+
+
+def _run(recorded_path, client, checkpoint, start, end=None):
+    exchange = RecordedExchange(recorded_path)
+    pool = ExchangePool(factory=lambda name: MarketDataFetcher(name, exchange=exchange))
+    inserted = backfill(client, pool, "okx", SYMBOL, TIMEFRAME, start=start, end=end,
+                        chunk_days=CHUNK_DAYS, workers=2, checkpoint_path=checkpoint, table="btc_usd_t")
+    return inserted, exchange.requests
+
+
+@pytest.mark.parametrize("explicit_end", [True, False])
+def test_interrupted_backfill_resumes(recorded, tmp_path, explicit_end):
+    recorded_path, index = recorded
+    start = index[0].tz_localize(None)
+    end = (index[-1] + pd.Timedelta(hours=1)).tz_localize(None) if explicit_end else None
+    checkpoint = str(tmp_path / "checkpoint.json")
+    chunks = 12 if explicit_end else 13   # без --end период идёт до текущего часа
+
+    # Первый запуск: запись двух кусков обрывается
+    client = StubClient(fail_calls={3, 7})
+    first, _ = _run(recorded_path, client, checkpoint, start, end)
+    with open(checkpoint) as f:
+        saved = json.load(f)
+    assert len(saved["done"]) == chunks - 2
+    assert first == len(client.rows) < len(index)
+
+    # Повторный запуск с теми же аргументами: только два недокачанных куска
+    client.fail_calls = set()
+    calls = client.calls
+    second, requests = _run(recorded_path, client, checkpoint, start, end)
+    with open(checkpoint) as f:
+        resumed = json.load(f)
+    assert resumed["params"]["end"] == saved["params"]["end"]
+    assert len(resumed["done"]) == chunks
+    assert client.calls - calls == 2
+    assert first + second == len(client.rows) == len(index)
+
+    # Завершённая загрузка больше ничего не качает
+    if explicit_end:
+        assert _run(recorded_path, client, checkpoint, start, end) == (0, 0)
@@ -0,0 +1,54 @@
+# Движок на массивах NumPy против эталонного побарного цикла strategy_stat.backtest_strategy_loop
+import numpy as np
+import pandas as pd
+import pytest
+
+import backtest_engine
+import strategy_stat
+from backtest_engine import sweep_sl_tp
+from conftest import make_ohlcv
+from strategy_stat import BACKTEST_SETTINGS, backtest_strategy, backtest_strategy_loop
+
+SL_TP_PAIRS = [(sl, tp) for sl in (0.1, 0.5, 1.0, 3.0, 50.0) for tp in (0.1, 0.8, 2.0, 10.0)]
+METRICS = ("total_return", "win_rate", "total_trades", "avg_trade", "sharpe_ratio", "max_drawdown", "profit_factor")
+
+
+def random_signal_df(n: int, seed: int, density: float) -> pd.DataFrame:
+    """Случайные котировки и сигналы -1/0/1 (density - доля баров с сигналом)."""
+    df = make_ohlcv(n, seed)
+    rng = np.random.default_rng(seed + 1000)
+    df["signal"] = rng.choice([-1, 0, 1], size=n, p=[density / 2, 1 - density, density / 2])
+    return df
+
+
+def loop_backtest(monkeypatch, df: pd.DataFrame, sl: float, tp: float) -> tuple:
+    """Метрики и сделки побарного цикла (сделки перехватываются на входе trade_metrics)."""
+    captured = []
+
+    def capture(trades_df, initial_balance=10000.0):
+        captured.append(trades_df)
+        return backtest_engine.trade_metrics(trades_df, initial_balance)
+
+    monkeypatch.setattr(strategy_stat, "trade_metrics", capture)
+    metrics = backtest_strategy_loop(df, sl, tp, **BACKTEST_SETTINGS)
+    monkeypatch.undo()
+    return metrics, captured[0]
+
+
+@pytest.mark.parametrize("seed,n,density", [(0, 600, 0.02), (1, 600, 0.2), (2, 400, 0.7), (3, 5, 1.0), (4, 300, 0.0)])
+def test_engine_matches_loop(monkeypatch, seed, n, density):
+    df = random_signal_df(n, seed, density)
+    sweep = sweep_sl_tp(df, SL_TP_PAIRS, **BACKTEST_SETTINGS)
+
+    for sl, tp in SL_TP_PAIRS:
+        expected, expected_trades = loop_backtest(monkeypatch, df, sl, tp)
+        result = backtest_strategy(df, sl, tp, **BACKTEST_SETTINGS, return_trades=True)
+
+        for name in METRICS:
+            assert result[name] == expected[name], (sl, tp, name)
+            assert sweep[(sl, tp)][name] == expected[name], (sl, tp, name)
+
+        trades = result["trades_df"]
+        assert len(trades) == len(expected_trades), (sl, tp)
+        if len(trades):
+            pd.testing.assert_frame_equal(trades, expected_trades[trades.columns], check_dtype=False)
@@ -0,0 +1,42 @@
+# Инкрементальный бэктест: цепочка продолжений с сохранённого состояния
+# должна давать те же метрики и сделки, что и полный бэктест по всей истории
+import warnings
+
+import numpy as np
+import pytest
+
+from backtest_engine import run_backtest
+from backtest_state import run_incremental
+from conftest import REGISTRY, make_ohlcv
+from strategy_stat import BACKTEST_SETTINGS
+
+
+@pytest.mark.parametrize("name", sorted(REGISTRY.discover()))
+def test_resumed_run_matches_full_backtest(tmp_path, name):
+    info = REGISTRY.discover()[name]
+    stop_loss_pct, take_profit_pct = info.stop_loss * 100, info.take_profit * 100
+    data = make_ohlcv(3000, seed=11)
+    state_path = str(tmp_path / f"{name}.json")
+
+    # Случайные точки продолжения, повторный запуск без новых баров и один бар за раз
+    rng = np.random.default_rng(5)
+    cuts = sorted(rng.choice(np.arange(600, 2990), size=8, replace=False).tolist())
+    cuts = cuts[:4] + [cuts[3]] + cuts[4:] + [2998, 2999, 3000, 3000]
+
+    previous = None
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        for end in cuts:
+            history = data.iloc[:end]
+            metrics, start, last, processed, pnl = run_incremental(
+                info, history, stop_loss_pct, take_profit_pct, BACKTEST_SETTINGS, state_path)
+            full = run_backtest(info.module.trading_strategy(history), stop_loss_pct, take_profit_pct,
+                                **BACKTEST_SETTINGS, return_trades=True)
+
+            assert metrics == {key: full[key] for key in metrics}, end
+            expected_pnl = full["trades_df"]["pnl_pct"].to_numpy() if full["total_trades"] else np.array([])
+            np.testing.assert_allclose(pnl, expected_pnl, rtol=0, atol=1e-9, err_msg=str(end))
+            assert (start, last) == (history.index[0], history.index[-1])
+            # продолжение считает только новые бары
+            assert processed == end - (previous or 0), end
+            previous = end
@@ -0,0 +1,59 @@
+# Online-индикаторы и online-версии стратегий совпадают с расчётом pandas бит в бит
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import REGISTRY, make_ohlcv
+from indicators import EMA, SMA, RollingMax, RollingMin, Shift, _RollingExtremum, run_online
+
+ONLINE_STRATEGIES = sorted(name for name, info in REGISTRY.discover().items()
+                           if hasattr(info.module, "update_bar"))
+
+
+def _series() -> pd.Series:
+    rng = np.random.default_rng(1)
+    values = 100 + np.cumsum(rng.normal(0, 1, 2000))
+    values[rng.choice(len(values), 60, replace=False)] = np.nan   # пропуски
+    values[500:520] = values[499]                                  # повторы подряд
+    return pd.Series(values)
+
+
+@pytest.mark.parametrize("indicator, expected", [
+    (lambda: SMA(20), lambda s: s.rolling(20).mean()),
+    (lambda: EMA(25), lambda s: s.ewm(span=25, adjust=False).mean()),
+    (lambda: RollingMax(14), lambda s: s.rolling(14).max()),
+    (lambda: RollingMin(14), lambda s: s.rolling(14).min()),
+    (lambda: Shift(3), lambda s: s.shift(3)),
+])
+def test_indicator_matches_pandas(indicator, expected):
+    series = _series()
+    online = indicator()
+    values = [online.update(x) for x in series.tolist()]
+    np.testing.assert_array_equal(np.array(values), expected(series).to_numpy())
+
+
+def test_rolling_extremum_is_abstract():
+    with pytest.raises(TypeError):
+        _RollingExtremum(5)
+
+
+@pytest.mark.parametrize("name", ONLINE_STRATEGIES)
+def test_online_strategy_matches_vectorized(name, tmp_path):
+    info = REGISTRY.discover()[name]
+    data = make_ohlcv(3000, seed=5)
+    state_path = str(tmp_path / f"indicators_{name}.json")
+
+    # Бары приходят порциями, между порциями состояние сохраняется в JSON
+    chunks = []
+    for end in (1000, 1001, 1500, 2222, 2999, 3000):
+        chunks.append(run_online(info.module, data.iloc[:end], state_path, info.source_hash))
+    online = pd.concat(chunks)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        full = info.module.trading_strategy(data)
+    assert online.index.equals(full.index)
+    np.testing.assert_array_equal(online["signal"].to_numpy(dtype=np.int64),
+                                  full["signal"].to_numpy(dtype=np.int64))
@@ -0,0 +1,44 @@
+# Parquet-зеркало котировок: после инкрементального обновления чтение совпадает с прямым чтением из БД
+import pandas as pd
+import pytest
+
+from conftest import insert_ohlcv, make_ohlcv
+from market_data import fetch_ohlcv
+
+pytest.importorskip("pyarrow")
+from market_cache import MarketDataCache   # noqa: E402
+
+
+def _assert_same(cache: MarketDataCache, engine, table: str, symbol: str = "BTC/USDT", timeframe: str = "1h"):
+    pd.testing.assert_frame_equal(cache.read(symbol, timeframe), fetch_ohlcv(engine, table, symbol, timeframe),
+                                  check_freq=False, check_index_type=False)
+
+
+def test_incremental_refresh_matches_direct_read(pg_engine, ohlcv_table, tmp_path):
+    data = make_ohlcv(2000, seed=4, start="2023-01-20")   # история на несколько месяцев
+    insert_ohlcv(pg_engine, ohlcv_table, data.iloc[:1500])
+    insert_ohlcv(pg_engine, ohlcv_table, make_ohlcv(100, seed=5).assign(timeframe="1d"))
+
+    cache = MarketDataCache(str(tmp_path), ohlcv_table)
+    assert cache.refresh(pg_engine) == 1600
+    _assert_same(cache, pg_engine, ohlcv_table)
+    _assert_same(cache, pg_engine, ohlcv_table, timeframe="1d")
+
+    # Новые бары: дописываются только они, в том числе в уже существующий месячный файл
+    insert_ohlcv(pg_engine, ohlcv_table, data.iloc[1500:1800])
+    assert cache.refresh(pg_engine) == 300
+    assert cache.refresh(pg_engine) == 0
+    _assert_same(cache, pg_engine, ohlcv_table)
+
+    # Новый процесс читает тот же manifest и тоже обновляется инкрементально
+    cache = MarketDataCache(str(tmp_path), ohlcv_table)
+    insert_ohlcv(pg_engine, ohlcv_table, data.iloc[1800:])
+    assert cache.refresh(pg_engine, "BTC/USDT", "1h") == 200
+    _assert_same(cache, pg_engine, ohlcv_table)
+    pd.testing.assert_frame_equal(cache.read("BTC/USDT", "1h", limit=50), data.tail(50), check_freq=False,
+                                  check_index_type=False)
+
+    # Догрузка старой истории меняет число строк - пара перестраивается целиком
+    insert_ohlcv(pg_engine, ohlcv_table, make_ohlcv(24, seed=6, start="2023-01-01"))
+    assert cache.refresh(pg_engine, "BTC/USDT", "1h") == 2024
+    _assert_same(cache, pg_engine, ohlcv_table)
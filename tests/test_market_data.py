@@ -0,0 +1,50 @@
+# Чтение OHLCV через COPY BINARY: те же значения, что и у pd.read_sql, но сразу float64
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import insert_ohlcv, make_ohlcv
+from market_data import OHLCV_COLUMNS, fetch_ohlcv
+
+
+def _read_sql(engine, table: str, symbol: str, timeframe: str) -> pd.DataFrame:
+    df = pd.read_sql(f"SELECT timestamp, {', '.join(OHLCV_COLUMNS)}, symbol, timeframe FROM {table} "
+                     "WHERE symbol = %(symbol)s AND timeframe = %(timeframe)s ORDER BY timestamp",
+                     engine, params={"symbol": symbol, "timeframe": timeframe}, index_col="timestamp")
+    # numeric читается как Decimal: значения писались из float, приведение без потерь
+    return df.astype({c: np.float64 for c in OHLCV_COLUMNS})
+
+
+@pytest.mark.parametrize("column_type", ["double precision", "numeric"])
+def test_copy_reader_matches_read_sql(pg_engine, ohlcv_table, column_type):
+    if column_type != "double precision":
+        # старые таблицы с numeric (до _migrate_ohlcv_to_double)
+        with pg_engine.begin() as conn:
+            for c in OHLCV_COLUMNS:
+                conn.exec_driver_sql(f"ALTER TABLE {ohlcv_table} ALTER COLUMN {c} TYPE {column_type}")
+    btc = make_ohlcv(500, seed=1)
+    btc.iloc[7, btc.columns.get_loc("volume")] = np.nan   # NULL -> NaN
+    eth = make_ohlcv(300, seed=2, start="2023-01-05").assign(symbol="ETH/USDT")
+    daily = make_ohlcv(50, seed=3).assign(timeframe="1d")
+    for df in (btc, eth, daily):
+        insert_ohlcv(pg_engine, ohlcv_table, df)
+
+    df = fetch_ohlcv(pg_engine, ohlcv_table, "BTC/USDT", "1h")
+    expected = _read_sql(pg_engine, ohlcv_table, "BTC/USDT", "1h")
+    assert (df[OHLCV_COLUMNS].dtypes == np.float64).all()
+    assert str(df.index.tz) == "UTC"
+    pd.testing.assert_frame_equal(df, expected, check_freq=False, check_index_type=False)
+    np.testing.assert_array_equal(df[OHLCV_COLUMNS].to_numpy(), btc[OHLCV_COLUMNS].to_numpy())
+
+    # Границы и limit - как у запроса с теми же условиями
+    cut = btc.index[200]
+    pd.testing.assert_frame_equal(fetch_ohlcv(pg_engine, ohlcv_table, "BTC/USDT", "1h", since=cut),
+                                  expected[expected.index >= cut], check_freq=False, check_index_type=False)
+    pd.testing.assert_frame_equal(fetch_ohlcv(pg_engine, ohlcv_table, "BTC/USDT", "1h", after=cut, limit=20),
+                                  expected.tail(20), check_freq=False, check_index_type=False)
+
+    # Без symbol - все пары таймфрейма, без свечей других таймфреймов
+    hourly = fetch_ohlcv(pg_engine, ohlcv_table, timeframe="1h")
+    assert len(hourly) == 800
+    assert set(hourly["timeframe"]) == {"1h"}
+    assert hourly.index.is_monotonic_increasing
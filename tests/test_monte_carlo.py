@@ -0,0 +1,52 @@
+# Монте-Карло по сделкам: метрики путей совпадают с trade_metrics, перцентили всегда конечны
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest_engine import trade_metrics
+from monte_carlo import monte_carlo, path_metrics, resample
+
+
+def random_pnl(n: int = 200, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).normal(0.1, 1.5, n)
+
+
+@pytest.mark.parametrize("pnl", [random_pnl(), np.array([2.0, -1.0]), np.array([-1.0, -2.0, 0.5])])
+def test_identity_path_matches_trade_metrics(pnl):
+    metrics = path_metrics(pnl[None, :], initial_balance=10000.0)
+    expected = trade_metrics(pd.DataFrame({"pnl_pct": pnl}), initial_balance=10000.0)
+    for name in ("total_return", "max_drawdown", "sharpe_ratio", "profit_factor"):
+        assert round(float(metrics[name][0]), 2) == expected[name], name
+    assert metrics["compound_return"][0] == pytest.approx((np.prod(1 + pnl / 100) - 1) * 100)
+
+
+def test_shuffle_keeps_total_return():
+    pnl = random_pnl(seed=1)
+    matrix = resample(pnl, 500, "shuffle", np.random.default_rng(2))
+    np.testing.assert_array_equal(np.sort(matrix, axis=1), np.broadcast_to(np.sort(pnl), matrix.shape))
+    np.testing.assert_allclose(path_metrics(matrix)["total_return"], pnl.sum())
+
+    band = monte_carlo(pd.DataFrame({"pnl_pct": pnl}), paths=500)["shuffle"]["total_return"]
+    assert len(set(band.values())) == 1
+
+
+@pytest.mark.parametrize("pnl", [[1.0, 2.0], [1.0, 2.0, 3.0, -0.5]])
+def test_bands_finite_without_losing_trades(pnl):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", RuntimeWarning)
+        bands = monte_carlo(pd.DataFrame({"pnl_pct": pnl}), paths=1000)
+
+    for method, metrics in bands.items():
+        for name, band in metrics.items():
+            if name == "infinite_profit_factor":
+                assert 0 <= band <= 1000, method
+                continue
+            assert np.isfinite(list(band.values())).all(), (method, name)
+    # бутстрап выбирает и пути только из прибыльных сделок
+    assert bands["bootstrap"]["infinite_profit_factor"] > 0
+    # все пути без убытков: перцентилей profit factor нет, но число путей известно
+    if min(pnl) > 0:
+        assert bands["shuffle"]["infinite_profit_factor"] == 1000
+        assert bands["shuffle"]["profit_factor"] == {}
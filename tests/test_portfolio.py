@@ -0,0 +1,78 @@
+# Портфельный бэктест: выход в конце данных и просадка с переоценкой открытых позиций
+import numpy as np
+import pandas as pd
+
+from portfolio import portfolio_backtest
+
+SETTINGS = {"initial_balance": 10000.0, "trade_size": 1.0, "commission_pct": 0.0, "slippage_pct": 0.0}
+
+
+def market(close: list) -> pd.DataFrame:
+    """Бары с open = close предыдущего бара и high/low по open и close."""
+    close = np.array(close, dtype=np.float64)
+    open_ = np.r_[close[0], close[:-1]]
+    index = pd.date_range("2024-01-01", periods=len(close), freq="h", tz="UTC")
+    return pd.DataFrame({"open": open_, "high": np.maximum(open_, close),
+                         "low": np.minimum(open_, close), "close": close}, index=index)
+
+
+def run(close: list, signal: list, stop_loss_pct: float = 50.0, take_profit_pct: float = 50.0) -> dict:
+    signals = np.array(signal, dtype=np.int64).reshape(-1, 1)
+    return portfolio_backtest({"BTC/USDT": market(close)}, signals, ["s"], ["BTC/USDT"],
+                              [stop_loss_pct], [take_profit_pct], [1.0], **SETTINGS)
+
+
+def test_signal_on_last_bars_ends_with_end_of_data():
+    # Позиция, открытая на последнем баре, закрывается по концу данных без повторного входа
+    result = run([100, 100, 100, 100], [0, 0, 1, 1])
+    trades = result["trades"]
+    assert list(trades["reason"]) == ["end_of_data"]
+    assert list(trades["entry_idx"]) == [3]
+
+
+def test_drawdown_marks_open_position_to_market():
+    # Лонг проседает на 20% и закрывается в плюс по тейку: по закрытым сделкам просадки нет
+    result = run([100, 100, 90, 80, 95, 120], [1, 0, 0, 0, 0, 0], take_profit_pct=15.0)
+    trades = result["trades"]
+    assert list(trades["reason"]) == ["take_profit"]
+    assert result["summary"]["total_return"] == 15.0
+
+    equity = result["equity"].to_numpy()
+    np.testing.assert_allclose(equity, [10000, 10000, 9000, 8000, 9500, 11500])
+    assert result["summary"]["max_drawdown"] == -20.0
+
+
+def test_symbol_gap_defers_entry_to_next_bar_of_symbol():
+    # У B нет бара 3 общей шкалы: сигнал бара 2 исполняется на open бара 4, а не на пропуске
+    a = market([100, 101, 102, 103, 104, 105])
+    b = market([50, 51, 52, 53, 54, 55]).drop(a.index[3])
+    b.loc[a.index[4], "open"] = 52.5
+    markets = {"A": a, "B": b.reindex(a.index)}
+    signals = np.zeros((6, 2), dtype=np.int64)
+    signals[2, 1] = 1
+    result = portfolio_backtest(markets, signals, ["a", "b"], ["A", "B"], [50.0, 50.0], [50.0, 50.0],
+                                [0.5, 0.5], **SETTINGS)
+
+    trades = result["trades"]
+    assert list(trades["entry_idx"]) == [4]
+    assert trades["entry_price"].iloc[0] == 52.5
+    assert trades["pnl_pct"].notna().all()
+    summary = result["summary"]
+    assert np.isfinite([summary["final_equity"], summary["total_return"], summary["max_drawdown"]]).all()
+    assert summary["final_equity"] == round(10000 + 5000 * (55 / 52.5 - 1), 2)
+    assert result["equity"].notna().all()
+
+
+def test_position_open_at_end_closes_on_last_known_close():
+    # Последнего бара общей шкалы у B нет: позиция закрывается по последнему close B
+    a = market([100, 101, 102, 103, 104, 105])
+    b = market([50, 51, 52, 53, 54, 55]).drop(a.index[5])
+    signals = np.zeros((6, 2), dtype=np.int64)
+    signals[1, 1] = 1
+    result = portfolio_backtest({"A": a, "B": b.reindex(a.index)}, signals, ["a", "b"], ["A", "B"],
+                                [50.0, 50.0], [50.0, 50.0], [0.5, 0.5], **SETTINGS)
+
+    trades = result["trades"]
+    assert list(trades["reason"]) == ["end_of_data"]
+    assert trades["exit_price"].iloc[0] == 54
+    assert np.isfinite(result["summary"]["final_equity"])
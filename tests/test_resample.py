@@ -0,0 +1,39 @@
+# Свечи старших таймфреймов из 1h: то же, что агрегация DataFrame.resample
+import pandas as pd
+import pytest
+
+from conftest import make_ohlcv
+from resample import OHLCV_AGG, WEEK_ORIGIN, OhlcvResampler, resample_ohlcv
+
+OHLCV_COLUMNS = list(OHLCV_AGG)
+
+
+def pandas_resample(df: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+    rule, origin = ("7D", WEEK_ORIGIN) if timeframe == "1w" else (timeframe, "epoch")
+    return df[OHLCV_COLUMNS].resample(rule, origin=origin).agg(OHLCV_AGG)
+
+
+@pytest.mark.parametrize("timeframe", ["4h", "1d", "1w"])
+def test_resample_matches_pandas(timeframe):
+    # Начало и конец не совпадают с границами интервалов: первый и последний неполные
+    base = make_ohlcv(1500, seed=8, start="2023-01-03 05:00")
+    delta = pd.Timedelta(timeframe)
+    expected = pandas_resample(base, timeframe)
+    assert expected.index[0] < base.index[0] and expected.index[-1] + delta > base.index[-1] + pd.Timedelta("1h")
+
+    partial = resample_ohlcv(base, timeframe, complete_only=False)
+    pd.testing.assert_frame_equal(partial[OHLCV_COLUMNS], expected, check_freq=False)
+    assert (partial["timeframe"] == timeframe).all()
+
+    # complete_only - без неполных первого и последнего интервалов
+    complete = resample_ohlcv(base, timeframe)
+    pd.testing.assert_frame_equal(complete[OHLCV_COLUMNS], expected.iloc[1:-1], check_freq=False)
+
+
+def test_incremental_resampler_matches_full_resample():
+    base = make_ohlcv(2000, seed=9, start="2023-01-03 05:00")
+    resampler = OhlcvResampler("4h")
+    for end in range(300, 2001, 7):
+        # Скользящее окно, как в цикле runner.py
+        window = base.iloc[max(0, end - 500):end]
+        pd.testing.assert_frame_equal(resampler.update(window), resample_ohlcv(window, "4h"), check_freq=False)
@@ -0,0 +1,86 @@
+# Сохранение signal_df в режиме upsert: цикл runner.py по окну LOOKBACK не меняет историю
+import warnings
+
+import pandas as pd
+import pytest
+
+from conftest import REGISTRY, make_ohlcv
+from signal_store import SIGNAL_SCHEMA, save_signal_df
+
+TABLE = "signal_df_pytest_macd_hist"
+LOOKBACK_MARGIN = 10   # как в runner.py
+
+
+@pytest.fixture
+def signal_table(pg_engine):
+    drop = f"DROP TABLE IF EXISTS {SIGNAL_SCHEMA}.{TABLE}"
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(drop)
+    yield TABLE
+    with pg_engine.begin() as conn:
+        conn.exec_driver_sql(drop)
+
+
+def _stored(engine) -> pd.Series:
+    return pd.read_sql(f'SELECT "timestamp", signal FROM {SIGNAL_SCHEMA}.{TABLE} ORDER BY "timestamp"',
+                       engine, index_col="timestamp")["signal"]
+
+
+def test_window_cycle_keeps_history(pg_engine, signal_table):
+    info = REGISTRY.discover()["macd_hist"]
+    data = make_ohlcv(3001, seed=3)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        history = info.module.trading_strategy(data.iloc[:3000])
+        # Один цикл runner.py: окно LOOKBACK, последний бар - новый
+        window = info.module.trading_strategy(data.tail(info.lookback + LOOKBACK_MARGIN))
+
+    assert save_signal_df(history, signal_table, pg_engine) == 3000
+    before = _stored(pg_engine)
+    # Бары прогрева окна отличаются от полной истории - их и нельзя записывать
+    overlap = window.index[:-1]
+    assert (window.loc[overlap, "signal"] != history.loc[overlap, "signal"]).any()
+
+    assert save_signal_df(window, signal_table, pg_engine) == 1
+    after = _stored(pg_engine)
+    assert len(after) == 3001
+    pd.testing.assert_series_equal(after.iloc[:3000], before)
+    assert after.iloc[-1] == window["signal"].iloc[-1]
+
+    # Повторный цикл без новых баров ничего не пишет
+    assert save_signal_df(window, signal_table, pg_engine) == 0
+
+
+def test_online_cycles_keep_history_in_replace_mode(pg_engine, signal_table, tmp_path, monkeypatch):
+    # ONLINE_INDICATORS=1 и SIGNAL_PERSIST_MODE=replace: run_online возвращает только новые бары,
+    # runner.py должен дописывать их, а не пересоздавать таблицу
+    import runner
+
+    info = REGISTRY.discover()["macd_hist"]
+    data = make_ohlcv(3002, seed=3)
+    current = {}
+    monkeypatch.setattr(runner, "ONLINE_INDICATORS", True)
+    monkeypatch.setattr(runner, "SIGNAL_PERSIST_MODE", "replace")
+    monkeypatch.setattr(runner, "STATE_DIR", str(tmp_path))
+    monkeypatch.setattr(runner, "engine", pg_engine)
+    monkeypatch.setattr(runner, "get_market_data", lambda *args, **kwargs: current["data"])
+    monkeypatch.setattr(runner, "last_closed_bar", lambda timeframe, now: current["data"].index[-1])
+    monkeypatch.setattr(runner, "save_signal_df",
+                        lambda df, table_name, engine, **kwargs: save_signal_df(df, signal_table, engine, **kwargs))
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        # Первый цикл прогревает индикаторы на всей истории, следующие - по окну LOOKBACK
+        current["data"] = data.iloc[:3000]
+        runner.evaluate_strategy(info.path)
+        before = _stored(pg_engine)
+        for end in (3001, 3002):
+            current["data"] = data.iloc[:end].tail(info.lookback + LOOKBACK_MARGIN)
+            runner.evaluate_strategy(info.path)
+        expected = info.module.trading_strategy(data)["signal"]
+
+    after = _stored(pg_engine)
+    assert len(before) == 3000
+    assert len(after) == 3002
+    pd.testing.assert_series_equal(after.iloc[:3000], before)
+    assert list(after.iloc[3000:]) == list(expected.iloc[3000:])
@@ -0,0 +1,24 @@
+# Стратегии в оконном режиме (runner.py, backtest_state.py): сигнал по окну LOOKBACK
+# должен совпадать с сигналом, посчитанным по всей истории
+import warnings
+
+import numpy as np
+import pytest
+
+from conftest import REGISTRY, make_ohlcv
+
+LOOKBACK_MARGIN = 10   # как в runner.py
+
+
+@pytest.mark.parametrize("name", sorted(REGISTRY.discover()))
+def test_window_signal_matches_full_history(name):
+    info = REGISTRY.discover()[name]
+    if info.lookback is None:
+        pytest.skip("окно не объявлено - стратегия всегда получает всю историю")
+    data = make_ohlcv(3000, seed=7)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        full = info.module.trading_strategy(data)["signal"].to_numpy()
+        window = [info.module.trading_strategy(data.iloc[:end].tail(info.lookback + LOOKBACK_MARGIN))["signal"].iloc[-1]
+                  for end in range(500, 3001, 25)]
+    np.testing.assert_array_equal(window, full[499:3000:25])
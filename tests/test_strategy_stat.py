@@ -0,0 +1,50 @@
+# Еженедельный отчёт: результат, посчитанный с сохранённого состояния, попадает в кэш бэктеста
+import warnings
+
+import pytest
+
+import strategy_stat
+from backtest_cache import BacktestCache
+from conftest import REGISTRY, make_ohlcv
+
+
+class _Notifier:
+    def __init__(self):
+        self.messages = []
+
+    def notify(self, message: str):
+        self.messages.append(message)
+
+
+@pytest.fixture
+def report_env(tmp_path, monkeypatch):
+    """strategy_stat на синтетических котировках, с кэшем и состоянием во временной папке."""
+    data = make_ohlcv(2000, seed=21)
+    calls = []
+    original = strategy_stat.run_incremental
+
+    def run_incremental(*args, **kwargs):
+        calls.append(args[0].name)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(strategy_stat, "fetch_market_data", lambda *args, **kwargs: data)
+    monkeypatch.setattr(strategy_stat, "BACKTEST_CACHE", BacktestCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(strategy_stat, "BACKTEST_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(strategy_stat, "NOTIFIER", _Notifier())
+    monkeypatch.setattr(strategy_stat, "MC_PATHS", 0)
+    monkeypatch.setattr(strategy_stat, "run_incremental", run_incremental)
+    return calls
+
+
+def test_incremental_result_is_cached(report_env):
+    info = REGISTRY.discover()["macd_hist"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        strategy_stat.run_strategy_tester(info.path)
+        strategy_stat.run_strategy_tester(info.path)
+
+    cache = strategy_stat.BACKTEST_CACHE
+    assert report_env == ["macd_hist"]          # второй запуск не продолжает бэктест
+    assert (cache.hits, cache.misses) == (1, 1)
+    first, second = strategy_stat.NOTIFIER.messages
+    assert first == second
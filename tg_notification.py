@@ -1,17 +1,156 @@
+import queue
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+# Таймауты запроса к Telegram API: (подключение, чтение), секунды
+REQUEST_TIMEOUT = (5, 15)
+# Повторные попытки при сетевых ошибках, 429 и 5xx
+MAX_RETRIES = 4
+BACKOFF_BASE_SEC = 1.0
+# Максимальная длина сообщения Telegram
+MAX_MESSAGE_LEN = 4096
+DIGEST_SEPARATOR = "\n\n➖➖➖➖➖➖\n\n"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def _get_session() -> requests.Session:
+    """Общая HTTP-сессия с пулом соединений (keep-alive к api.telegram.org)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        return _session
+
 
-def send_telegram_message(tg_token, tg_chat_id, message: str, parse_mode: str = "Markdown"):
-    """Отправка сообщения в Telegram"""
+def send_telegram_message(tg_token, tg_chat_id, message: str, parse_mode: str = "Markdown") -> bool:
+    """Отправка сообщения в Telegram (синхронно, с повторами). Возвращает True при успехе."""
     if not tg_token or not tg_chat_id:
         print("[WARN] TELEGRAM_TOKEN или TELEGRAM_CHAT_ID не заданы")
-        return
+        return False
     url = f"https://api.telegram.org/bot{tg_token}/sendMessage"
     payload = {"chat_id": tg_chat_id
               ,"text": message
               ,"parse_mode": parse_mode}
-    try:
-        response = requests.post(url, data=payload)
-        if response.status_code != 200:
-            print(f"[ERROR] Telegram API error: {response.text}")
-    except Exception as e:
-        print(f"[ERROR] Ошибка отправки в Telegram: {e}")
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        delay = BACKOFF_BASE_SEC * 2 ** (attempt - 1)
+        try:
+            response = _get_session().post(url, data=payload, timeout=REQUEST_TIMEOUT)
+            if response.status_code == 200:
+                return True
+            if response.status_code == 429:
+                # Telegram сообщает, сколько ждать до следующей отправки
+                try:
+                    delay = response.json()["parameters"]["retry_after"]
+                except (ValueError, KeyError, TypeError):
+                    pass
+            elif response.status_code < 500:
+                print(f"[ERROR] Telegram API error: {response.text}")
+                return False
+            print(f"[WARN] Telegram API {response.status_code}, попытка {attempt}/{MAX_RETRIES}")
+        except requests.RequestException as e:
+            print(f"[WARN] Ошибка отправки в Telegram: {e}, попытка {attempt}/{MAX_RETRIES}")
+
+        if attempt < MAX_RETRIES:
+            time.sleep(delay)
+
+    print("[ERROR] Сообщение в Telegram не отправлено после всех попыток")
+    return False
+
+
+class TelegramNotifier:
+    """
+    Асинхронная очередь уведомлений.
+
+    notify() только кладёт сообщение в очередь и сразу возвращает управление.
+    Фоновый поток собирает сообщения, пришедшие в пределах batch_window секунд,
+    в один дайджест, соблюдает паузу min_interval между отправками в чат
+    (лимит Telegram для групп - около 20 сообщений в минуту) и повторяет отправку
+    при ошибках через send_telegram_message.
+    """
+
+    def __init__(self, tg_token, tg_chat_id, parse_mode: str = "Markdown",
+                 batch_window: float = 1.0, min_interval: float = 3.0):
+        self.tg_token = tg_token
+        self.tg_chat_id = tg_chat_id
+        self.parse_mode = parse_mode
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._last_sent = 0.0
+
+    def notify(self, message: str):
+        """Поставить сообщение в очередь на отправку (не блокирует)."""
+        self._start()
+        self._queue.put(message)
+
+    def close(self, timeout: float = 30.0):
+        """Дождаться отправки очереди (не дольше timeout) и остановить поток."""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            print(f"[WARN] Не все уведомления Telegram отправлены за {timeout} с")
+        self._thread = None
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="telegram-notifier", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            message = self._queue.get()
+            if message is None:
+                break
+
+            # Собираем всё, что пришло в окно батчинга, в один дайджест
+            batch = [message]
+            deadline = time.monotonic() + self.batch_window
+            while True:
+                try:
+                    message = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if message is None:
+                    stop = True
+                    break
+                batch.append(message)
+
+            for digest in self._build_digests(batch):
+                self._send(digest)
+
+    def _build_digests(self, batch: list) -> list:
+        digests = []
+        current = ""
+        for message in batch:
+            candidate = f"{current}{DIGEST_SEPARATOR}{message}" if current else message
+            if current and len(candidate) > MAX_MESSAGE_LEN:
+                digests.append(current)
+                current = message
+            else:
+                current = candidate
+        if current:
+            digests.append(current)
+        return digests
+
+    def _send(self, message: str):
+        pause = self._last_sent + self.min_interval - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        try:
+            send_telegram_message(self.tg_token, self.tg_chat_id, message, parse_mode=self.parse_mode)
+        except Exception as e:
+            print(f"[ERROR] Ошибка отправки в Telegram: {e}")
+        self._last_sent = time.monotonic()
@@ -0,0 +1,264 @@
+# --- Walk-forward проверка стратегий ---
+# История делится на скользящие окна: обучение TRAIN_DAYS дней, затем проверка TEST_DAYS дней,
+# окно сдвигается на длину проверки. На обучающем отрезке по сетке подбираются параметры
+# стратегии (PARAM_GRID) и SL/TP (как в optimizer.py), на следующем проверочном отрезке
+# лучшая комбинация торгуется "вслепую". Сделки проверочных отрезков склеиваются
+# в кривую капитала вне выборки (out-of-sample).
+#
+# Сигналы каждой комбинации параметров считаются один раз по всей истории (индикаторы
+# уже прогреты к началу любого окна), окна только берут срезы готовых массивов.
+# Окна считаются параллельно в пуле процессов; сигналы передаются воркерам один раз.
+# Каждый отрезок торгуется с нуля: позиция, открытая к концу отрезка, закрывается по close.
+#
+# Пример:
+#   python walk_forward.py --train-days 90 --test-days 30 --metric sharpe_ratio
+#   python strategy_stat.py --walk-forward --train-days 90 --test-days 30
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import traceback
+
+import numpy as np
+import pandas as pd
+
+from strategy_stat import REGISTRY, TABLE_MD, SYMBOL, TIMEFRAME, BACKTEST_SETTINGS, NOTIFIER, fetch_market_data
+from optimizer import (METRICS, SL_GRID, TP_GRID, OPTIMIZER_WORKERS, SIGNAL_SCHEMA,
+                       param_combinations, select_strategies, save_results, _float_list)
+from backtest_engine import sweep_sl_tp, trades_frame, trade_metrics
+from market_data import assert_float_ohlcv
+from db import dispose
+
+# ============================================================
+# 1. Конфигурация
+# ============================================================
+WF_TRAIN_DAYS = int(os.getenv("WF_TRAIN_DAYS", "90"))
+WF_TEST_DAYS = int(os.getenv("WF_TEST_DAYS", "30"))
+WINDOWS_TABLE = "walk_forward_windows"   # метрики по окнам, в схеме test
+EQUITY_TABLE = "walk_forward_equity"     # склеенная кривая капитала вне выборки
+
+SIGNAL_COLUMNS = ["open", "high", "low", "close", "signal"]
+
+# Сигналы всех комбинаций в воркере (заполняются в _init_worker)
+_FRAMES = None
+
+
+# ============================================================
+# 2. Окна и сигналы
+# ============================================================
+def make_windows(index: pd.DatetimeIndex, train_days: int, test_days: int) -> list:
+    """
+    Скользящие окна по времени: [обучение) + [проверка), сдвиг на длину проверки.
+    Возвращает словари с номерами баров (train_from, test_from, test_to) и границами по времени.
+    """
+    windows = []
+    if len(index) == 0:
+        return windows
+    train, test = pd.Timedelta(days=train_days), pd.Timedelta(days=test_days)
+    start = index[0]
+    while start + train < index[-1]:
+        test_start = start + train
+        test_end = min(test_start + test, index[-1] + pd.Timedelta(1, "ns"))
+        train_from, test_from, test_to = index.searchsorted([start, test_start, test_end])
+        if test_to > test_from and test_from > train_from:
+            windows.append({"window_no": len(windows) + 1,
+                            "train_from": int(train_from), "test_from": int(test_from), "test_to": int(test_to),
+                            "train_start": index[train_from], "test_start": index[test_from],
+                            "test_end": index[test_to - 1]})
+        start += test
+    return windows
+
+
+def precompute_signals(strategies: dict, data: pd.DataFrame) -> dict:
+    """{стратегия: {параметры (json): signal_df}} - сигналы каждой комбинации по всей истории."""
+    frames = {}
+    for info in strategies.values():
+        grid = getattr(info.module, "PARAM_GRID", None) or {}
+        frames[info.name] = {}
+        for params in param_combinations(grid):
+            signal_df = info.module.trading_strategy(data, **params)
+            frames[info.name][json.dumps(params, sort_keys=True)] = signal_df[SIGNAL_COLUMNS]
+    return frames
+
+
+# ============================================================
+# 3. Расчёт окна (в воркере)
+# ============================================================
+def _init_worker(frames):
+    """Инициализация процесса-воркера: сигналы передаются один раз и только читаются."""
+    # Унаследованный пул соединений сбрасывается в db._reset_after_fork
+    global _FRAMES
+    _FRAMES = frames
+
+
+def evaluate_window(frames: dict, window: dict, sl_grid: list, tp_grid: list,
+                    metric: str, min_trades: int) -> dict:
+    """
+    Подбор параметров и SL/TP на обучающем отрезке окна и торговля лучшей
+    комбинацией на проверочном. frames - {параметры (json): signal_df} одной стратегии.
+    """
+    train = slice(window["train_from"], window["test_from"])
+    test = slice(window["test_from"], window["test_to"])
+    pairs = [(sl * 100, tp * 100) for sl in sl_grid for tp in tp_grid]
+
+    best = None
+    for params, signal_df in frames.items():
+        swept = sweep_sl_tp(signal_df.iloc[train], pairs, **BACKTEST_SETTINGS)
+        for (stop_loss_pct, take_profit_pct), result in swept.items():
+            if result["total_trades"] < min_trades:
+                continue
+            if best is None or result[metric] > best["train_metric"]:
+                best = {"params": params, "stop_loss": stop_loss_pct / 100,
+                        "take_profit": take_profit_pct / 100, "train_metric": result[metric]}
+
+    row = {key: window[key] for key in ("window_no", "train_start", "test_start", "test_end")}
+    if best is None:
+        # На обучении ни одна комбинация не набрала min_trades - на проверке не торгуем
+        return {**row, "params": None, "stop_loss": np.nan, "take_profit": np.nan, "train_metric": np.nan,
+                **_metrics([]), "pnl_pct": [], "exit_time": []}
+
+    test_df = frames[best["params"]].iloc[test]
+    trades = trades_frame(test_df, best["stop_loss"] * 100, best["take_profit"] * 100,
+                          BACKTEST_SETTINGS["trade_size"], BACKTEST_SETTINGS["commission_pct"],
+                          BACKTEST_SETTINGS["slippage_pct"])
+    return {**row, **best, **_metrics(trades["pnl_pct"]),
+            "pnl_pct": trades["pnl_pct"].tolist(),
+            "exit_time": test_df.index[trades["exit_idx"].to_numpy()].tolist()}
+
+
+def _metrics(pnl_pct) -> dict:
+    """Метрики backtest_strategy по ряду PnL сделок (без служебных полей пустого результата)."""
+    result = trade_metrics(pd.DataFrame({"pnl_pct": pd.Series(pnl_pct, dtype=np.float64)}),
+                           BACKTEST_SETTINGS["initial_balance"])
+    return {key: result[key] for key in METRICS}
+
+
+def _evaluate_in_worker(task):
+    """
+    Выполняется в воркере. Исключения не пробрасываются наружу,
+    чтобы ошибка одного окна не останавливала расчёт.
+    """
+    strategy, window, sl_grid, tp_grid, metric, min_trades = task
+    try:
+        row = evaluate_window(_FRAMES[strategy], window, sl_grid, tp_grid, metric, min_trades)
+        return {"status": "ok", "strategy": strategy, "row": row}
+    except Exception:
+        return {"status": "error", "strategy": strategy, "window_no": window["window_no"],
+                "error": traceback.format_exc()}
+
+
+def run_walk_forward(frames: dict, windows: list, sl_grid: list, tp_grid: list,
+                     metric: str, min_trades: int, workers: int) -> pd.DataFrame:
+    """Строки по окнам всех стратегий (метрики проверочного отрезка и сделки)."""
+    tasks = [(strategy, window, sl_grid, tp_grid, metric, min_trades)
+             for strategy in frames for window in windows]
+    if workers > 1 and len(tasks) > 1:
+        with multiprocessing.Pool(processes=min(workers, len(tasks)),
+                                  initializer=_init_worker, initargs=(frames,)) as pool:
+            results = pool.map(_evaluate_in_worker, tasks)
+    else:
+        _init_worker(frames)
+        results = [_evaluate_in_worker(task) for task in tasks]
+
+    rows = []
+    for result in results:
+        if result["status"] != "ok":
+            print(f"[ERROR] {result['strategy']} окно {result['window_no']}: ошибка\n{result['error']}")
+            continue
+        rows.append({"strategy": result["strategy"], **result["row"]})
+    return pd.DataFrame(rows)
+
+
+# ============================================================
+# 4. Склейка вне выборки
+# ============================================================
+def stitch(windows: pd.DataFrame) -> tuple:
+    """
+    Сделки проверочных отрезков одной стратегии по порядку окон ->
+    (кривая капитала по времени выхода из сделок, метрики по всем сделкам вне выборки).
+    """
+    windows = windows.sort_values("window_no")
+    pnl = pd.Series([p for trades in windows["pnl_pct"] for p in trades], dtype=np.float64)
+    exit_time = [t for times in windows["exit_time"] for t in times]
+
+    initial_balance = BACKTEST_SETTINGS["initial_balance"]
+    equity = pd.Series(np.multiply.accumulate(np.concatenate(([initial_balance], 1 + pnl.to_numpy() / 100.0)))[1:],
+                       index=pd.DatetimeIndex(exit_time, name="timestamp"), name="equity")
+    return equity, _metrics(pnl)
+
+
+def report(strategy: str, windows: pd.DataFrame, summary: dict, metric: str) -> str:
+    columns = ["window_no", "test_start", "test_end", "params", "stop_loss", "take_profit",
+               "train_metric"] + METRICS
+    print(f"----------------{strategy} (walk-forward)-----------------")
+    print(windows[columns].to_string(index=False))
+    print("вне выборки: " + ", ".join(f"{key}: {summary[key]}" for key in METRICS))
+
+    return (
+        f"📊 *{strategy}* - walk-forward\n\n"
+        f"🪟 *Окон:* `{len(windows)}`, подбор по `{metric}`\n"
+        f"💰 *Доходность вне выборки:* `{summary['total_return']:.2f}%`\n"
+        f"🎯 *Win-rate:* `{summary['win_rate']:.1f}%`\n"
+        f"🔄 *Всего сделок:* `{summary['total_trades']}`\n"
+        f"⚖️ *Коэффициент Шарпа:* `{summary['sharpe_ratio']:.3f}`\n"
+        f"📉 *Макс. просадка:* `{summary['max_drawdown']:.2f}%`"
+    )
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description="Walk-forward проверка стратегий")
+    parser.add_argument("--strategies", nargs="*", default=None, help="имена стратегий (по умолчанию - все)")
+    parser.add_argument("--train-days", type=int, default=WF_TRAIN_DAYS)
+    parser.add_argument("--test-days", type=int, default=WF_TEST_DAYS)
+    parser.add_argument("--metric", default="sharpe_ratio", choices=METRICS)
+    parser.add_argument("--min-trades", type=int, default=5, help="минимум сделок на обучении для выбора комбинации")
+    parser.add_argument("--sl", type=_float_list, default=SL_GRID, help="сетка стоп-лосса, доли через запятую")
+    parser.add_argument("--tp", type=_float_list, default=TP_GRID, help="сетка тейк-профита, доли через запятую")
+    parser.add_argument("--workers", type=int, default=OPTIMIZER_WORKERS)
+    parser.add_argument("--no-save", action="store_true", help="не записывать результаты в БД")
+    parser.add_argument("--no-notify", action="store_true", help="не отправлять сводку в Telegram")
+    args = parser.parse_args(argv)
+
+    strategies = select_strategies(args.strategies)
+    data = assert_float_ohlcv(fetch_market_data(TABLE_MD, SYMBOL, TIMEFRAME), TABLE_MD)
+    windows = make_windows(data.index, args.train_days, args.test_days)
+    if not windows:
+        raise SystemExit(f"История короче {args.train_days} дней обучения - окон нет")
+    print(f"Стратегий: {len(strategies)}, окон: {len(windows)} "
+          f"({args.train_days} + {args.test_days} дней), баров: {len(data)}")
+
+    started = time.perf_counter()
+    frames = precompute_signals(strategies, data)
+    print(f"[TIME] Сигналы {sum(len(f) for f in frames.values())} комбинаций за {time.perf_counter() - started:.1f} с")
+
+    started = time.perf_counter()
+    results = run_walk_forward(frames, windows, args.sl, args.tp, args.metric, args.min_trades, args.workers)
+    print(f"[TIME] Окна за {time.perf_counter() - started:.1f} с")
+
+    run_at = pd.Timestamp.now(tz="UTC")
+    equity_frames = []
+    for strategy, group in results.groupby("strategy", sort=True):
+        equity, summary = stitch(group)
+        message = report(strategy, group.sort_values("window_no"), summary, args.metric)
+        if not args.no_notify:
+            NOTIFIER.notify(message)
+        equity_frames.append(equity.reset_index().assign(strategy=strategy))
+
+    if not args.no_save and not results.empty:
+        windows_df = results.drop(columns=["pnl_pct", "exit_time"]).assign(
+            run_at=run_at, metric=args.metric, train_days=args.train_days, test_days=args.test_days)
+        print(f"Сохранено окон в {SIGNAL_SCHEMA}.{WINDOWS_TABLE}: {save_results(windows_df, WINDOWS_TABLE)}")
+        equity_df = pd.concat(equity_frames, ignore_index=True).assign(run_at=run_at)
+        if not equity_df.empty:
+            print(f"Сохранено точек в {SIGNAL_SCHEMA}.{EQUITY_TABLE}: {save_results(equity_df, EQUITY_TABLE)}")
+
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    finally:
+        NOTIFIER.close()
+        dispose()